@@ -1,7 +1,142 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from unittest import mock
+
+from django.core.files import File
+from django.test import TestCase, RequestFactory, SimpleTestCase
+
+from admin.views import DocsUploadFile
+from utils.fastdfs import fdfs, storage as fdfs_storage
+from utils.fastdfs.storage import LocalStandInStorage, FastDFSStorage
 
 # Create your tests here.
 l='12                                             34'
 a=l.replace(' ','')
 print(l)
-print(a)
\ No newline at end of file
+print(a)
+
+
+class _Superuser(object):
+    is_authenticated = True
+
+    def has_perms(self, perms):
+        return True
+
+
+class _ChunkOnlyReader(io.BufferedReader):
+    """
+    只允许按块读取,整个文件读入内存时测试失败
+    """
+    def read(self, size=-1):
+        if size is None or size < 0:
+            raise AssertionError('上传文件被整个读入内存')
+        return super(_ChunkOnlyReader, self).read(size)
+
+
+class StreamingUploadTest(SimpleTestCase):
+    """
+    70MB的文档上传过程中,视图占用的内存不超过MEMORY_CEILING
+    """
+    FILE_SIZE = 70 * 1024 * 1024
+    MEMORY_CEILING = 10 * 1024 * 1024
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.pdf')
+        with os.fdopen(fd, 'wb') as f:
+            block = b'\0' * 1024 * 1024
+            for _ in range(self.FILE_SIZE // len(block)):
+                f.write(block)
+        self.storage_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.unlink(self.path)
+        shutil.rmtree(self.storage_dir)
+
+    def post(self):
+        with open(self.path, 'rb') as f:
+            request = RequestFactory().post('/admin/docs/files/', {'text_file': f})
+        request.user = _Superuser()
+        return request
+
+    def fastdfs_storage(self):
+        """
+        Fdfs_client换成mock,upload_by_filename记录收到的文件路径和大小
+        """
+        self.uploaded = []
+
+        def upload_by_filename(path):
+            self.uploaded.append((path, os.path.getsize(path)))
+            return {'Status': 'Upload successed.', 'Remote file_id': 'group1/M00/00/00/doc.pdf'}
+
+        client = mock.Mock()
+        client.upload_by_filename.side_effect = upload_by_filename
+        for patcher in (mock.patch.object(fdfs_storage, 'Fdfs_client', return_value=client),
+                        mock.patch.dict(fdfs_storage._clients, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return client, FastDFSStorage(conf_path='client.conf', base_url='http://testserver/', retries=0)
+
+    def test_upload_70mb_under_memory_ceiling(self):
+        storage = LocalStandInStorage(location=self.storage_dir, base_url='http://testserver/media/uploads/')
+        request = self.post()
+
+        with mock.patch.object(fdfs, 'upload_storage', storage):
+            tracemalloc.start()
+            try:
+                response = DocsUploadFile.as_view()(request)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(response.status_code, 200)
+        text_url = json.loads(response.content.decode('utf8'))['data']['text_file']
+        name = text_url[len(storage.base_url):]
+        self.assertEqual(storage.size(name), self.FILE_SIZE)
+        self.assertLess(peak, self.MEMORY_CEILING)
+
+    def test_fastdfs_upload_70mb_under_memory_ceiling(self):
+        # 大文件由django写入临时文件,FastDFSStorage按文件路径上传,FastDFS客户端按块发送
+        client, storage = self.fastdfs_storage()
+        request = self.post()
+
+        with mock.patch.object(fdfs, 'upload_storage', storage):
+            tracemalloc.start()
+            try:
+                response = DocsUploadFile.as_view()(request)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf8'))['data']['text_file'],
+                         'http://testserver/group1/M00/00/00/doc.pdf')
+        self.assertEqual([size for _, size in self.uploaded], [self.FILE_SIZE])
+        self.assertTrue(self.uploaded[0][0].endswith('.pdf'))
+        client.upload_by_buffer.assert_not_called()
+        self.assertLess(peak, self.MEMORY_CEILING)
+
+    def test_fastdfs_save_writes_chunks_to_temp_file(self):
+        # 没有临时文件路径的上传按chunks()写入带扩展名的临时文件,不整个读入内存
+        client, storage = self.fastdfs_storage()
+        raw = open(self.path, 'rb', buffering=0)
+        self.addCleanup(raw.close)
+        content = File(_ChunkOnlyReader(raw), name='doc.pdf')
+
+        tracemalloc.start()
+        try:
+            name = storage.save('doc.pdf', content)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(name, 'group1/M00/00/00/doc.pdf')
+        tmp_path, size = self.uploaded[0]
+        self.assertEqual(size, self.FILE_SIZE)
+        self.assertTrue(tmp_path.endswith('.pdf'))
+        self.assertFalse(os.path.exists(tmp_path))
+        client.upload_by_buffer.assert_not_called()
+        self.assertLess(peak, self.MEMORY_CEILING)
@@ -10,7 +10,6 @@ from django.db.models import Count
 from django.http import Http404, JsonResponse
 from django.shortcuts import render
 from django.views import View
-from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.models import Group, Permission
 
@@ -20,12 +19,13 @@ from admin import constants
 from admin import forms
 from admin.forms import CoursesPubForm
 from course.models import Course, Teacher, CourseCategory
-from news import models
+from news import models, feed, page_cache, trending, visitors, suggest, image_variants, search_fallback
 from utils.json_fun import to_json_data
 from utils.res_code import Code, error_map
 from scripts import paginator_script
-from utils.fastdfs.fdfs import FDFS_Client
+from utils.fastdfs import fdfs
 from utils.secrets import qiniu_secret_info
+from doc import file_cache
 from doc.models import Doc
 from users.models import Users
 
@@ -39,7 +39,19 @@ class IndexView(LoginRequiredMixin, View):
     """
 
     def get(self, request):
-        return render(request, 'admin/index/index.html')
+        # 关键字搜索由结果缓存、elasticsearch、mysql全文索引各返回了多少次，mysql次数多说明elasticsearch熔断过
+        try:
+            search_paths = search_fallback.served_by()
+        except Exception as e:
+            logger.error('读取搜索路径统计异常:\n{}'.format(e))
+            search_paths = []
+        # 上传文件按内容去重累计节省的FastDFS空间
+        try:
+            saved_bytes = fdfs.saved_bytes()
+        except Exception as e:
+            logger.error('读取上传去重统计异常:\n{}'.format(e))
+            saved_bytes = None
+        return render(request, 'admin/index/index.html', locals())
 
 
 class TagsManageView(PermissionRequiredMixin, View):
@@ -106,6 +118,8 @@ class TagEditView(PermissionRequiredMixin, View):
                 if not models.Tag.objects.only('id').filter(name=tag_name).first():
                     tag.name = tag_name
                     tag.save(update_fields=['name'])
+                    feed.refresh_tag(tag.id)
+                    page_cache.bump_generation()
                     return to_json_data(errmsg='标签更新成功!')
                 else:
                     return to_json_data(errno=Code.DATAEXIST, errmsg='标签名已存在!')
@@ -154,6 +168,8 @@ class HotNewsEditView(PermissionRequiredMixin, View):
         if hotnews_id:
             hotnews.is_delete = True
             hotnews.save(update_fields=['is_delete'])
+            page_cache.bump_generation()
+            trending.refresh()
             return to_json_data(errmsg='热门文章删除成功!')
         else:
             return to_json_data(errno=Code.PARAMERR, errmsg='需要删除的热门文章不存在!')
@@ -181,6 +197,8 @@ class HotNewsEditView(PermissionRequiredMixin, View):
 
         hotnews.priority = priority
         hotnews.save(update_fields=['priority'])
+        page_cache.bump_generation()
+        trending.refresh()
         return to_json_data(errmsg='优先级修改成功!')
 
 
@@ -227,6 +245,8 @@ class HotNewsAddView(PermissionRequiredMixin, View):
         hotnews, is_create = hotnews_tuple
         hotnews.priority = priority
         hotnews.save(update_fields=['priority'])
+        page_cache.bump_generation()
+        trending.refresh()
         return to_json_data(errmsg='热门文章创建成功')
 
 
@@ -305,6 +325,18 @@ class NewsManageView(PermissionRequiredMixin, View):
             logger.info('用户访问页数大于总页数')
             news_info = paginator.page(paginator.num_pages)
 
+        # 当前页文章的近似独立访客数(HyperLogLog)
+        news_ids = [n.id for n in news_info]
+        try:
+            uv_today = visitors.unique_visitors(news_ids)
+            uv_week = visitors.unique_visitors(news_ids, days=7)
+        except Exception as e:
+            logger.error('读取独立访客数异常:{}'.format(e))
+            uv_today = uv_week = {}
+        for n in news_info:
+            n.uv_today = uv_today.get(n.id, '-')
+            n.uv_week = uv_week.get(n.id, '-')
+
         paginator_data = paginator_script.get_paginator_data(paginator, news_info)
         start_time = start_time.strftime('%Y/%m/%d') if start_time else ''
         end_time = end_time.strftime('%Y/%m/%d') if end_time else ''
@@ -363,6 +395,11 @@ class NewsEditView(PermissionRequiredMixin, View):
         if news:
             news.is_delete = True
             news.save(update_fields=['is_delete'])
+            feed.remove_news(news.id)
+            suggest.remove('news', news.id)
+            page_cache.bump_generation()
+            # 已发布的热门排行中可能有这篇文章
+            trending.refresh()
             return to_json_data(errmsg="文章删除成功")
         else:
             return to_json_data(errno=Code.PARAMERR, errmsg="需要删除的文章不存在")
@@ -389,6 +426,10 @@ class NewsEditView(PermissionRequiredMixin, View):
             news.image_url = form.cleaned_data.get('image_url')
             news.tag = form.cleaned_data.get('tag')
             news.save()
+            feed.add_news(news)
+            suggest.add_news(news)
+            image_variants.enqueue(news.image_url)
+            page_cache.bump_generation()
             return to_json_data(errmsg='文章更新成功')
         else:
             # 定义一个错误信息列表
@@ -423,6 +464,10 @@ class NewsPubView(PermissionRequiredMixin, View):
             news_instance = form.save(commit=False)
             news_instance.author_id = request.user.id
             news_instance.save()
+            feed.add_news(news_instance)
+            suggest.add_news(news_instance)
+            image_variants.enqueue(news_instance.image_url)
+            page_cache.bump_generation()
             return to_json_data(errmsg='文章发布成功')
         else:
             # 定义一个错误信息列表
@@ -441,11 +486,9 @@ class NewsUploadImage(PermissionRequiredMixin, View):
     1.获取前端发送的文件
     2.判断是否有文件，是否为指定类型
     3.异常处理：取出图片扩展名，不存在指定为jpg
-    4.异常处理：以二进制上传文件，指定上传文件类型
-    5.否则：判断文件是否上传成功
-    （1）上传响应属性Status不为Upload successed.则为上传失败
-    （2）上传成功：取出文件名，与FASTDFS指定域名进行拼接
-    （3）返回前端文件url
+    4.异常处理：通过upload_storage按块保存，指定上传文件类型，上传失败时抛出异常
+    5.返回前端文件url，内容重复时返回已有的url，saved_bytes为节省的字节数
+    6.加入缩略图队列，由generate_image_variants命令在后台生成
     """
     permission_required = ('news.add_news',)
 
@@ -463,19 +506,12 @@ class NewsUploadImage(PermissionRequiredMixin, View):
             image_ext_name = 'jpg'
 
         try:
-            upload_res = FDFS_Client.upload_by_buffer(image_file.read(), file_ext_name=image_ext_name)
+            image_url, saved_bytes = fdfs.upload_file(image_file, image_ext_name)
         except Exception as e:
             logger.error('图片上传出现异常:{}'.format(e))
             return to_json_data(errno=Code.UNKOWNERR, errmsg='图片上传异常')
-        else:
-            if upload_res.get('Status') != 'Upload successed.':
-                logger.info('图片上传到FastDFS服务器失败')
-                return to_json_data(Code.UNKOWNERR, errmsg='图片上传到服务器失败')
-
-            else:
-                image_name = upload_res.get('Remote file_id')
-                image_url = settings.FASTDFS_SERVER_DOMAIN + image_name
-                return to_json_data(data={'image_url': image_url}, errmsg='图片上传成功')
+        image_variants.enqueue(image_url)
+        return to_json_data(data={'image_url': image_url, 'saved_bytes': saved_bytes}, errmsg='图片上传成功')
 
 
 class UploadToken(View):
@@ -511,19 +547,12 @@ class MarkDownUploadImage(View):
             image_ext_name = 'jpg'
 
         try:
-            upload_res = FDFS_Client.upload_by_buffer(image_file.read(), file_ext_name=image_ext_name)
+            image_url, saved_bytes = fdfs.upload_file(image_file, image_ext_name)
         except Exception as e:
             logger.error('图片上传出现异常:{}'.format(e))
             return JsonResponse({'success': 0, 'message': '图片上传异常'})
-        else:
-            if upload_res.get('Status') != 'Upload successed.':
-                logger.info('图片上传到FastDFS服务器失败')
-                return JsonResponse({'success': 0, 'message': '图片上传服务器失败'})
-
-            else:
-                image_name = upload_res.get('Remote file_id')
-                image_url = settings.FASTDFS_SERVER_DOMAIN + image_name
-                return JsonResponse({'success': 1, 'message': '图片上传成功', 'url': image_url})
+        image_variants.enqueue(image_url)
+        return JsonResponse({'success': 1, 'message': '图片上传成功', 'url': image_url, 'saved_bytes': saved_bytes})
 
 
 class BannerManageView(PermissionRequiredMixin, View):
@@ -545,6 +574,7 @@ class BannerEditView(PermissionRequiredMixin, View):
         if banner:
             banner.is_delete = True
             banner.save(update_fields=['is_delete'])
+            page_cache.bump_generation()
             return to_json_data(errmsg='轮播图删除成功')
 
         else:
@@ -576,6 +606,8 @@ class BannerEditView(PermissionRequiredMixin, View):
         banner.image_url = image_url
         banner.priority = priority
         banner.save(update_fields=['image_url', 'priority'])
+        image_variants.enqueue(image_url)
+        page_cache.bump_generation()
 
         return to_json_data(errmsg='轮播图更新成功')
 
@@ -628,6 +660,8 @@ class BannerAddView(PermissionRequiredMixin, View):
         banner.image_url = image_url
         banner.priority = priority
         banner.save(update_fields=['image_url', 'priority'])
+        image_variants.enqueue(image_url)
+        page_cache.bump_generation()
         return to_json_data(errmsg='轮播图创建成功')
 
 
@@ -640,6 +674,12 @@ class DocsManageView(PermissionRequiredMixin, View):
 
     def get(self, request):
         docs = Doc.objects.only('title', 'create_time').filter(is_delete=False)
+        # 各节点文档磁盘缓存的命中率
+        try:
+            cache_stats = file_cache.stats()
+        except Exception as e:
+            logger.error('读取文档缓存统计异常:\n{}'.format(e))
+            cache_stats = []
         return render(request, 'admin/doc/docs_manage.html', locals())
 
 
@@ -668,6 +708,7 @@ class DocsEditView(PermissionRequiredMixin, View):
         if doc:
             doc.is_delete = True
             doc.save(update_fields=['is_delete'])
+            suggest.remove('doc', doc.id)
             return to_json_data(errmsg="文档删除成功")
         else:
             return to_json_data(errno=Code.PARAMERR, errmsg="需要删除的文档不存在")
@@ -690,6 +731,8 @@ class DocsEditView(PermissionRequiredMixin, View):
             doc.file_url = form.cleaned_data.get('file_url')
             doc.image_url = form.cleaned_data.get('image_url')
             doc.save()
+            suggest.add_doc(doc)
+            image_variants.enqueue(doc.image_url)
             return to_json_data(errmsg='文档更新成功')
         else:
             # 定义一个错误信息列表
@@ -724,6 +767,8 @@ class DocsPubView(PermissionRequiredMixin, View):
             docs_instance = form.save(commit=False)
             docs_instance.author_id = request.user.id
             docs_instance.save()
+            suggest.add_doc(docs_instance)
+            image_variants.enqueue(docs_instance.image_url)
             return to_json_data(errmsg='文档创建成功')
         else:
             # 定义一个错误信息列表
@@ -758,18 +803,11 @@ class DocsUploadFile(PermissionRequiredMixin, View):
             text_ext_name = 'pdf'
 
         try:
-            upload_res = FDFS_Client.upload_by_buffer(text_file.read(), file_ext_name=text_ext_name)
+            text_url, saved_bytes = fdfs.upload_file(text_file, text_ext_name)
         except Exception as e:
             logger.error('文件上传出现异常：{}'.format(e))
             return to_json_data(errno=Code.UNKOWNERR, errmsg='文件上传异常')
-        else:
-            if upload_res.get('Status') != 'Upload successed.':
-                logger.info('文件上传到FastDFS服务器失败')
-                return to_json_data(Code.UNKOWNERR, errmsg='文件上传到服务器失败')
-            else:
-                text_name = upload_res.get('Remote file_id')
-                text_url = settings.FASTDFS_SERVER_DOMAIN + text_name
-                return to_json_data(data={'text_file': text_url}, errmsg='文件上传成功')
+        return to_json_data(data={'text_file': text_url, 'saved_bytes': saved_bytes}, errmsg='文件上传成功')
 
 
 class CoursesManageView(PermissionRequiredMixin, View):
@@ -807,6 +845,7 @@ class CoursesEditView(PermissionRequiredMixin, View):
         if course:
             course.is_delete = True
             course.save(update_fields=['is_delete'])
+            suggest.remove('course', course.id)
             return to_json_data(errmsg='课程删除成功')
         else:
             return to_json_data(errno=Code.PARAMERR, errmsg='需要删除的课程不存在')
@@ -825,6 +864,8 @@ class CoursesEditView(PermissionRequiredMixin, View):
             for attr, value in form.cleaned_data.items():
                 setattr(course, attr, value)
             course.save()
+            suggest.add_course(course)
+            image_variants.enqueue(course.cover_url)
             return to_json_data(errmsg='课程更新成功')
         else:
             # 定义一个错误信息列表
@@ -857,6 +898,8 @@ class CoursesPubView(PermissionRequiredMixin, View):
         form = forms.CoursesPubForm(data=dict_data)
         if form.is_valid():
             courses_instance = form.save()
+            suggest.add_course(courses_instance)
+            image_variants.enqueue(courses_instance.cover_url)
             return to_json_data(errmsg='课程发布成功')
 
         else:
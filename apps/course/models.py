@@ -45,6 +45,9 @@ class Course(ModelBase):
         db_table = "tb_course"  # 指明数据库表名
         verbose_name = "课程"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
+        indexes = [
+            models.Index(fields=['is_delete', 'id'], name='idx_course_del_id'),
+        ]
 
     def __str__(self):
         return self.title
\ No newline at end of file
@@ -5,6 +5,7 @@ from django.shortcuts import render
 from django.views import View
 
 from course import models
+from news import image_variants
 
 logger = logging.getLogger('django')
 
@@ -15,6 +16,7 @@ def course_list(request):
     /courses/
     """
     courses = models.Course.objects.only('title', 'cover_url', 'teacher__positional_title').filter(is_delete=False)
+    image_srcsets = image_variants.srcsets(course.cover_url for course in courses)
     cn_page='course'
     return render(request, 'course/course.html', locals())
 
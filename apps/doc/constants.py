@@ -0,0 +1,23 @@
+
+# 可下载的文档类型及对应的Content-Type
+DOC_CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "zip": "application/zip",
+    "doc": "application/msword",
+    "xls": "application/vnd.ms-excel",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "ppt": "application/vnd.ms-powerpoint",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+# 从FastDFS读取文档的超时时间，单位秒
+DOC_UPSTREAM_TIMEOUT = 10
+
+# 转发文档时每次读取的字节数
+DOC_STREAM_BLOCK_SIZE = 64 * 1024
+
+# 文档缓存未命中时等待同组文件锁的最长时间，单位秒，超时后不经过缓存直接转发
+DOC_CACHE_LOCK_TIMEOUT = 5
+
+# 每个uwsgi进程在后台下载文档到缓存的线程数
+DOC_CACHE_FILL_WORKERS = 1
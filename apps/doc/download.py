@@ -0,0 +1,185 @@
+import calendar
+import hashlib
+import logging
+import os
+
+import requests
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+from doc import constants
+
+logger = logging.getLogger('django')
+
+# 转发给FastDFS时复制回客户端的响应头
+UPSTREAM_HEADERS = ('Content-Length', 'Content-Range')
+
+
+def make_etag(doc):
+    '''
+    FastDFS每次上传都生成新的file_id,文件地址不变内容就不变,可以作为强校验的ETag
+    '''
+    return '"{}"'.format(hashlib.md5(doc.file_url.encode('utf8')).hexdigest())
+
+
+def last_modified(doc):
+    return calendar.timegm(doc.update_time.utctimetuple())
+
+
+def get_range(request, etag, modified):
+    '''
+    1.只处理bytes单位的Range,其余忽略
+    2.带If-Range时,只有ETag或Last-Modified与当前一致才分段返回,否则返回完整文件
+    :return: 需要转发的Range头,没有时返回None
+    '''
+    range_header = request.META.get('HTTP_RANGE', '').strip()
+    if not range_header.startswith('bytes='):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            # If-Range只能用强比较
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != modified:
+            return None
+    return range_header
+
+
+def is_multi_range(range_header):
+    return bool(range_header) and ',' in range_header
+
+
+def set_validators(res, etag, modified):
+    res['ETag'] = etag
+    res['Last-Modified'] = http_date(modified)
+    res['Accept-Ranges'] = 'bytes'
+
+
+def accel_response(accel_url, content_type, range_header):
+    '''
+    响应体为空,nginx转到内部location后从FastDFS读取文件,保留这里设置的Content-Type和Content-Disposition
+    需要转发的Range放在X-Accel-Range中,由nginx的internal location设置到请求头
+    '''
+    res = HttpResponse(content_type=content_type)
+    res['X-Accel-Redirect'] = accel_url
+    if range_header:
+        res['X-Accel-Range'] = range_header
+    return res
+
+
+def stream_response(doc_url, content_type, range_header):
+    '''
+    由django从FastDFS流式转发
+    1.Range原样转发,FastDFS返回206或416时复制状态码和Content-Range
+    2.多段请求的Content-Type为multipart/byteranges,带有分隔符,使用FastDFS返回的值
+    '''
+    headers = {'Accept-Encoding': 'identity'}
+    if range_header:
+        headers['Range'] = range_header
+    upstream = requests.get(doc_url, headers=headers, stream=True, timeout=constants.DOC_UPSTREAM_TIMEOUT)
+    if upstream.status_code == 416:
+        upstream.close()
+        res = HttpResponse(status=416)
+        if 'Content-Range' in upstream.headers:
+            res['Content-Range'] = upstream.headers['Content-Range']
+        return res
+    upstream.raise_for_status()
+    res = FileResponse(upstream.raw, status=upstream.status_code)
+    res.block_size = constants.DOC_STREAM_BLOCK_SIZE
+    if upstream.status_code == 206 and is_multi_range(range_header):
+        res['Content-Type'] = upstream.headers.get('Content-Type', content_type)
+    else:
+        res['Content-Type'] = content_type
+    for header in UPSTREAM_HEADERS:
+        if header in upstream.headers:
+            res[header] = upstream.headers[header]
+    return res
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(range_header, size):
+    '''
+    只解析单段Range,格式不对时忽略,按完整文件返回
+    :return: (开始, 结束)闭区间,没有有效Range时返回None
+    :raise RangeNotSatisfiable: 开始位置超出文件大小
+    '''
+    start, sep, end = range_header[len('bytes='):].strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not start:
+            # bytes=-500 表示最后500字节
+            length = int(end)
+            if length <= 0 or not size:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start > end and end == size - 1:
+        raise RangeNotSatisfiable
+    if start > end:
+        return None
+    return start, end
+
+
+class RangeFile(object):
+    '''
+    只读出文件中[start, end]的部分,供FileResponse分块读取
+    '''
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self.f = f
+        self.remaining = end - start + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+def cached_response(f, content_type, range_header):
+    '''
+    读取本机缓存的文件
+    1.完整文件交给FileResponse,uwsgi通过wsgi.file_wrapper用sendfile发送
+    2.单段Range返回206,超出文件大小时返回416
+    '''
+    size = os.fstat(f.fileno()).st_size
+    try:
+        byte_range = parse_range(range_header, size) if range_header else None
+    except RangeNotSatisfiable:
+        f.close()
+        res = HttpResponse(status=416)
+        res['Content-Range'] = 'bytes */{}'.format(size)
+        return res
+    if byte_range is None:
+        res = FileResponse(f)
+        res['Content-Length'] = size
+    else:
+        start, end = byte_range
+        res = FileResponse(RangeFile(f, start, end), status=206)
+        res['Content-Length'] = end - start + 1
+        res['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    res.block_size = constants.DOC_STREAM_BLOCK_SIZE
+    res['Content-Type'] = content_type
+    return res
+
+
+def get_accel_url(doc_url):
+    '''
+    :return: nginx内部location下的路径，文件不在FastDFS上或未开启时返回None
+    '''
+    if not getattr(settings, 'DOC_DOWNLOAD_ACCEL', False) or not doc_url.startswith(settings.FDFS_URL):
+        return None
+    return settings.DOC_ACCEL_REDIRECT_PREFIX + doc_url[len(settings.FDFS_URL):]
@@ -0,0 +1,170 @@
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from doc import constants
+from utils.disk_cache import DiskCache, LockTimeout
+
+logger = logging.getLogger('django')
+
+# 各节点的命中次数、未命中次数和缓存占用,字段为'主机名:指标'
+STATS_KEY = 'doc_cache_stats'
+NODE = socket.gethostname()
+
+_cache = None
+_executor = None
+# 本进程中正在后台下载的文件,同一文件只排队一次
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+class FileTooLarge(Exception):
+    '''
+    超过DOC_CACHE_MAX_FILE_BYTES的文件不缓存,直接转发
+    '''
+
+
+def get_con():
+    return get_redis_connection(alias='default')
+
+
+def is_enabled():
+    return bool(getattr(settings, 'DOC_CACHE_DIR', None))
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(settings.DOC_CACHE_DIR, settings.DOC_CACHE_MAX_BYTES,
+                           lock_timeout=constants.DOC_CACHE_LOCK_TIMEOUT)
+    return _cache
+
+
+def _fetch(doc_url):
+    upstream = requests.get(doc_url, headers={'Accept-Encoding': 'identity'}, stream=True,
+                            timeout=constants.DOC_UPSTREAM_TIMEOUT)
+    upstream.raise_for_status()
+    if int(upstream.headers.get('Content-Length') or 0) > settings.DOC_CACHE_MAX_FILE_BYTES:
+        upstream.close()
+        raise FileTooLarge(doc_url)
+    return _limited(upstream, doc_url)
+
+
+def _limited(upstream, doc_url):
+    '''
+    没有Content-Length或与实际不符时,边下载边检查大小,超过时中止,临时文件由DiskCache删除
+    '''
+    size = 0
+    for chunk in upstream.iter_content(constants.DOC_STREAM_BLOCK_SIZE):
+        size += len(chunk)
+        if size > settings.DOC_CACHE_MAX_FILE_BYTES:
+            upstream.close()
+            raise FileTooLarge(doc_url)
+        yield chunk
+
+
+def open_doc(doc_url):
+    '''
+    未命中时在当前请求中下载到缓存,用于没有nginx的环境
+    :return: 缓存文件对象,调用方负责关闭
+    :raise LockTimeout: 同组的其他文件下载太久,调用方直接转发
+    '''
+    f, hit = get_cache().open(doc_url, lambda: _fetch(doc_url))
+    _record(hit)
+    return f
+
+
+def lookup(doc_url):
+    '''
+    开启DOC_DOWNLOAD_ACCEL时使用:命中时返回缓存文件,未命中时放到后台线程下载,本次请求仍由nginx从FastDFS读取
+    :return: 缓存文件对象或None
+    '''
+    f = get_cache().lookup(doc_url)
+    _record(f is not None)
+    if f is None:
+        fill_later(doc_url)
+    return f
+
+
+def get_accel_url(f):
+    '''
+    :return: nginx内部location下缓存文件的路径
+    '''
+    relative_path = os.path.relpath(f.name, settings.DOC_CACHE_DIR)
+    return settings.DOC_CACHE_ACCEL_REDIRECT_PREFIX + relative_path
+
+
+def fill_later(doc_url):
+    global _executor
+    with _pending_lock:
+        if doc_url in _pending:
+            return
+        _pending.add(doc_url)
+        if _executor is None:
+            # uwsgi fork之后才创建线程
+            _executor = ThreadPoolExecutor(max_workers=constants.DOC_CACHE_FILL_WORKERS)
+    _executor.submit(_fill, doc_url)
+
+
+def _fill(doc_url):
+    try:
+        f, _ = get_cache().open(doc_url, lambda: _fetch(doc_url))
+        f.close()
+        _record_usage()
+    except (FileTooLarge, LockTimeout):
+        pass
+    except Exception as e:
+        logger.error('后台下载文档到缓存异常:\n{}'.format(e))
+    finally:
+        with _pending_lock:
+            _pending.discard(doc_url)
+
+
+def _record(hit):
+    try:
+        con = get_con()
+        pl = con.pipeline()
+        pl.hincrby(STATS_KEY, '{}:{}'.format(NODE, 'hits' if hit else 'misses'), 1)
+        if not hit:
+            # 未命中时才会写入和淘汰,顺便更新占用情况
+            _set_usage(pl)
+        pl.execute()
+    except Exception as e:
+        logger.error('记录文档缓存统计异常:\n{}'.format(e))
+
+
+def _record_usage():
+    try:
+        pl = get_con().pipeline()
+        _set_usage(pl)
+        pl.execute()
+    except Exception as e:
+        logger.error('记录文档缓存统计异常:\n{}'.format(e))
+
+
+def _set_usage(pl):
+    usage = get_cache().usage
+    if usage:
+        pl.hset(STATS_KEY, '{}:bytes'.format(NODE), usage[0])
+        pl.hset(STATS_KEY, '{}:files'.format(NODE), usage[1])
+
+
+def stats():
+    '''
+    :return: [{'node','hits','misses','hit_ratio','bytes','files'}],hit_ratio为百分比
+    '''
+    nodes = {}
+    for field, value in get_con().hgetall(STATS_KEY).items():
+        node, metric = field.decode('utf8').rsplit(':', 1)
+        nodes.setdefault(node, {'node': node, 'hits': 0, 'misses': 0, 'bytes': 0, 'files': 0})[metric] = int(value)
+    rows = sorted(nodes.values(), key=lambda row: row['node'])
+    for row in rows:
+        total = row['hits'] + row['misses']
+        row['hit_ratio'] = round(row['hits'] * 100 / total, 1) if total else 0
+    return rows
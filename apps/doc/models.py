@@ -17,6 +17,9 @@ class Doc(ModelBase):
         db_table = "tb_docs"  # 指明数据库表名
         verbose_name = "文档"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
+        indexes = [
+            models.Index(fields=['is_delete', 'id'], name='idx_docs_del_id'),
+        ]
 
     def __str__(self):
         return self.title
\ No newline at end of file
@@ -1,12 +1,14 @@
-import requests, logging
+import logging
 
 from django.shortcuts import render
 from django.views import View
-from django.http import Http404, FileResponse
-from django.conf import settings
+from django.http import Http404
+from django.utils.cache import get_conditional_response
 from django.utils.encoding import escape_uri_path
 
+from doc import constants, download, file_cache
 from doc.models import Doc
+from news import image_variants
 
 logger = logging.getLogger('django')
 
@@ -17,6 +19,7 @@ def doc_index(request):
     /docs/
     '''
     docs = Doc.objects.defer('update_time', 'create_time', 'author', 'is_delete').filter(is_delete=False)
+    image_srcsets = image_variants.srcsets(doc.image_url for doc in docs)
     cn_page='doc'
     return render(request, 'doc/docDownload.html', locals())
 
@@ -27,54 +30,71 @@ class DocDownload(View):
     /docs/<int:doc_id>/
     1.获取前端传来的参数，获取到文件下载地址
     2.如果存在，构造下载地址，不存在返回错误信息
-    3.异常处理，记录日志
-    4.处理文档数据类型
-    5.为下载的文件命名
+    3.处理文档数据类型
+    4.按ETag和Last-Modified处理条件请求，未修改时返回304
+    5.配置了DOC_CACHE_DIR时，从本机磁盘缓存读取
+      开启DOC_DOWNLOAD_ACCEL时命中的文件由nginx直接发送，未命中时在后台线程下载到缓存，本次仍走第6步
+      否则未命中时先整个下载到缓存，同组文件锁等待超时则走第7步
+    6.开启DOC_DOWNLOAD_ACCEL且文件在FastDFS上时，返回X-Accel-Redirect由nginx代理下载，不占用uwsgi进程
+    7.否则由django流式转发，Range转发给FastDFS，异常处理，记录日志
+    8.为下载的文件命名
     '''
 
     def get(self, request, doc_id):
-        doc = Doc.objects.only('file_url').filter(is_delete=False, id=doc_id).first()
-        if doc:
-            doc_url = doc.file_url
-            # download_url = settings.SITE_DOMAIN_PORT + doc_url
-            doc_name = doc.title
-            try:
-                # res=FileResponse(open(doc.file_url,'rb'))存在问题!
-                res = FileResponse(requests.get(doc_url,stream=True))
-            except Exception as e:
-                logger.info('获取文档出现异常\n{}'.format(e))
-                raise Http404('文档下载异常')
-            doc_type = doc_url.split('.')[-1]
-            if not doc_type:
-                raise Http404('文档url异常!')
-            else:
-                doc_type = doc_type.lower()
-            if doc_type == "pdf":
-                res["Content-type"] = "application/pdf"
-            elif doc_type == "zip":
-                res["Content-type"] = "application/zip"
-            elif doc_type == "doc":
-                res["Content-type"] = "application/msword"
-            elif doc_type == "xls":
-                res["Content-type"] = "application/vnd.ms-excel"
-            elif doc_type == "docx":
-                res["Content-type"] = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            elif doc_type == "ppt":
-                res["Content-type"] = "application/vnd.ms-powerpoint"
-            elif doc_type == "pptx":
-                res["Content-type"] = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-
-            else:
-                raise Http404('文档格式不正确!')
+        doc = Doc.objects.only('file_url', 'title', 'update_time').filter(is_delete=False, id=doc_id).first()
+        if not doc:
+            raise Http404('文档不存在!')
+        doc_url = doc.file_url
+        doc_type = doc_url.split('.')[-1].lower()
+        if not doc_type:
+            raise Http404('文档url异常!')
+        content_type = constants.DOC_CONTENT_TYPES.get(doc_type)
+        if not content_type:
+            raise Http404('文档格式不正确!')
 
-            # doc_filename=escape_uri_path(doc_url.split('/')[-1])
-            # res["Content-Disposition"]= "attachment; filename*=UTF-8''{}".format(doc_filename)
-            d_url=doc_name+'.'+doc_type
-            down_url=escape_uri_path(d_url)
-            res["Content-Disposition"]= "attachment; filename*=UTF-8''{}".format(down_url)
+        etag = download.make_etag(doc)
+        modified = download.last_modified(doc)
+        res = get_conditional_response(request, etag=etag, last_modified=modified)
+        if res is not None:
+            download.set_validators(res, etag, modified)
             return res
 
-        else:
-            raise Http404('文档不存在!')
-
+        range_header = download.get_range(request, etag, modified)
+        res = None
+        # 多段请求的multipart分隔符由FastDFS生成，不走本机缓存和nginx，改由django转发
+        multi_range = download.is_multi_range(range_header)
+        if file_cache.is_enabled() and not multi_range:
+            if download.get_accel_url(doc_url):
+                try:
+                    f = file_cache.lookup(doc_url)
+                except Exception as e:
+                    logger.error('读取文档缓存异常\n{}'.format(e))
+                    f = None
+                if f:
+                    # Range和If-Range由nginx按这里设置的ETag和Last-Modified处理
+                    res = download.accel_response(file_cache.get_accel_url(f), content_type, None)
+                    f.close()
+            else:
+                try:
+                    res = download.cached_response(file_cache.open_doc(doc_url), content_type, range_header)
+                except (file_cache.FileTooLarge, file_cache.LockTimeout):
+                    pass
+                except Exception as e:
+                    logger.info('获取文档出现异常\n{}'.format(e))
+                    raise Http404('文档下载异常')
+        if res is None:
+            accel_url = download.get_accel_url(doc_url)
+            if accel_url and not multi_range:
+                res = download.accel_response(accel_url, content_type, range_header)
+            else:
+                try:
+                    res = download.stream_response(doc_url, content_type, range_header)
+                except Exception as e:
+                    logger.info('获取文档出现异常\n{}'.format(e))
+                    raise Http404('文档下载异常')
+        download.set_validators(res, etag, modified)
 
+        d_url = doc.title + '.' + doc_type
+        down_url = escape_uri_path(d_url)
+        res["Content-Disposition"] = "attachment; filename*=UTF-8''{}".format(down_url)
+        return res
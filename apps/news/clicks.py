@@ -0,0 +1,80 @@
+import logging
+
+from django.db import connection, transaction
+from django_redis import get_redis_connection
+
+from news import models, trending, visitors
+
+logger = logging.getLogger('django')
+
+PENDING_KEY = 'news_clicks_pending'
+FLUSHING_KEY = 'news_clicks_flushing'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def track_view(request, news_id):
+    '''
+    详情页每次访问只在redis中累加,不写数据库;redis异常时放弃本次计数
+    同时计入热门排行的小时桶和当天的独立访客
+    '''
+    try:
+        pl = get_con().pipeline()
+        pl.hincrby(PENDING_KEY, news_id, 1)
+        trending.record_view(pl, news_id)
+        visitors.record_visit(pl, news_id, visitors.visitor_id(request))
+        pl.execute()
+    except Exception as e:
+        logger.error('点击量计数异常:\n{}'.format(e))
+
+
+def _apply(deltas):
+    '''
+    一条UPDATE ... CASE语句批量累加多篇文章的点击量
+    '''
+    table = connection.ops.quote_name(models.News._meta.db_table)
+    cases = ' '.join(['WHEN %s THEN %s'] * len(deltas))
+    placeholders = ', '.join(['%s'] * len(deltas))
+    sql = 'UPDATE {table} SET clicks = clicks + CASE id {cases} ELSE 0 END WHERE id IN ({ids})'.format(
+        table=table, cases=cases, ids=placeholders)
+    params = []
+    for news_id, delta in deltas:
+        params.extend((news_id, delta))
+    params.extend(news_id for news_id, _ in deltas)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def flush(batch_size=500):
+    '''
+    把redis中累计的点击量增量写回tb_news.clicks
+    1.把待写入的hash改名为flushing,之后的访问计入新的hash,互不影响
+    2.上次写回中途失败时,先处理残留的flushing
+    3.每批在事务中更新数据库,成功后再从flushing中删除这批文章
+    :return: 写回的点击总数
+    '''
+    con = get_con()
+    if not con.exists(FLUSHING_KEY):
+        if not con.exists(PENDING_KEY):
+            return 0
+        con.rename(PENDING_KEY, FLUSHING_KEY)
+    total = 0
+    batch = []
+    for field, value in con.hscan_iter(FLUSHING_KEY, count=batch_size):
+        batch.append((int(field), int(value)))
+        if len(batch) >= batch_size:
+            total += _flush_batch(con, batch)
+            batch = []
+    if batch:
+        total += _flush_batch(con, batch)
+    con.delete(FLUSHING_KEY)
+    return total
+
+
+def _flush_batch(con, batch):
+    with transaction.atomic():
+        _apply(batch)
+    con.hdel(FLUSHING_KEY, *[news_id for news_id, _ in batch])
+    return sum(delta for _, delta in batch)
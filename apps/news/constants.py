@@ -8,6 +8,84 @@ SHOW_BANNER_COUNT = 6
 # 显示热门新闻条数
 SHOW_HOTNEWS_COUNT = 3
 
+# 每页评论数
+PER_PAGE_COMMENTS_COUNT = 10
+
+# 热门排行统计窗口，单位小时
+TRENDING_WINDOW_HOURS = 48
+
+# 热门排行访问量衰减半衰期，单位小时
+TRENDING_HALF_LIFE_HOURS = 6
+
+# 热门排行按分数发布的文章数(不含编辑置顶的热门文章)
+TRENDING_TOP_COUNT = 50
+
+# 每篇文章每天独立访客HyperLogLog的保留天数
+UV_KEEP_DAYS = 30
+
+# 搜索结果缓存时间，单位秒，索引更新后会提前清除
+SEARCH_CACHE_EXPIRES = 10 * 60
+
+# 每个搜索词最多缓存的结果数，超出部分不再翻页
+SEARCH_CACHE_MAX_RESULTS = 500
+
+# elasticsearch在窗口期内连续失败多少次后熔断
+SEARCH_BREAKER_FAILURES = 5
+
+# 统计elasticsearch失败次数的窗口，单位秒
+SEARCH_BREAKER_WINDOW = 60
+
+# 熔断后改用mysql全文索引的时间，单位秒，之后放行一个请求探测elasticsearch是否恢复
+SEARCH_BREAKER_COOLDOWN = 30
+
+# 搜索提示前缀索引中每个标题片段的最大长度
+SUGGEST_FRAGMENT_LENGTH = 20
+
+# 搜索提示每次从前缀索引中取出的片段数
+SUGGEST_SCAN_COUNT = 50
+
+# 搜索提示返回的条数
+SUGGEST_COUNT = 8
+
+# 详情页展示的相关文章数
+RELATED_NEWS_COUNT = 6
+
+# 相关文章的最低余弦相似度，低于它的不展示
+RELATED_NEWS_MIN_SCORE = 0.1
+
+# 计算相关文章时每批做矩阵乘法的文章数
+RELATED_NEWS_BATCH_SIZE = 256
+
+# 新闻列表/轮播图接口响应缓存时间，单位秒
+NEWS_PAGE_CACHE_EXPIRES = 10 * 60
+
+# 上传图片后生成的缩略图宽度，单位像素，覆盖列表225px、热门250px缩略图的1x到4x屏幕
+IMAGE_VARIANT_WIDTHS = (240, 480, 960)
+
+# 缩略图JPEG质量
+IMAGE_VARIANT_JPEG_QUALITY = 82
+
+# 缩略图WebP质量
+IMAGE_VARIANT_WEBP_QUALITY = 80
+
+# 下载原图的超时时间，单位秒
+IMAGE_VARIANT_FETCH_TIMEOUT = 10
+
+# 每批从队列中取出生成缩略图的图片数
+IMAGE_VARIANT_BATCH_SIZE = 20
+
+# 生成缩略图的进程数
+IMAGE_VARIANT_WORKERS = 2
+
+# /img/<宽>x<高>/接口允许的尺寸，单位像素，分别为列表、搜索页和热门新闻缩略图的1x、2x
+IMAGE_RESIZE_SIZES = ((225, 160), (450, 320), (224, 160), (448, 320), (250, 179), (500, 358))
+
+# /img/接口源图片的大小上限，单位字节
+IMAGE_RESIZE_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+# /img/接口缩略图的浏览器缓存时间，单位秒
+IMAGE_RESIZE_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
 
 
 
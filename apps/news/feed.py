@@ -0,0 +1,178 @@
+import json
+import logging
+
+from django_redis import get_redis_connection
+
+from news import models, constants
+from utils.cursor import datetime_to_micros, micros_to_datetime, encode_cursor
+
+logger = logging.getLogger('django')
+
+FEED_ALL_KEY = 'news_feed_all'
+FEED_TAG_KEY = 'news_feed_tag_{}'
+FEED_CARDS_KEY = 'news_feed_cards'
+FEED_NEWS_TAG_KEY = 'news_feed_news_tag'
+FEED_READY_KEY = 'news_feed_ready'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def to_card(news):
+    '''
+    新闻列表卡片数据,/news/接口和feed索引共用
+    '''
+    return {
+        'id': news.id,
+        'title': news.title,
+        'digest': news.digest,
+        'image_url': news.image_url,
+        'tag_name': news.tag.name,
+        'author': news.author.username,
+        'update_time': news.update_time.strftime('%Y年%m月%d日 %H:%M')
+    }
+
+
+def _member(news_id):
+    # 补零后,相同score的成员按字典序倒排即为按id倒排
+    return '{:010d}'.format(news_id)
+
+
+def _index(pl, news, old_tag_id=None):
+    member = _member(news.id)
+    score = datetime_to_micros(news.update_time)
+    if old_tag_id and old_tag_id != news.tag_id:
+        pl.zrem(FEED_TAG_KEY.format(old_tag_id), member)
+    pl.zadd(FEED_ALL_KEY, {member: score})
+    if news.tag_id:
+        pl.zadd(FEED_TAG_KEY.format(news.tag_id), {member: score})
+        pl.hset(FEED_NEWS_TAG_KEY, news.id, news.tag_id)
+    pl.hset(FEED_CARDS_KEY, news.id, json.dumps(to_card(news)))
+
+
+def add_news(news):
+    '''
+    发布或更新文章后写入feed索引,redis异常只记录日志,不影响发布
+    '''
+    try:
+        con = get_con()
+        old_tag_id = con.hget(FEED_NEWS_TAG_KEY, news.id)
+        pl = con.pipeline()
+        _index(pl, news, int(old_tag_id) if old_tag_id else None)
+        pl.execute()
+    except Exception as e:
+        logger.error('feed索引写入异常:\n{}'.format(e))
+
+
+def remove_news(news_id):
+    try:
+        con = get_con()
+        member = _member(news_id)
+        tag_id = con.hget(FEED_NEWS_TAG_KEY, news_id)
+        pl = con.pipeline()
+        pl.zrem(FEED_ALL_KEY, member)
+        if tag_id:
+            pl.zrem(FEED_TAG_KEY.format(int(tag_id)), member)
+        pl.hdel(FEED_NEWS_TAG_KEY, news_id)
+        pl.hdel(FEED_CARDS_KEY, news_id)
+        pl.execute()
+    except Exception as e:
+        logger.error('feed索引删除异常:\n{}'.format(e))
+
+
+def refresh_tag(tag_id):
+    '''
+    标签改名后,重写该标签下文章的卡片数据
+    '''
+    try:
+        pl = get_con().pipeline()
+        for news in _queryset().filter(tag_id=tag_id).iterator():
+            pl.hset(FEED_CARDS_KEY, news.id, json.dumps(to_card(news)))
+        pl.execute()
+    except Exception as e:
+        logger.error('feed索引更新标签异常:\n{}'.format(e))
+
+
+def _queryset():
+    return models.News.objects.select_related('tag', 'author').only(
+        'id', 'title', 'digest', 'image_url', 'update_time', 'tag_id', 'tag__name', 'author__username').filter(
+        is_delete=False)
+
+
+def rebuild(batch_size=500):
+    '''
+    从数据库全量重建feed索引,返回写入的文章数
+    '''
+    con = get_con()
+    keys = [FEED_ALL_KEY, FEED_CARDS_KEY, FEED_NEWS_TAG_KEY, FEED_READY_KEY]
+    keys.extend(con.scan_iter(match=FEED_TAG_KEY.format('*')))
+    con.delete(*keys)
+    count = 0
+    pl = con.pipeline()
+    for news in _queryset().iterator():
+        _index(pl, news)
+        count += 1
+        if count % batch_size == 0:
+            pl.execute()
+    pl.set(FEED_READY_KEY, 1)
+    pl.execute()
+    return count
+
+
+def is_ready():
+    return bool(get_con().exists(FEED_READY_KEY))
+
+
+def _feed_key(con, tag_id):
+    # 与数据库查询保持一致:标签下没有文章时返回全部文章
+    if tag_id:
+        key = FEED_TAG_KEY.format(tag_id)
+        if con.zcard(key):
+            return key
+    return FEED_ALL_KEY
+
+
+def _cards(con, members):
+    if not members:
+        return []
+    cards = con.hmget(FEED_CARDS_KEY, [int(m) for m in members])
+    return [json.loads(c) for c in cards if c]
+
+
+def get_page(tag_id, page):
+    '''
+    :return: (总页数, 当前页卡片列表),页数超出时返回最后一页
+    '''
+    con = get_con()
+    key = _feed_key(con, tag_id)
+    total = con.zcard(key)
+    per_page = constants.PER_PAGE_NEWS_COUNT
+    total_pages = max((total + per_page - 1) // per_page, 1)
+    page = min(max(page, 1), total_pages)
+    start = (page - 1) * per_page
+    members = con.zrevrange(key, start, start + per_page - 1)
+    return total_pages, _cards(con, members)
+
+
+def get_by_cursor(tag_id, cursor):
+    '''
+    :param cursor: decode_cursor的结果(update_time, id)或None
+    :return: (当前页卡片列表, 下一页游标)
+    '''
+    con = get_con()
+    key = _feed_key(con, tag_id)
+    count = constants.PER_PAGE_NEWS_COUNT + 1
+    if cursor:
+        score = datetime_to_micros(cursor[0])
+        # 同一时间戳的文章排在最前面,跳过id不小于游标的部分
+        skip = sum(1 for m in con.zrevrangebyscore(key, score, score) if int(m) >= cursor[1])
+        items = con.zrevrangebyscore(key, score, '-inf', start=skip, num=count, withscores=True)
+    else:
+        items = con.zrevrange(key, 0, count - 1, withscores=True)
+    next_cursor = None
+    if len(items) == count:
+        items = items[:-1]
+        member, score = items[-1]
+        next_cursor = encode_cursor(micros_to_datetime(int(score)), int(member))
+    return _cards(con, [m for m, _ in items]), next_cursor
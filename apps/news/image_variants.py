@@ -0,0 +1,142 @@
+import json
+import logging
+from collections import OrderedDict
+from io import BytesIO
+
+import requests
+from django.core.files.base import ContentFile
+from django_redis import get_redis_connection
+
+from course.models import Course
+from doc.models import Doc
+from news import models, constants, page_cache
+from news.search_queue import MOVE_BATCH_SCRIPT
+from utils.fastdfs.storage import upload_storage
+from utils.images import make_variants
+
+logger = logging.getLogger('django')
+
+# 原图url -> {'width': 原图宽度, 'variants': [{'width', 'jpeg', 'webp'}]},没有生成缩略图的动图variants为空
+VARIANTS_KEY = 'image_variants'
+# 等待生成缩略图的原图url
+QUEUE_KEY = 'image_variant_queue'
+# 正在生成的一批url,写入结果后才删除,命令中途退出时下次启动先重新处理这一批
+PROCESSING_KEY = 'image_variant_processing'
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def enqueue(url):
+    '''
+    上传和保存图片地址后调用,由generate_image_variants命令在后台生成,请求不等待
+    已生成的url在process()中跳过,重复加入只多一次HMGET
+    '''
+    if not url:
+        return
+    try:
+        get_con().rpush(QUEUE_KEY, url)
+    except Exception as e:
+        logger.error('加入缩略图队列异常:\n{}'.format(e))
+
+
+def enqueue_all():
+    '''
+    把新闻、轮播图、文档和课程封面中还没有缩略图的图片加入队列
+    :return: 加入队列的图片数
+    '''
+    urls = set()
+    for model, field in ((models.News, 'image_url'), (models.Banner, 'image_url'),
+                         (Doc, 'image_url'), (Course, 'cover_url')):
+        urls.update(model.objects.filter(is_delete=False).exclude(**{field: ''}).values_list(field, flat=True))
+    con = get_con()
+    done = set(url.decode('utf8') for url in con.hkeys(VARIANTS_KEY))
+    urls = sorted(urls - done)
+    if urls:
+        con.rpush(QUEUE_KEY, *urls)
+    return len(urls)
+
+
+def _srcset(variants, fmt):
+    return ', '.join('{} {}w'.format(v[fmt], v['width']) for v in variants)
+
+
+def srcsets(urls):
+    '''
+    一次HMGET取出多张图片的缩略图
+    :return: {原图url: {'jpeg': srcset, 'webp': srcset}},只包含已生成的图片,redis异常时返回空字典
+    '''
+    urls = [url for url in OrderedDict.fromkeys(urls) if url]
+    if not urls:
+        return {}
+    try:
+        values = get_con().hmget(VARIANTS_KEY, urls)
+    except Exception as e:
+        logger.error('读取缩略图异常:\n{}'.format(e))
+        return {}
+    result = {}
+    for url, value in zip(urls, values):
+        variants = json.loads(value.decode('utf8'))['variants'] if value else None
+        if variants:
+            result[url] = {fmt: _srcset(variants, fmt) for fmt in EXTENSIONS}
+    return result
+
+
+def attach(cards):
+    '''
+    给/news/和/news/banners/接口的数据加上image_srcset,没有缩略图时为None,前端直接使用image_url
+    '''
+    image_srcsets = srcsets(card['image_url'] for card in cards)
+    for card in cards:
+        card['image_srcset'] = image_srcsets.get(card['image_url'])
+    return cards
+
+
+def generate(url):
+    '''
+    在进程池中执行:下载原图,生成缩略图后通过upload_storage保存
+    :return: (原图url, 写入VARIANTS_KEY的数据),失败时数据为None,不写入,以后可以重新加入队列
+    '''
+    try:
+        res = requests.get(url, timeout=constants.IMAGE_VARIANT_FETCH_TIMEOUT)
+        res.raise_for_status()
+        width, images = make_variants(BytesIO(res.content), constants.IMAGE_VARIANT_WIDTHS,
+                                      jpeg_quality=constants.IMAGE_VARIANT_JPEG_QUALITY,
+                                      webp_quality=constants.IMAGE_VARIANT_WEBP_QUALITY)
+        variants = OrderedDict()
+        for variant_width, fmt, data in images:
+            name = upload_storage.save('variant.{}'.format(EXTENSIONS[fmt]), ContentFile(data))
+            variants.setdefault(variant_width, {'width': variant_width})[fmt] = upload_storage.url(name)
+    except Exception as e:
+        logger.error('生成缩略图异常{}:\n{}'.format(url, e))
+        return url, None
+    return url, {'width': width, 'variants': list(variants.values())}
+
+
+def process(pool, batch_size):
+    '''
+    1.PROCESSING_KEY中有上次没有处理完的url时先处理这一批,否则原子地把队首一批url移到PROCESSING_KEY
+    2.去掉重复和已生成的,在进程池中并行生成
+    3.写入VARIANTS_KEY后删除PROCESSING_KEY,更新新闻页面缓存版本号,让/news/接口带上新的缩略图
+    生成失败的url记录日志后丢弃,可以用--all重新加入队列
+    :return: (取出的url数, 生成成功数),队列为空时取出数为0
+    '''
+    con = get_con()
+    popped = con.lrange(PROCESSING_KEY, 0, -1)
+    if not popped:
+        popped = con.eval(MOVE_BATCH_SCRIPT, 2, QUEUE_KEY, PROCESSING_KEY, batch_size)
+    urls = list(OrderedDict.fromkeys(url.decode('utf8') for url in popped))
+    if not urls:
+        return 0, 0
+    urls = [url for url, value in zip(urls, con.hmget(VARIANTS_KEY, urls)) if value is None]
+    mapping = {url: json.dumps(data) for url, data in pool.map(generate, urls) if data is not None}
+    pl = con.pipeline()
+    if mapping:
+        pl.hmset(VARIANTS_KEY, mapping)
+    pl.delete(PROCESSING_KEY)
+    pl.execute()
+    if mapping:
+        page_cache.bump_generation()
+    return len(popped), len(mapping)
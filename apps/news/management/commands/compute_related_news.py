@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import related, constants
+
+
+class Command(BaseCommand):
+    help = '按标题、摘要和正文的TF-IDF相似度计算每篇文章的相关文章并发布到redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='忽略上次的结果,全量重新计算')
+        parser.add_argument('--batch-size', type=int, default=constants.RELATED_NEWS_BATCH_SIZE,
+                            help='每批做矩阵乘法的文章数')
+        parser.add_argument('--interval', type=int, default=0, help='循环计算的间隔秒数,为0时只执行一次')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            start = time.time()
+            count = related.compute(full=full, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                '相关文章已更新{}篇,耗时{:.1f}秒'.format(count, time.time() - start)))
+            if not options['interval']:
+                break
+            # 只有第一轮全量计算
+            full = False
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import clicks
+
+
+class Command(BaseCommand):
+    help = '把redis中累计的新闻点击量批量写回数据库'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每条UPDATE语句更新的文章数')
+        parser.add_argument('--interval', type=int, default=0, help='循环写回的间隔秒数,为0时只执行一次')
+
+    def handle(self, *args, **options):
+        while True:
+            total = clicks.flush(batch_size=options['batch_size'])
+            self.stdout.write('写回点击量{}次'.format(total))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+
+from news import image_variants, constants
+
+
+class Command(BaseCommand):
+    help = '从队列中取出上传的图片,在进程池中生成多个宽度的渐进式JPEG和WebP缩略图'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='先把新闻、轮播图、文档和课程封面中还没有缩略图的图片加入队列')
+        parser.add_argument('--workers', type=int, default=constants.IMAGE_VARIANT_WORKERS, help='生成缩略图的进程数')
+        parser.add_argument('--batch-size', type=int, default=constants.IMAGE_VARIANT_BATCH_SIZE,
+                            help='每批从队列中取出的图片数')
+        parser.add_argument('--interval', type=int, default=0, help='队列为空时等待的秒数,为0时处理完队列就退出')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            count = image_variants.enqueue_all()
+            self.stdout.write(self.style.SUCCESS('已加入队列{}张图片'.format(count)))
+        # 子进程只下载、缩放和上传图片,不使用数据库和redis
+        with Pool(options['workers']) as pool:
+            while True:
+                start = time.time()
+                popped, generated = image_variants.process(pool, options['batch_size'])
+                if popped:
+                    self.stdout.write(self.style.SUCCESS(
+                        '取出{}张图片,生成缩略图{}张,耗时{:.1f}秒'.format(popped, generated, time.time() - start)))
+                    continue
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
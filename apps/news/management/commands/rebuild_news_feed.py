@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from news import feed
+
+
+class Command(BaseCommand):
+    help = '从数据库全量重建新闻feed的redis索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批写入redis的文章数')
+
+    def handle(self, *args, **options):
+        count = feed.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('feed索引重建完成,共{}篇文章'.format(count)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from news import suggest
+
+
+class Command(BaseCommand):
+    help = '从数据库全量重建搜索提示的redis前缀索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批写入redis的条目数')
+
+    def handle(self, *args, **options):
+        count = suggest.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('搜索提示索引重建完成,共{}条'.format(count)))
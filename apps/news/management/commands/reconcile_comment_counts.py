@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from news.models import News, Comments
+
+
+class Command(BaseCommand):
+    help = '按批校对News.comment_count与实际未删除评论数,修正偏差'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批校对的文章数')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        checked = fixed = 0
+        while True:
+            # 按主键游标分批,避免一次加载全部文章
+            batch = list(News.objects.filter(id__gt=last_id).order_by('id').values_list(
+                'id', 'comment_count')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            actual = dict(Comments.objects.filter(is_delete=False, news_id__in=[i for i, _ in batch]).values_list(
+                'news_id').annotate(num=Count('id')).order_by())
+            for news_id, comment_count in batch:
+                num = actual.get(news_id, 0)
+                if num != comment_count:
+                    # 带上旧值做条件,期间有新评论写入时跳过,留给下一次校对
+                    fixed += News.objects.filter(id=news_id, comment_count=comment_count).update(comment_count=num)
+            checked += len(batch)
+        self.stdout.write(self.style.SUCCESS('共校对{}篇文章,修正{}篇'.format(checked, fixed)))
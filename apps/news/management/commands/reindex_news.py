@@ -0,0 +1,185 @@
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections as db_connections
+from django.utils import timezone
+from django_redis import get_redis_connection
+from haystack import connections
+
+from news import search_cache
+from news.models import News
+
+# 断点续建状态: 正在构建的索引名、开始时间、分块边界、已完成的分块
+STATE_KEY = 'search_reindex_state'
+CHUNKS_KEY = 'search_reindex_chunks'
+DONE_KEY = 'search_reindex_done'
+
+DOC_TYPE = 'modelresult'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def get_index(using):
+    return connections[using].get_unified_index().get_index(News)
+
+
+def new_backend(using, index_name):
+    '''
+    每个进程单独创建elasticsearch客户端,不与父进程共用连接池
+    '''
+    engine = connections[using]
+    backend = engine.backend(using, **engine.options)
+    backend.index_name = index_name
+    # 索引和mapping已由主进程创建
+    backend.setup_complete = True
+    return backend
+
+
+def index_chunk(args):
+    '''
+    子进程: 按主键区间(lo, hi]取出一块文章并bulk写入新索引
+    :return: (分块右边界, 写入文档数)
+    '''
+    using, index_name, lo, hi = args
+    index = get_index(using)
+    queryset = index.index_queryset(using=using).filter(id__gt=lo).order_by('id')
+    if hi is not None:
+        queryset = queryset.filter(id__lte=hi)
+    objs = list(queryset)
+    if objs:
+        new_backend(using, index_name).update(index, objs, commit=False)
+    get_con().sadd(DONE_KEY, lo)
+    return hi, len(objs)
+
+
+class Command(BaseCommand):
+    help = '多进程分块重建新闻搜索索引,完成后原子切换别名,重建期间搜索不中断'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--using', default='default', help='haystack连接名')
+        parser.add_argument('--workers', type=int, default=4, help='并行写入的进程数')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每块文章数')
+        parser.add_argument('--restart', action='store_true', help='放弃上次未完成的构建,重新开始')
+        parser.add_argument('--keep-old', action='store_true', help='切换后保留旧索引')
+
+    def handle(self, *args, **options):
+        using = options['using']
+        con = get_con()
+        backend = connections[using].get_backend()
+        alias = backend.index_name
+
+        state = con.hgetall(STATE_KEY)
+        if state and options['restart']:
+            self.drop_index(backend, state[b'index'].decode())
+            state = {}
+        if state and backend.conn.indices.exists(index=state[b'index'].decode()):
+            index_name = state[b'index'].decode()
+            started = float(state[b'started'])
+            self.stdout.write('继续构建索引{}'.format(index_name))
+        else:
+            con.delete(STATE_KEY, CHUNKS_KEY, DONE_KEY)
+            started = time.time()
+            index_name = '{}_{}'.format(alias, timezone.now().strftime('%Y%m%d%H%M%S'))
+            self.create_index(backend, using, index_name)
+            self.save_chunks(con, using, options['chunk_size'])
+            con.hmset(STATE_KEY, {'index': index_name, 'started': started})
+            self.stdout.write('新建索引{}'.format(index_name))
+
+        self.build(con, using, index_name, options['workers'])
+        self.catch_up(using, index_name, started)
+        backend.conn.indices.refresh(index=index_name)
+        old_indexes = self.swap_alias(backend, alias, index_name)
+        con.delete(STATE_KEY, CHUNKS_KEY, DONE_KEY)
+        search_cache.invalidate()
+        if not options['keep_old']:
+            for old in old_indexes:
+                self.drop_index(backend, old)
+        self.stdout.write(self.style.SUCCESS('别名{}已指向{}'.format(alias, index_name)))
+
+    def create_index(self, backend, using, index_name):
+        '''
+        与haystack ElasticsearchSearchBackend.setup()相同的settings和mapping
+        '''
+        unified_index = connections[using].get_unified_index()
+        _, field_mapping = backend.build_schema(unified_index.all_searchfields())
+        backend.conn.indices.create(index=index_name, body={
+            'settings': backend.DEFAULT_SETTINGS,
+            'mappings': {DOC_TYPE: {'properties': field_mapping}},
+        })
+
+    def save_chunks(self, con, using, chunk_size):
+        '''
+        按主键游标扫描一遍,只取id,记录每块的左边界(不含)
+        最后一块没有右边界,构建期间新增的文章也会被包含
+        '''
+        queryset = get_index(using).index_queryset(using=using)
+        bounds = [0]
+        while True:
+            ids = list(queryset.filter(id__gt=bounds[-1]).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if len(ids) < chunk_size:
+                break
+            bounds.append(ids[-1])
+        con.rpush(CHUNKS_KEY, *bounds)
+
+    def build(self, con, using, index_name, workers):
+        bounds = [int(b) for b in con.lrange(CHUNKS_KEY, 0, -1)]
+        done = {int(b) for b in con.smembers(DONE_KEY)}
+        tasks = [(using, index_name, lo, hi) for lo, hi in zip(bounds, bounds[1:] + [None]) if lo not in done]
+        if not tasks:
+            return
+        self.stdout.write('共{}块,已完成{}块'.format(len(bounds), len(bounds) - len(tasks)))
+        # fork前关闭数据库连接,子进程各自重新连接
+        db_connections.close_all()
+        start = time.time()
+        total = 0
+        with Pool(workers) as pool:
+            for finished, (_, count) in enumerate(pool.imap_unordered(index_chunk, tasks), 1):
+                total += count
+                elapsed = time.time() - start
+                self.stdout.write('[{}/{}] 已写入{}篇, {:.0f} docs/sec'.format(
+                    finished, len(tasks), total, total / elapsed if elapsed else 0))
+        elapsed = time.time() - start
+        self.stdout.write('写入{}篇文章,耗时{:.1f}秒,{:.0f} docs/sec'.format(
+            total, elapsed, total / elapsed if elapsed else 0))
+
+    def catch_up(self, using, index_name, started):
+        '''
+        构建期间编辑的文章,队列worker写入的是旧索引,切换前补写到新索引
+        '''
+        index = get_index(using)
+        since = datetime.fromtimestamp(started, tz=timezone.utc)
+        backend = new_backend(using, index_name)
+        changed = list(index.index_queryset(using=using).filter(update_time__gte=since))
+        if changed:
+            backend.update(index, changed, commit=False)
+        for news_id in News.objects.filter(is_delete=True, update_time__gte=since).values_list('id', flat=True):
+            backend.remove('news.news.{}'.format(news_id), commit=False)
+
+    def swap_alias(self, backend, alias, index_name):
+        '''
+        一次update_aliases请求同时移除旧索引、加入新索引
+        :return: 切换前别名指向的索引
+        '''
+        indices = backend.conn.indices
+        if indices.exists_alias(name=alias):
+            old_indexes = list(indices.get_alias(name=alias).keys())
+        elif indices.exists(index=alias):
+            # 第一次切换时myblogs还是普通索引,需要先删除才能建同名别名,期间搜索会短暂中断
+            self.stdout.write('删除旧的普通索引{}'.format(alias))
+            indices.delete(index=alias)
+            old_indexes = []
+        else:
+            old_indexes = []
+        actions = [{'remove': {'index': old, 'alias': alias}} for old in old_indexes]
+        actions.append({'add': {'index': index_name, 'alias': alias}})
+        indices.update_aliases(body={'actions': actions})
+        return [old for old in old_indexes if old != index_name]
+
+    def drop_index(self, backend, index_name):
+        if backend.conn.indices.exists(index=index_name):
+            backend.conn.indices.delete(index=index_name)
+            self.stdout.write('删除索引{}'.format(index_name))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import search_queue
+
+
+class Command(BaseCommand):
+    help = '从redis队列中批量取出文章变更,提交到搜索引擎'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每次bulk请求处理的变更数')
+        parser.add_argument('--interval', type=int, default=0, help='队列为空时的等待秒数,为0时处理完队列即退出')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                result = search_queue.process(batch_size=options['batch_size'])
+            except Exception as e:
+                # 搜索引擎不可用时这批变更留在处理中列表,等待后重试
+                self.stderr.write('提交搜索索引异常:\n{}'.format(e))
+                if not options['interval']:
+                    raise
+                time.sleep(options['interval'])
+                continue
+            if result is not None:
+                self.stdout.write('索引{}篇文章,删除{}篇文章'.format(*result))
+                continue
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
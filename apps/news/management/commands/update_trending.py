@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import trending
+
+
+class Command(BaseCommand):
+    help = '按衰减分数计算热门文章排行并发布到redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0, help='循环计算的间隔秒数,为0时只执行一次')
+
+    def handle(self, *args, **options):
+        while True:
+            count = trending.publish()
+            self.stdout.write('热门排行已发布{}篇文章'.format(count))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -1,10 +1,26 @@
 import pytz
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q, F, Count
 from django.core.validators import MinLengthValidator
 
+from utils.cursor import encode_cursor
 from utils.models import ModelBase
 
+# 所有评论共用一个时区对象,避免每条评论都重新构造
+SHANGHAI_TZ = pytz.timezone('Asia/Shanghai')
+
+# 序列化评论需要的字段
+COMMENT_FIELDS = ('id', 'content', 'update_time', 'news_id', 'parent_id', 'ancestor_ids', 'author__username')
+
+
+def format_local_time(dt):
+    return SHANGHAI_TZ.normalize(dt).strftime('%Y年%m月%d日 %H:%M')
+
+
+def parse_ancestor_ids(ancestor_ids):
+    return [int(comment_id) for comment_id in ancestor_ids.split(',') if comment_id]
+
 
 class Tag(ModelBase):
     """
@@ -29,6 +45,7 @@ class News(ModelBase):
     digest = models.CharField(max_length=200,validators=[MinLengthValidator(1)], verbose_name="摘要", help_text="摘要")
     content = models.TextField(verbose_name="内容", help_text="内容")
     clicks = models.IntegerField(default=0, verbose_name="点击量", help_text="点击量")
+    comment_count = models.IntegerField(default=0, verbose_name="评论数", help_text="评论数")
     image_url = models.URLField(default="", verbose_name="图片url", help_text="图片url")
     tag = models.ForeignKey('Tag', on_delete=models.SET_NULL, null=True)
     author = models.ForeignKey('users.Users', on_delete=models.SET_NULL, null=True)
@@ -38,6 +55,12 @@ class News(ModelBase):
         db_table = "tb_news"  # 指明数据库表名
         verbose_name = "新闻"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
+        indexes = [
+            # 按标签的新闻列表/游标分页
+            models.Index(fields=['is_delete', 'tag', 'update_time', 'id'], name='idx_news_del_tag_time'),
+            # 全部新闻列表/后台文章管理
+            models.Index(fields=['is_delete', 'update_time', 'id'], name='idx_news_del_time'),
+        ]
 
     def __str__(self):
         return self.title
@@ -51,25 +74,109 @@ class Comments(ModelBase):
     author = models.ForeignKey('users.Users', on_delete=models.SET_NULL, null=True)
     news = models.ForeignKey('News', on_delete=models.CASCADE)
     parent=models.ForeignKey('self',on_delete=models.CASCADE,null=True,blank=True,related_name='son_comments')
+    # 从顶层评论到父评论的id,逗号分隔,顶层评论为空;序列化时一次查询取出整条回复链
+    ancestor_ids = models.TextField(default='', blank=True, verbose_name="祖先评论id", help_text="祖先评论id")
 
     class Meta:
         ordering = ['-update_time', '-id']
         db_table = "tb_comments"  # 指明数据库表名
         verbose_name = "评论"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
+        indexes = [
+            # 文章下的全部评论
+            models.Index(fields=['news', 'is_delete', 'update_time'], name='idx_comm_news_del_time'),
+            # 顶层评论/回复的游标分页和回复数统计
+            models.Index(fields=['news', 'parent', 'is_delete', 'update_time', 'id'], name='idx_comm_news_parent_time'),
+        ]
+
+    def soft_delete(self):
+        """
+        逻辑删除评论,同一事务内扣减文章评论数
+        """
+        with transaction.atomic():
+            deleted = Comments.objects.filter(id=self.id, is_delete=False).update(is_delete=True)
+            if deleted:
+                News.objects.filter(id=self.news_id).update(comment_count=F('comment_count') - 1)
+        self.is_delete = True
+        return bool(deleted)
+
+    def set_parent(self, parent):
+        """
+        设置父评论,同时记录祖先id
+        :param parent: 至少查出了id和ancestor_ids的父评论,为None时是顶层评论
+        """
+        self.parent = parent
+        self.ancestor_ids = ','.join(filter(None, (parent.ancestor_ids, str(parent.id)))) if parent else ''
 
     def to_dict_data(self):
-        shanghai_tz=pytz.timezone('Asia/Shanghai')
-        update_time_local=shanghai_tz.normalize(self.update_time)
-        comment_dict={
-            'news_id':self.news.id,
-            'content_id':self.id,
-            'content':self.content,
-            'author':self.author.username,
-            'update_time':update_time_local.strftime('%Y年%m月%d日 %H:%M'),
-            'parent':self.parent.to_dict_data() if self.parent else None,
-        }
-        return comment_dict
+        """
+        单条评论的序列化,父评论链与to_dict_list一样一次查出
+        """
+        return Comments.to_dict_list(Comments.objects.filter(id=self.id).values(*COMMENT_FIELDS))[0]
+
+    @classmethod
+    def to_dict_list(cls, rows):
+        """
+        批量序列化评论,结构与to_dict_data一致
+        :param rows: values(*COMMENT_FIELDS)查询出的评论行
+        不在rows中的祖先按ancestor_ids一次查出(包括已删除的),查询次数与评论数量和回复深度都无关
+        """
+        rows_by_id = {r['id']: r for r in rows}
+        missing = set()
+        for r in rows:
+            missing.update(parse_ancestor_ids(r['ancestor_ids']))
+        missing.difference_update(rows_by_id)
+        if missing:
+            for r in cls.objects.filter(id__in=missing).values(*COMMENT_FIELDS):
+                rows_by_id[r['id']] = r
+
+        dicts = {}
+
+        def to_dict(comment_id):
+            # 向上找到第一个已序列化的祖先,再自顶向下生成,避免深层回复链递归过深
+            # ancestor_ids没有回填的旧评论,父评论链到此为止
+            chain = []
+            while comment_id in rows_by_id and comment_id not in dicts:
+                chain.append(comment_id)
+                comment_id = rows_by_id[comment_id]['parent_id']
+            for cid in reversed(chain):
+                r = rows_by_id[cid]
+                dicts[cid] = {
+                    'news_id': r['news_id'],
+                    'content_id': r['id'],
+                    'content': r['content'],
+                    'author': r['author__username'],
+                    'update_time': format_local_time(r['update_time']),
+                    'parent': dicts.get(r['parent_id']),
+                }
+            return dicts[chain[0]] if chain else dicts[comment_id]
+
+        return [to_dict(r['id']) for r in rows]
+
+    @classmethod
+    def cursor_page(cls, news_id, per_page, parent_id=None, cursor=None):
+        """
+        按(update_time, id)游标分页查询评论,每条评论附带回复数reply_count
+        :param parent_id: 为None时查询顶层评论,否则查询该评论的直接回复
+        :param cursor: decode_cursor的结果或None
+        :return: (评论字典列表, 下一页游标)
+        """
+        comments = cls.objects.filter(is_delete=False, news_id=news_id, parent_id=parent_id)
+        if cursor:
+            update_time, comment_id = cursor
+            comments = comments.filter(Q(update_time__lt=update_time) | Q(update_time=update_time, id__lt=comment_id))
+        rows = list(comments.order_by('-update_time', '-id').values(*COMMENT_FIELDS)[:per_page + 1])
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = encode_cursor(rows[-1]['update_time'], rows[-1]['id'])
+        reply_counts = dict(cls.objects.filter(is_delete=False, parent_id__in=[r['id'] for r in rows]).values_list(
+            'parent_id').annotate(num=Count('id')).order_by())
+        # 回复的父评论链由to_dict_list按ancestor_ids一次取出,与文章的评论总数无关
+        comments_list = cls.to_dict_list(rows)
+        for comment_dict in comments_list:
+            comment_dict['reply_count'] = reply_counts.get(comment_dict['content_id'], 0)
+        return comments_list, next_cursor
 
     def __str__(self):
         return '<评论{}>'.format(self.id)
@@ -91,6 +198,9 @@ class HotNews(ModelBase):
         db_table = "tb_hotnews"  # 指明数据库表名
         verbose_name = "热门新闻"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
+        indexes = [
+            models.Index(fields=['is_delete', 'priority'], name='idx_hotnews_del_pri'),
+        ]
 
     def __str__(self):
         return '<热门新闻{}>'.format(self.id)
@@ -116,6 +226,9 @@ class Banner(ModelBase):
         db_table = "tb_banner"  # 指明数据库表名
         verbose_name = "轮播图"  # 在admin站点中显示的名称
         verbose_name_plural = verbose_name  # 显示的复数名称
+        indexes = [
+            models.Index(fields=['is_delete', 'priority', 'update_time', 'id'], name='idx_banner_del_pri'),
+        ]
 
     def __str__(self):
         return '<轮播图{}>'.format(self.id)
\ No newline at end of file
@@ -0,0 +1,54 @@
+import logging
+
+from django.http import HttpResponse
+from django_redis import get_redis_connection
+
+from news import constants
+
+logger = logging.getLogger('django')
+
+GENERATION_KEY = 'news_content_generation'
+PAGE_KEY = 'news_page_{}_{}'
+
+
+def get_con():
+    return get_redis_connection(alias='default')
+
+
+def bump_generation():
+    '''
+    内容发生变化时递增版本号,旧版本的缓存自然失效,由过期时间回收,无需逐个删除
+    '''
+    try:
+        get_con().incr(GENERATION_KEY)
+    except Exception as e:
+        logger.error('新闻缓存版本号更新异常:\n{}'.format(e))
+
+
+def make_key(*parts):
+    generation = get_con().get(GENERATION_KEY) or b'0'
+    return PAGE_KEY.format(generation.decode('utf8'), '_'.join(str(p) for p in parts))
+
+
+def cached_json(key_parts, build):
+    '''
+    :param key_parts: 组成缓存键的参数,如('list', tag_id, page)
+    :param build: 缓存未命中时生成JsonResponse的函数
+    :return: 命中时直接返回redis中已编码好的字节
+    '''
+    try:
+        con = get_con()
+        key = make_key(*key_parts)
+        content = con.get(key)
+    except Exception as e:
+        logger.error('读取新闻缓存异常:\n{}'.format(e))
+        return build()
+    if content:
+        return HttpResponse(content, content_type='application/json')
+    response = build()
+    if response.status_code == 200:
+        try:
+            con.setex(key, constants.NEWS_PAGE_CACHE_EXPIRES, response.content)
+        except Exception as e:
+            logger.error('写入新闻缓存异常:\n{}'.format(e))
+    return response
@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.html import strip_tags
+from django_redis import get_redis_connection
+
+from news import models, constants
+from utils.tfidf import RelatedIndex
+
+logger = logging.getLogger('django')
+
+# news_id -> 相关文章列表json,详情页一次HGET取出
+RELATED_KEY = 'news_related'
+# 上次计算开始的时间,只重新向量化此后修改过的文章
+STATE_FILE = 'state.json'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def get_related(news_id):
+    '''
+    :return: [{'id','title','image_url'}],尚未计算或redis异常时返回空列表
+    '''
+    try:
+        data = get_con().hget(RELATED_KEY, news_id)
+    except Exception as e:
+        logger.error('读取相关文章异常:\n{}'.format(e))
+        return []
+    return json.loads(data.decode('utf8')) if data else []
+
+
+def _text(news):
+    '''
+    标题重复两次以提高权重,正文去掉html标签
+    '''
+    return ' '.join([news.title, news.title, news.digest, strip_tags(news.content)])
+
+
+def _documents(queryset, batch_size):
+    return [(news.id, _text(news)) for news in
+            queryset.only('id', 'title', 'digest', 'content').iterator(chunk_size=batch_size)]
+
+
+def _load_state(path):
+    try:
+        with open(os.path.join(path, STATE_FILE), 'r') as f:
+            since = parse_datetime(json.load(f)['since'])
+        return RelatedIndex.load(path), since
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+def _save_state(path, index, since):
+    index.save(path)
+    with open(os.path.join(path, STATE_FILE), 'w') as f:
+        json.dump({'since': since.isoformat()}, f)
+
+
+def _related_lists(index, news_ids):
+    '''
+    过滤掉相似度过低的近邻,再用一次查询取出所有近邻的标题和图片
+    '''
+    neighbors = {}
+    for news_id in news_ids:
+        neighbors[news_id] = [other for other, score in index.get_neighbors(news_id)
+                              if score >= constants.RELATED_NEWS_MIN_SCORE][:constants.RELATED_NEWS_COUNT]
+    news_map = models.News.objects.only('id', 'title', 'image_url').filter(is_delete=False).in_bulk(
+        {other for others in neighbors.values() for other in others})
+    related = {}
+    for news_id, others in neighbors.items():
+        related[news_id] = json.dumps([{'id': other, 'title': news_map[other].title,
+                                        'image_url': news_map[other].image_url}
+                                       for other in others if other in news_map])
+    return related
+
+
+def _publish(con, key, related, batch_size):
+    items = list(related.items())
+    pl = con.pipeline()
+    for i in range(0, len(items), batch_size):
+        pl.hmset(key, dict(items[i:i + batch_size]))
+        pl.execute()
+
+
+def compute(full=False, batch_size=constants.RELATED_NEWS_BATCH_SIZE):
+    '''
+    1.读取上次保存的向量和近邻,没有或指定full时全量计算,结果写入临时key后RENAME替换
+    2.增量计算只向量化上次开始后修改过的文章(以及恢复的文章),删除已下线文章的行
+    3.只重算近邻列表受影响的文章,并只更新它们在redis中的列表
+    :return: 更新的文章数
+    '''
+    path = settings.RELATED_NEWS_DIR
+    index, since = (None, None) if full else _load_state(path)
+    started = timezone.now()
+    queryset = models.News.objects.filter(is_delete=False)
+    con = get_con()
+
+    if index is None:
+        index = RelatedIndex(k=constants.RELATED_NEWS_COUNT * 2)
+        index.rebuild(_documents(queryset, batch_size), batch_size=batch_size)
+        related = _related_lists(index, index.ids.tolist())
+        tmp_key = RELATED_KEY + '_tmp'
+        con.delete(tmp_key)
+        _publish(con, tmp_key, related, batch_size)
+        if related:
+            con.rename(tmp_key, RELATED_KEY)
+        else:
+            con.delete(RELATED_KEY)
+        _save_state(path, index, started)
+        return len(related)
+
+    live_ids = set(queryset.values_list('id', flat=True))
+    known_ids = set(index.ids.tolist())
+    # 软删除后恢复的文章update_time不变,按不在索引中处理
+    changed = queryset.filter(update_time__gt=since) | queryset.filter(id__in=live_ids - known_ids)
+    removed_ids = known_ids - live_ids
+    affected = index.update(_documents(changed, batch_size), removed_ids, batch_size=batch_size)
+    related = _related_lists(index, affected - removed_ids)
+    _publish(con, RELATED_KEY, related, batch_size)
+    if removed_ids:
+        con.hdel(RELATED_KEY, *removed_ids)
+    _save_state(path, index, started)
+    return len(related)
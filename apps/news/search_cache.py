@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+
+from django_redis import get_redis_connection
+from haystack.models import SearchResult
+
+from news import models, constants
+from utils.embedded_search.tokenizer import normalize
+
+logger = logging.getLogger('django')
+
+RESULT_KEY = 'search_result_{}_{}'
+# 索引更新后递增,结果缓存的key带上版本号,旧版本的缓存由过期时间回收
+GENERATION_KEY = 'search_result_generation'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def normalize_query(q):
+    '''
+    全角转半角、统一小写、合并连续空白,'Ｐython  爬虫'与'python 爬虫'共用一份缓存
+    '''
+    return ' '.join(normalize(q).split())
+
+
+def make_key(con, q):
+    generation = con.get(GENERATION_KEY) or b'0'
+    return RESULT_KEY.format(generation.decode('utf8'), hashlib.md5(normalize_query(q).encode('utf8')).hexdigest())
+
+
+def invalidate():
+    '''
+    索引写入完成后调用,递增版本号,全部结果缓存随之失效,无需逐个删除
+    '''
+    try:
+        get_con().incr(GENERATION_KEY)
+    except Exception as e:
+        logger.error('清除搜索结果缓存异常:\n{}'.format(e))
+
+
+class CachedResults(object):
+    '''
+    代替SearchQuerySet交给haystack的Paginator
+    1.第一次取长度或切片时读取缓存的文章id列表,未命中时查询搜索引擎并写入缓存
+    2.切片时只为当前页的文章构造SearchResult,并用一次查询加载文章对象
+    最多缓存SEARCH_CACHE_MAX_RESULTS条,超出部分不再翻页,capped为真时分页栏提示只显示了前面的结果
+    关键字不能放在query属性中,haystack的get_context会把有query属性的结果当作SearchQuerySet读取query.backend
+    '''
+    def __init__(self, q, searchqueryset):
+        self.q = q
+        self.searchqueryset = searchqueryset
+        self._rows = None
+        # 是否由缓存返回,未命中时才真正请求了搜索引擎
+        self.cache_hit = False
+        # haystack的build_page会先切片一次再交给Paginator,同一页只加载一次
+        self._pages = {}
+
+    def using(self, connection_name):
+        return CachedResults(self.q, self.searchqueryset.using(connection_name))
+
+    def _fetch(self):
+        '''
+        :return: [[文章id, 分数, 标题, 摘要]]
+        '''
+        rows = []
+        for result in self.searchqueryset[:constants.SEARCH_CACHE_MAX_RESULTS]:
+            rows.append([int(result.pk), result.score, getattr(result, 'title', ''), getattr(result, 'digest', '')])
+        return rows
+
+    def _load(self):
+        if self._rows is not None:
+            return self._rows
+        try:
+            con = get_con()
+            # 查询期间索引有更新时,结果写入旧版本的key,不会被读到
+            key = make_key(con, self.q)
+            cached = con.get(key)
+        except Exception as e:
+            logger.error('读取搜索结果缓存异常:\n{}'.format(e))
+            self._rows = self._fetch()
+            return self._rows
+        if cached:
+            self.cache_hit = True
+            self._rows = json.loads(cached.decode('utf8'))
+            return self._rows
+        self._rows = self._fetch()
+        try:
+            con.setex(key, constants.SEARCH_CACHE_EXPIRES, json.dumps(self._rows))
+        except Exception as e:
+            logger.error('写入搜索结果缓存异常:\n{}'.format(e))
+        return self._rows
+
+    def __len__(self):
+        return len(self._load())
+
+    def count(self):
+        return len(self)
+
+    @property
+    def capped(self):
+        return len(self) >= constants.SEARCH_CACHE_MAX_RESULTS
+
+    def __getitem__(self, item):
+        rows = self._load()
+        if not isinstance(item, slice):
+            return to_results([rows[item]])[0]
+        # build_page和Paginator切片的结束位置在最后一页可能不同,按实际范围合并
+        page_key = item.indices(len(rows))[:2]
+        if page_key not in self._pages:
+            self._pages[page_key] = to_results(rows[slice(*page_key)])
+        return self._pages[page_key]
+
+
+def to_results(rows):
+    '''
+    :param rows: [[文章id, 分数, 标题, 摘要]]
+    :return: 与haystack一致的SearchResult列表,模板中的one_news.object直接使用批量加载的文章
+    '''
+    news_map = models.News.objects.select_related('tag', 'author').only(
+        'id', 'title', 'image_url', 'update_time', 'tag__name', 'author__username').filter(is_delete=False).in_bulk(
+        [row[0] for row in rows])
+    results = []
+    for news_id, score, title, digest in rows:
+        # 缓存期间被删除的文章直接跳过
+        if news_id not in news_map:
+            continue
+        result = SearchResult('news', 'news', news_id, score, title=title, digest=digest)
+        result._object = news_map[news_id]
+        results.append(result)
+    return results
@@ -0,0 +1,98 @@
+import logging
+
+from django.db import connection
+from django_redis import get_redis_connection
+
+from news import constants
+from news.search_cache import normalize_query, to_results
+from utils.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger('django')
+
+# 各查询路径的累计次数,字段为PATH_*
+SERVED_BY_KEY = 'search_served_by'
+PATH_CACHE = 'cache'
+PATH_ELASTICSEARCH = 'elasticsearch'
+PATH_EMBEDDED = 'embedded'
+PATH_MYSQL = 'mysql'
+
+# tb_news上的FULLTEXT(title,digest,content)索引,使用ngram分词,见0006迁移
+MATCH_SQL = 'MATCH(title, digest, content) AGAINST (%s IN NATURAL LANGUAGE MODE)'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+breaker = CircuitBreaker(get_con, 'elasticsearch',
+                         failure_threshold=constants.SEARCH_BREAKER_FAILURES,
+                         window=constants.SEARCH_BREAKER_WINDOW,
+                         cooldown=constants.SEARCH_BREAKER_COOLDOWN)
+
+
+def record_path(path):
+    try:
+        get_con().hincrby(SERVED_BY_KEY, path, 1)
+    except Exception as e:
+        logger.error('记录搜索路径异常:\n{}'.format(e))
+
+
+def served_by():
+    '''
+    :return: [(路径, 次数, 百分比)],后台首页展示
+    '''
+    counts = {key.decode('utf8'): int(value) for key, value in get_con().hgetall(SERVED_BY_KEY).items()}
+    total = sum(counts.values())
+    return [(path, counts.get(path, 0), round(counts.get(path, 0) * 100 / total, 1) if total else 0)
+            for path in (PATH_CACHE, PATH_ELASTICSEARCH, PATH_EMBEDDED, PATH_MYSQL)]
+
+
+class FulltextResults(object):
+    '''
+    elasticsearch和备用索引都不可用时代替SearchQuerySet交给haystack的Paginator,结果形式与CachedResults一致
+    1.总数只统计一次,与搜索引擎路径一样最多SEARCH_CACHE_MAX_RESULTS条
+    2.切片时按相关度分页查询当前页的文章id,再批量加载文章
+    关键字放在q属性中,原因见CachedResults
+    '''
+    def __init__(self, q):
+        self.q = normalize_query(q)
+        self._count = None
+        self._pages = {}
+
+    def __len__(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT COUNT(*) FROM (SELECT id FROM tb_news WHERE is_delete = 0 AND {} LIMIT %s) t'
+                               .format(MATCH_SQL), [self.q, constants.SEARCH_CACHE_MAX_RESULTS])
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def count(self):
+        return len(self)
+
+    @property
+    def capped(self):
+        return len(self) >= constants.SEARCH_CACHE_MAX_RESULTS
+
+    def _fetch(self, start, stop):
+        '''
+        :return: [[文章id, 分数, 标题, 摘要]]
+        '''
+        start = start or 0
+        stop = min(stop if stop is not None else constants.SEARCH_CACHE_MAX_RESULTS,
+                   constants.SEARCH_CACHE_MAX_RESULTS)
+        if stop <= start:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, {match} AS score, title, digest FROM tb_news '
+                           'WHERE is_delete = 0 AND {match} ORDER BY score DESC, id DESC LIMIT %s OFFSET %s'
+                           .format(match=MATCH_SQL), [self.q, self.q, stop - start, start])
+            return [list(row) for row in cursor.fetchall()]
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return to_results(self._fetch(item, item + 1))[0]
+        page_key = item.indices(len(self))[:2]
+        if page_key not in self._pages:
+            self._pages[page_key] = to_results(self._fetch(*page_key))
+        return self._pages[page_key]
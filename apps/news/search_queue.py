@@ -0,0 +1,156 @@
+import json
+import logging
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import signals
+from django_redis import get_redis_connection
+from haystack import connections, connection_router
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+
+from news import models, search_cache
+
+logger = logging.getLogger('django')
+
+QUEUE_KEY = 'search_index_queue'
+# 正在提交的一批变更,提交成功后才删除,worker中途退出时下次启动先重新提交这一批
+PROCESSING_KEY = 'search_index_processing'
+
+# 原子地把队首一批变更移到PROCESSING_KEY,保持原有顺序
+MOVE_BATCH_SCRIPT = '''
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+'''
+
+ACTION_UPDATE = 'update'
+ACTION_DELETE = 'delete'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def enqueue(model, pk, action):
+    '''
+    只把变更写入redis队列,由update_search_index命令批量提交到搜索引擎
+    redis异常时只记录日志,不影响编辑保存
+    '''
+    try:
+        item = json.dumps({'model': model._meta.label_lower, 'pk': pk, 'action': action})
+        get_con().rpush(QUEUE_KEY, item)
+    except Exception as e:
+        logger.error('搜索索引变更入队异常:\n{}'.format(e))
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    '''
+    代替RealtimeSignalProcessor,保存/删除时不再同步请求elasticsearch
+    事务提交后才入队,避免worker读到未提交的数据
+    '''
+    def setup(self):
+        signals.post_save.connect(self.handle_save, sender=models.News)
+        signals.post_delete.connect(self.handle_delete, sender=models.News)
+
+    def teardown(self):
+        signals.post_save.disconnect(self.handle_save, sender=models.News)
+        signals.post_delete.disconnect(self.handle_delete, sender=models.News)
+
+    def handle_save(self, sender, instance, **kwargs):
+        transaction.on_commit(lambda: enqueue(sender, instance.pk, ACTION_UPDATE))
+
+    def handle_delete(self, sender, instance, **kwargs):
+        transaction.on_commit(lambda: enqueue(sender, instance.pk, ACTION_DELETE))
+
+
+def pop_batch(con, batch_size):
+    '''
+    1.PROCESSING_KEY中有上次没有提交成功的变更时,先处理这一批
+    2.否则原子地把队首一批变更移到PROCESSING_KEY,同一篇文章多次变更只保留最后一次
+    只允许运行一个update_search_index,多个worker会重复提交同一批
+    :return: (原始队列项, {(model_label, pk): action})
+    '''
+    raw_items = con.lrange(PROCESSING_KEY, 0, -1)
+    if not raw_items:
+        raw_items = con.eval(MOVE_BATCH_SCRIPT, 2, QUEUE_KEY, PROCESSING_KEY, batch_size)
+    changes = {}
+    for raw in raw_items:
+        item = json.loads(raw)
+        changes[(item['model'], item['pk'])] = item['action']
+    return raw_items, changes
+
+
+def _bulk_remove(backend, identifiers):
+    '''
+    elasticsearch后端用一次bulk请求删除,其他后端逐条删除
+    '''
+    conn = getattr(backend, 'conn', None)
+    if conn is None:
+        for identifier in identifiers:
+            backend.remove(identifier)
+        return
+    from elasticsearch.helpers import bulk
+    actions = [{'_op_type': 'delete', '_index': backend.index_name, '_type': 'modelresult', '_id': identifier}
+               for identifier in identifiers]
+    # 文档本来就不在索引中时会返回404,不算失败
+    bulk(conn, actions, raise_on_error=False, refresh=True)
+
+
+def apply_changes(changes):
+    '''
+    按模型分组后,每个搜索连接发一次bulk更新和一次bulk删除
+    软删除(is_delete=True)的文章不在index_queryset中,按删除处理
+    '''
+    by_model = {}
+    for (label, pk), action in changes.items():
+        by_model.setdefault(label, {ACTION_UPDATE: set(), ACTION_DELETE: set()})[action].add(pk)
+
+    indexed = removed = 0
+    for label, groups in by_model.items():
+        model = apps.get_model(label)
+        objs, delete_pks = [], groups[ACTION_DELETE]
+        for using in connection_router.for_write(model=model):
+            try:
+                index = connections[using].get_unified_index().get_index(model)
+            except NotHandled:
+                continue
+            backend = connections[using].get_backend()
+            objs = list(index.index_queryset(using=using).filter(pk__in=groups[ACTION_UPDATE]))
+            delete_pks = groups[ACTION_DELETE] | (groups[ACTION_UPDATE] - {obj.pk for obj in objs})
+            if objs:
+                backend.update(index, objs)
+            if delete_pks:
+                # 与haystack.utils.get_identifier的格式一致: app_label.model_name.pk
+                _bulk_remove(backend, ['{}.{}'.format(label, pk) for pk in delete_pks])
+        indexed += len(objs)
+        removed += len(delete_pks)
+    return indexed, removed
+
+
+def process(batch_size=500):
+    '''
+    1.从队列取出一批变更,放在PROCESSING_KEY中
+    2.提交到搜索引擎,失败或worker中途退出时这批变更留在PROCESSING_KEY,下次优先重试
+    3.成功后删除PROCESSING_KEY,清除搜索结果缓存
+    :return: (索引文章数, 删除文章数),队列为空时返回None
+    '''
+    con = get_con()
+    raw_items, changes = pop_batch(con, batch_size)
+    if not raw_items:
+        return None
+    result = apply_changes(changes)
+    con.delete(PROCESSING_KEY)
+    search_cache.invalidate()
+    return result
+
+
+def pending():
+    pl = get_con().pipeline()
+    pl.llen(QUEUE_KEY)
+    pl.llen(PROCESSING_KEY)
+    return sum(pl.execute())
+
@@ -0,0 +1,170 @@
+import json
+import logging
+
+from django.urls import reverse
+from django_redis import get_redis_connection
+
+from news import models, constants
+from news.search_cache import normalize_query
+from utils.embedded_search.tokenizer import CJK_RE
+from doc.models import Doc
+from course.models import Course
+
+logger = logging.getLogger('django')
+
+# 按字典序排列的前缀索引,成员为'标题片段\x00类型:id',score全为0
+SUGGEST_INDEX_KEY = 'search_suggest_index'
+# 类型:id -> {'title','url','type','weight'}
+SUGGEST_DATA_KEY = 'search_suggest_data'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def _fragments(title):
+    '''
+    标题中每个汉字和每个英文单词的开头都可以作为输入的起点,
+    从这些位置截取固定长度的片段,使'爬虫'也能匹配'Python爬虫入门'
+    '''
+    text = normalize_query(title)
+    fragments = []
+    for i, char in enumerate(text):
+        if char == ' ':
+            continue
+        if CJK_RE.match(char) or i == 0 or not text[i - 1].isalnum() or CJK_RE.match(text[i - 1]):
+            fragments.append(text[i:i + constants.SUGGEST_FRAGMENT_LENGTH])
+    return set(fragments)
+
+
+def _members(ref, title):
+    return ['{}\x00{}'.format(fragment, ref) for fragment in _fragments(title)]
+
+
+def _ref(kind, obj_id):
+    return '{}:{}'.format(kind, obj_id)
+
+
+def _index(pl, ref, data, old=None):
+    if old:
+        old_members = _members(ref, json.loads(old.decode('utf8'))['title'])
+        if old_members:
+            pl.zrem(SUGGEST_INDEX_KEY, *old_members)
+    members = _members(ref, data['title'])
+    if members:
+        pl.zadd(SUGGEST_INDEX_KEY, {member: 0 for member in members})
+    pl.hset(SUGGEST_DATA_KEY, ref, json.dumps(data))
+
+
+def _add(kind, obj_id, data):
+    '''
+    标题改变时先删除旧片段,redis异常只记录日志,不影响编辑保存
+    '''
+    try:
+        con = get_con()
+        ref = _ref(kind, obj_id)
+        old = con.hget(SUGGEST_DATA_KEY, ref)
+        pl = con.pipeline()
+        _index(pl, ref, data, old)
+        pl.execute()
+    except Exception as e:
+        logger.error('搜索提示索引写入异常:\n{}'.format(e))
+
+
+def remove(kind, obj_id):
+    try:
+        con = get_con()
+        ref = _ref(kind, obj_id)
+        old = con.hget(SUGGEST_DATA_KEY, ref)
+        if not old:
+            return
+        pl = con.pipeline()
+        members = _members(ref, json.loads(old.decode('utf8'))['title'])
+        if members:
+            pl.zrem(SUGGEST_INDEX_KEY, *members)
+        pl.hdel(SUGGEST_DATA_KEY, ref)
+        pl.execute()
+    except Exception as e:
+        logger.error('搜索提示索引删除异常:\n{}'.format(e))
+
+
+def news_data(news):
+    return {'type': 'news', 'title': news.title, 'url': reverse('news:news_detail', args=[news.id]),
+            'weight': news.clicks}
+
+
+def doc_data(doc):
+    return {'type': 'doc', 'title': doc.title, 'url': reverse('doc:doc_download', args=[doc.id]), 'weight': 0}
+
+
+def course_data(course):
+    return {'type': 'course', 'title': course.title, 'url': reverse('course:course_detail', args=[course.id]),
+            'weight': 0}
+
+
+def add_news(news):
+    _add('news', news.id, news_data(news))
+
+
+def add_doc(doc):
+    _add('doc', doc.id, doc_data(doc))
+
+
+def add_course(course):
+    _add('course', course.id, course_data(course))
+
+
+def rebuild(batch_size=500):
+    '''
+    写入临时key后用RENAME替换,重建期间提示不中断
+    :return: 写入的条目数
+    '''
+    con = get_con()
+    index_key, data_key = SUGGEST_INDEX_KEY + '_tmp', SUGGEST_DATA_KEY + '_tmp'
+    con.delete(index_key, data_key)
+    sources = [
+        ('news', models.News.objects.only('id', 'title', 'clicks').filter(is_delete=False), news_data),
+        ('doc', Doc.objects.only('id', 'title').filter(is_delete=False), doc_data),
+        ('course', Course.objects.only('id', 'title').filter(is_delete=False), course_data),
+    ]
+    count = 0
+    pl = con.pipeline()
+    for kind, queryset, to_data in sources:
+        for obj in queryset.iterator():
+            data = to_data(obj)
+            members = _members(_ref(kind, obj.id), data['title'])
+            if members:
+                pl.zadd(index_key, {member: 0 for member in members})
+            pl.hset(data_key, _ref(kind, obj.id), json.dumps(data))
+            count += 1
+            if count % batch_size == 0:
+                pl.execute()
+    pl.execute()
+    if count:
+        pl.rename(index_key, SUGGEST_INDEX_KEY)
+        pl.rename(data_key, SUGGEST_DATA_KEY)
+    else:
+        pl.delete(SUGGEST_INDEX_KEY, SUGGEST_DATA_KEY)
+    pl.execute()
+    return count
+
+
+def suggest(q):
+    '''
+    1.ZRANGEBYLEX取出以输入开头的片段,最多SUGGEST_SCAN_COUNT个
+    2.同一篇内容只保留一次,HMGET取出展示数据
+    3.按权重(新闻为点击量)排序后返回前SUGGEST_COUNT个
+    '''
+    prefix = normalize_query(q)[:constants.SUGGEST_FRAGMENT_LENGTH]
+    if not prefix:
+        return []
+    con = get_con()
+    start = b'[' + prefix.encode('utf8')
+    members = con.zrangebylex(SUGGEST_INDEX_KEY, start, start + b'\xff', 0, constants.SUGGEST_SCAN_COUNT)
+    refs = list(dict.fromkeys(member.rsplit(b'\x00', 1)[1] for member in members))
+    if not refs:
+        return []
+    items = [json.loads(data.decode('utf8')) for data in con.hmget(SUGGEST_DATA_KEY, refs) if data]
+    items.sort(key=lambda item: item['weight'], reverse=True)
+    return [{'type': item['type'], 'title': item['title'], 'url': item['url']}
+            for item in items[:constants.SUGGEST_COUNT]]
@@ -0,0 +1,19 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(url, image_srcsets, sizes, alt='', css_class=''):
+    '''
+    有缩略图时输出<picture>,支持WebP的浏览器按sizes选择WebP,否则选择渐进式JPEG,都不支持srcset时使用原图
+    :param image_srcsets: image_variants.srcsets()的返回值
+    :param css_class: 加在<img>上,原有样式不用修改
+    '''
+    srcset = image_srcsets.get(url) if image_srcsets else None
+    if not srcset:
+        return format_html('<img src="{}" alt="{}" class="{}">', url, alt, css_class)
+    return format_html('<picture><source type="image/webp" srcset="{}" sizes="{}">'
+                       '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}"></picture>',
+                       srcset['webp'], sizes, url, srcset['jpeg'], sizes, alt, css_class)
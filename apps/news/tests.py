@@ -1,6 +1,227 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, RequestFactory, SimpleTestCase, override_settings
+from elasticsearch.exceptions import ConnectionError
+from haystack.models import SearchResult
+
+from news import views, models, search_cache, search_fallback, image_variants, thumbnails, trending
+from users.models import Users
 
 # Create your tests here.
 
 
+def _results(rows):
+    '''
+    代替search_cache.to_results,用未保存的文章对象构造结果,不查询数据库
+    '''
+    results = []
+    for news_id, score, title, digest in rows:
+        result = SearchResult('news', 'news', news_id, score, title=title, digest=digest)
+        result._object = models.News(id=news_id, title=title, digest=digest, image_url='http://testserver/a.jpg',
+                                     tag=models.Tag(name='Python'), author=Users(username='admin'))
+        results.append(result)
+    return results
+
+
+def _failover_results(results, connection_name):
+    '''
+    代替CachedResults.using,备用索引的结果用searchqueryset记录连接名,不创建真实的SearchQuerySet
+    '''
+    return search_cache.CachedResults(results.q, connection_name)
+
+
+class SearchViewTest(SimpleTestCase):
+    '''
+    通过真实的SearchView渲染关键字搜索页,redis和elasticsearch的结果用mock代替
+    '''
+    ROWS = [[1, 1.0, 'python爬虫', '摘要']]
+
+    def search(self, q):
+        request = RequestFactory().get('/search/', {'q': q})
+        request.user = AnonymousUser()
+        return views.SearchView()(request)
+
+    def setUp(self):
+        patchers = [
+            mock.patch.object(search_cache.CachedResults, '_load', lambda results: self.ROWS),
+            mock.patch.object(search_cache, 'to_results', _results),
+            mock.patch.object(search_fallback.breaker, 'allow', return_value=True),
+            mock.patch.object(search_fallback.breaker, 'record_success'),
+            mock.patch.object(search_fallback.breaker, 'record_failure'),
+            mock.patch.object(search_fallback, 'record_path'),
+            mock.patch.object(image_variants, 'srcsets', return_value={}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_keyword_search_renders(self):
+        response = self.search('python')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('爬虫', response.content.decode('utf8'))
+        search_fallback.breaker.record_failure.assert_not_called()
+
+    def test_results_loaded_once_per_page(self):
+        # build_page和Paginator各切片一次,image_srcsets也要读取r.object,同一页只能查询一次数据库
+        with mock.patch.object(search_cache, 'to_results', side_effect=_results) as to_results:
+            self.search('python')
+        to_results.assert_called_once_with(self.ROWS)
+        image_variants.srcsets.assert_called_once()
+        self.assertEqual(list(image_variants.srcsets.call_args[0][0]), ['http://testserver/a.jpg'])
+
+    def test_elasticsearch_error_falls_back_to_embedded(self):
+        def load(results):
+            if results.searchqueryset != 'embedded':
+                raise ConnectionError('N/A', 'down', Exception('down'))
+            return self.ROWS
+
+        with mock.patch.object(search_cache.CachedResults, '_load', load), \
+                mock.patch.object(search_cache.CachedResults, 'using', _failover_results):
+            response = self.search('python')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('爬虫', response.content.decode('utf8'))
+        search_fallback.breaker.record_failure.assert_called_once_with()
+        search_fallback.record_path.assert_called_once_with(search_fallback.PATH_EMBEDDED)
+
+    def test_embedded_error_falls_back_to_mysql(self):
+        with mock.patch.object(search_cache.CachedResults, '_load',
+                               side_effect=ConnectionError('N/A', 'down', Exception('down'))), \
+                mock.patch.object(search_cache.CachedResults, 'using', _failover_results), \
+                mock.patch.object(search_fallback.FulltextResults, '__len__', return_value=len(self.ROWS)), \
+                mock.patch.object(search_fallback.FulltextResults, '_fetch', return_value=self.ROWS), \
+                mock.patch.object(search_fallback, 'to_results', _results):
+            response = self.search('python')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('爬虫', response.content.decode('utf8'))
+        search_fallback.breaker.record_failure.assert_called_once_with()
+        search_fallback.record_path.assert_called_once_with(search_fallback.PATH_MYSQL)
+
+    def test_malformed_elasticsearch_error_still_falls_back(self):
+        # 缺少info参数时str()会抛出IndexError,记录日志不能让降级变成500
+        with mock.patch.object(search_cache.CachedResults, '_load', side_effect=ConnectionError('N/A', 'down')), \
+                mock.patch.object(search_fallback.FulltextResults, '__len__', return_value=len(self.ROWS)), \
+                mock.patch.object(search_fallback.FulltextResults, '_fetch', return_value=self.ROWS), \
+                mock.patch.object(search_fallback, 'to_results', _results), \
+                self.settings(SEARCH_FAILOVER_CONNECTION=None):
+            response = self.search('python')
+        self.assertEqual(response.status_code, 200)
+        search_fallback.record_path.assert_called_once_with(search_fallback.PATH_MYSQL)
+
+    def test_other_errors_do_not_trip_breaker(self):
+        with mock.patch.object(image_variants, 'srcsets', side_effect=AttributeError):
+            with self.assertRaises(AttributeError):
+                self.search('python')
+        search_fallback.breaker.record_failure.assert_not_called()
+
+
+class ThumbnailSourceTest(SimpleTestCase):
+    '''
+    media/下的路径读取MEDIA_ROOT中的本机文件,不能读到MEDIA_ROOT之外
+    '''
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.media_root, 'uploads', 'ab'))
+        with open(os.path.join(self.media_root, 'uploads', 'ab', 'a.jpg'), 'wb') as f:
+            f.write(b'image')
+        os.symlink('/etc/passwd', os.path.join(self.media_root, 'uploads', 'ab', 'b.jpg'))
+        patcher = override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/')
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_local_upload(self):
+        self.assertEqual(thumbnails.open_source('media/uploads/ab/a.jpg').read(), b'image')
+
+    def test_missing_and_outside_media_root(self):
+        for path in ('media/uploads/ab/c.jpg', 'media/uploads/ab/b.jpg'):
+            with self.assertRaises(FileNotFoundError) as cm:
+                thumbnails.open_source(path)
+            self.assertTrue(thumbnails.is_missing(cm.exception))
+
+
+class CommentAncestorsTest(TestCase):
+    '''
+    回复链很深时,序列化评论的查询次数也是固定的
+    '''
+    DEPTH = 30
+
+    def setUp(self):
+        self.author = Users.objects.create_user(username='admin', password='admin123', mobile='13800000000')
+        self.news = models.News.objects.create(title='python爬虫', digest='摘要', content='内容', author=self.author)
+        parent = None
+        self.thread = []
+        for i in range(self.DEPTH):
+            comment = models.Comments(content='回复{}'.format(i), author=self.author, news=self.news)
+            comment.set_parent(parent)
+            comment.save()
+            self.thread.append(comment)
+            parent = comment
+
+    def test_deep_thread_uses_two_queries(self):
+        with self.assertNumQueries(2):
+            rows = list(models.Comments.objects.filter(id=self.thread[-1].id).values(*models.COMMENT_FIELDS))
+            comment_dict = models.Comments.to_dict_list(rows)[0]
+        depth = 0
+        while comment_dict['parent']:
+            self.assertEqual(comment_dict['parent']['content_id'], self.thread[-2 - depth].id)
+            comment_dict = comment_dict['parent']
+            depth += 1
+        self.assertEqual(depth, self.DEPTH - 1)
+
+    def test_replies_page_cost_does_not_grow_with_article(self):
+        # 文章下的其他评论越多,回复页的查询也不能变慢:回复、回复数、祖先链各一次
+        models.Comments.objects.bulk_create(
+            models.Comments(content='顶层{}'.format(i), author=self.author, news=self.news) for i in range(200))
+        parent = self.thread[-2]
+        with self.assertNumQueries(3):
+            comments_list, _ = models.Comments.cursor_page(self.news.id, 10, parent_id=parent.id)
+        self.assertEqual([c['content_id'] for c in comments_list], [self.thread[-1].id])
+        self.assertEqual(comments_list[0]['parent']['content_id'], parent.id)
+
+    def test_deleted_ancestors_are_kept(self):
+        self.thread[0].soft_delete()
+        comment_dict = self.thread[-1].to_dict_data()
+        while comment_dict['parent']:
+            comment_dict = comment_dict['parent']
+        self.assertEqual(comment_dict['content_id'], self.thread[0].id)
+
+
+class TrendingPublishTest(TestCase):
+    '''
+    编辑置顶的热门文章按优先级排在最前,其余位置才按访问分数排名
+    '''
+    def setUp(self):
+        author = Users.objects.create_user(username='admin', password='admin123', mobile='13800000000')
+        self.news = [models.News.objects.create(title='文章{}'.format(i), digest='摘要', content='内容', author=author)
+                     for i in range(5)]
+
+    def publish(self, scores):
+        con = mock.Mock()
+        with mock.patch.object(trending, 'get_con', return_value=con), \
+                mock.patch.object(trending, 'compute_scores', return_value=scores):
+            trending.publish()
+        return [item['news']['id'] for item in json.loads(con.set.call_args[0][1])]
+
+    def test_all_pinned_news_keep_priority(self):
+        pinned = self.news[:2]
+        models.HotNews.objects.create(news=pinned[0], priority=2)
+        models.HotNews.objects.create(news=pinned[1], priority=1)
+        others = self.news[2:]
+        # 分数最高的是普通文章,置顶文章的分数为0也排在前面
+        scores = {others[0].id: 10, others[1].id: 30, others[2].id: 20}
+        self.assertEqual(self.publish(scores),
+                         [pinned[1].id, pinned[0].id, others[1].id, others[2].id, others[0].id])
 
+    def test_pinned_beyond_show_count_are_ranked(self):
+        for news, priority in zip(self.news[:4], (1, 1, 2, 3)):
+            models.HotNews.objects.create(news=news, priority=priority)
+        top = self.publish({self.news[3].id: 5, self.news[4].id: 1})
+        self.assertEqual(set(top[:3]), {n.id for n in self.news[:3]})
+        self.assertEqual(top[3:], [self.news[3].id, self.news[4].id])
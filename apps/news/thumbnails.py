@@ -0,0 +1,140 @@
+import logging
+import os
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_cache_control, patch_response_headers
+
+from news import constants
+from utils.disk_cache import DiskCache
+from utils.images import make_thumbnail
+
+logger = logging.getLogger('django')
+
+# 源图片扩展名,路径末尾再加.webp时输出WebP,否则输出渐进式JPEG
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'webp')
+CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+_cache = None
+
+
+class SourceTooLarge(Exception):
+    '''
+    源图片超过IMAGE_RESIZE_MAX_SOURCE_BYTES,不生成缩略图
+    '''
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(settings.IMAGE_CACHE_DIR, settings.IMAGE_CACHE_MAX_BYTES)
+    return _cache
+
+
+def is_allowed(width, height):
+    '''
+    只生成白名单中的尺寸,防止任意尺寸的请求占满缓存
+    '''
+    return (width, height) in constants.IMAGE_RESIZE_SIZES
+
+
+def parse_path(path):
+    '''
+    :param path: FastDFS中的文件路径,如group1/M00/00/00/xxx.jpg,
+                 或MEDIA_URL下的本机文件,如media/uploads/ab/xxx.jpg,末尾可以再加.webp
+    :return: (源文件路径, 'jpeg'或'webp'),路径不合法时返回None
+    '''
+    fmt = 'jpeg'
+    source, ext = os.path.splitext(path)
+    if ext.lower() == '.webp' and os.path.splitext(source)[1]:
+        path, fmt = source, 'webp'
+    if path.startswith('/') or '..' in path.split('/'):
+        return None
+    if os.path.splitext(path)[1][1:].lower() not in IMAGE_EXTENSIONS:
+        return None
+    return path, fmt
+
+
+def _download(url):
+    upstream = requests.get(url, stream=True, timeout=constants.IMAGE_VARIANT_FETCH_TIMEOUT)
+    upstream.raise_for_status()
+    data = BytesIO()
+    for chunk in upstream.iter_content(64 * 1024):
+        data.write(chunk)
+        if data.tell() > constants.IMAGE_RESIZE_MAX_SOURCE_BYTES:
+            upstream.close()
+            raise SourceTooLarge(url)
+    data.seek(0)
+    return data
+
+
+def _read_local(path):
+    '''
+    读取MEDIA_ROOT下的文件,LocalStandInStorage保存的上传文件在MEDIA_ROOT/uploads中
+    :raise FileNotFoundError: 文件不存在或解析符号链接后不在MEDIA_ROOT中
+    '''
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    file_path = os.path.realpath(os.path.join(media_root, path))
+    if not file_path.startswith(media_root + os.sep):
+        raise FileNotFoundError(path)
+    if os.path.getsize(file_path) > constants.IMAGE_RESIZE_MAX_SOURCE_BYTES:
+        raise SourceTooLarge(path)
+    with open(file_path, 'rb') as f:
+        return BytesIO(f.read())
+
+
+def open_source(path):
+    '''
+    1.MEDIA_URL下的路径读取本机文件
+    2.否则从IMAGE_RESIZE_SOURCE_URL(FastDFS)下载
+    '''
+    media_prefix = settings.MEDIA_URL.lstrip('/')
+    if path.startswith(media_prefix):
+        return _read_local(path[len(media_prefix):])
+    return _download(settings.IMAGE_RESIZE_SOURCE_URL + path)
+
+
+def is_missing(e):
+    '''
+    源图片不存在或超过大小上限时返回404,不需要告警;超时、解码失败和等待文件锁超时等记录错误日志
+    '''
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code == 404
+    return isinstance(e, (FileNotFoundError, SourceTooLarge))
+
+
+def open_thumbnail(path, width, height, fmt):
+    '''
+    未命中时读取源图片生成缩略图写入本机磁盘缓存,同一张缩略图并发的未命中只生成一次
+    :return: 缓存文件对象,调用方负责关闭
+    '''
+    def fetch():
+        source = open_source(path)
+        quality = constants.IMAGE_VARIANT_WEBP_QUALITY if fmt == 'webp' else constants.IMAGE_VARIANT_JPEG_QUALITY
+        return [make_thumbnail(source, (width, height), fmt, quality=quality)]
+
+    f, _ = get_cache().open('{}x{}/{}.{}'.format(width, height, path, fmt), fetch)
+    return f
+
+
+def thumbnail_response(f, fmt):
+    '''
+    1.开启IMAGE_RESIZE_ACCEL时返回X-Accel-Redirect,由nginx直接发送缓存文件
+    2.否则交给FileResponse发送
+    FastDFS和LocalStandInStorage都为每次上传生成新的文件名,内容不会改变,缩略图可以长期缓存
+    '''
+    if getattr(settings, 'IMAGE_RESIZE_ACCEL', False):
+        # 只需要缓存中的相对路径;nginx读取前被淘汰的极少数情况返回404,下次请求重新生成
+        relative_path = os.path.relpath(f.name, settings.IMAGE_CACHE_DIR)
+        f.close()
+        res = HttpResponse()
+        res['X-Accel-Redirect'] = settings.IMAGE_ACCEL_REDIRECT_PREFIX + relative_path
+    else:
+        res = FileResponse(f)
+        res['Content-Length'] = os.fstat(f.fileno()).st_size
+    res['Content-Type'] = CONTENT_TYPES[fmt]
+    patch_response_headers(res, constants.IMAGE_RESIZE_CACHE_MAX_AGE)
+    patch_cache_control(res, public=True, immutable=True)
+    return res
@@ -0,0 +1,120 @@
+import json
+import logging
+import time
+from collections import defaultdict
+
+from django_redis import get_redis_connection
+
+from news import models, constants, visitors
+
+logger = logging.getLogger('django')
+
+BUCKET_KEY = 'news_trending_{}'
+TOP_KEY = 'news_trending_top'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def current_hour(now=None):
+    return int((now or time.time()) // 3600)
+
+
+def record_view(pl, news_id):
+    '''
+    在当前小时的桶中累加访问数,桶在滑动窗口结束后自动过期
+    :param pl: redis pipeline,与点击量计数一起提交
+    '''
+    key = BUCKET_KEY.format(current_hour())
+    pl.hincrby(key, news_id, 1)
+    pl.expire(key, (constants.TRENDING_WINDOW_HOURS + 1) * 3600)
+
+
+def compute_scores(con, now=None):
+    '''
+    按小时衰减累加窗口内各桶的访问数,越早的访问权重越低
+    再乘以独立访客数/访问数(不超过1),降低刷新和爬虫重复访问的影响
+    :return: {news_id: score}
+    '''
+    hour = current_hour(now)
+    pl = con.pipeline()
+    for age in range(constants.TRENDING_WINDOW_HOURS):
+        pl.hgetall(BUCKET_KEY.format(hour - age))
+    scores = defaultdict(float)
+    views_total = defaultdict(int)
+    for age, bucket in enumerate(pl.execute()):
+        weight = 0.5 ** (age / constants.TRENDING_HALF_LIFE_HOURS)
+        for news_id, views in bucket.items():
+            scores[int(news_id)] += int(views) * weight
+            views_total[int(news_id)] += int(views)
+    # 窗口跨越的自然日都计入,独立访客按天存储
+    days = constants.TRENDING_WINDOW_HOURS // 24 + 1
+    for news_id, uv in visitors.unique_visitors(scores, days=days, con=con).items():
+        scores[news_id] *= min(1.0, uv / views_total[news_id])
+    return scores
+
+
+def _to_item(news):
+    return {
+        'news': {
+            'id': news.id,
+            'title': news.title,
+            'digest': news.digest,
+            'image_url': news.image_url,
+            'tag': {'name': news.tag.name if news.tag else ''},
+            'author': {'username': news.author.username if news.author else ''},
+        },
+        'update_time': models.format_local_time(news.update_time),
+    }
+
+
+def publish(now=None):
+    '''
+    计算热门排行并把前N篇文章的展示数据写入redis
+    1.热门文章(HotNews)作为编辑置顶按优先级排在最前,最多SHOW_HOTNEWS_COUNT篇,与后台热门文章管理页一致
+    2.其余位置按衰减分数填充,超出的热门文章与普通文章一样按分数排名
+    3.访问数据不足时,用超出的热门文章按优先级补在最后
+    :return: 发布的文章数
+    '''
+    con = get_con()
+    scores = compute_scores(con, now)
+    pinned = list(models.HotNews.objects.filter(is_delete=False, news__is_delete=False).values_list(
+        'news_id', 'priority'))
+    pinned.sort(key=lambda p: (p[1], -scores.get(p[0], 0)))
+    pinned_ids = [news_id for news_id, _ in pinned]
+    head = pinned_ids[:constants.SHOW_HOTNEWS_COUNT]
+    head_set = set(head)
+    ranked = sorted((i for i in scores if i not in head_set), key=scores.get,
+                    reverse=True)[:constants.TRENDING_TOP_COUNT]
+    ranked_set = set(ranked)
+    candidate_ids = head + ranked + [i for i in pinned_ids[constants.SHOW_HOTNEWS_COUNT:] if i not in ranked_set]
+
+    news_map = models.News.objects.select_related('tag', 'author').only(
+        'id', 'title', 'digest', 'image_url', 'update_time', 'tag__name', 'author__username').filter(
+        is_delete=False).in_bulk(candidate_ids)
+    top = [_to_item(news_map[i]) for i in candidate_ids if i in news_map]
+    con.set(TOP_KEY, json.dumps(top))
+    return len(top)
+
+
+def refresh():
+    '''
+    编辑修改热门文章后立即重新发布,失败时等待定时任务
+    '''
+    try:
+        publish()
+    except Exception as e:
+        logger.error('热门排行发布异常:\n{}'.format(e))
+
+
+def get_top():
+    '''
+    :return: 已发布的热门列表,未发布或redis异常时返回None,调用方回退到数据库查询
+    '''
+    try:
+        top = get_con().get(TOP_KEY)
+    except Exception as e:
+        logger.error('读取热门排行异常:\n{}'.format(e))
+        return None
+    return json.loads(top) if top else None
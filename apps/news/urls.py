@@ -10,7 +10,11 @@ urlpatterns = [
     path('news/banners/',views.NewsBanner.as_view(),name='news_banner'),
     path('news/<int:news_id>/',views.NewsDetailView.as_view(),name='news_detail'),
     path('news/<int:news_id>/comments/',views.NewsCommentView.as_view(),name='news_commen'),
-    path('search/',views.SearchView(),name='search')
+    path('news/<int:news_id>/comments/<int:comment_id>/',views.CommentEditView.as_view(),name='comment_edit'),
+    path('news/<int:news_id>/comments/<int:comment_id>/replies/',views.CommentRepliesView.as_view(),name='comment_replies'),
+    path('search/suggest/',views.SearchSuggestView.as_view(),name='search_suggest'),
+    path('search/',views.SearchView(),name='search'),
+    path('img/<int:width>x<int:height>/<path:path>',views.ImageResizeView.as_view(),name='image_resize'),
 ]
 
 
@@ -3,26 +3,42 @@ import logging
 
 from django.core import paginator
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import transaction
+from django.db.models import Q, F
 from django.shortcuts import render
 from django.views import View
-from django.http import HttpResponseNotFound
+from django.http import HttpResponseNotFound, Http404
 from django.conf import settings
 
-from news import models, constants
+from news import models, constants, feed, page_cache, clicks, trending, search_cache, search_fallback, suggest, related, image_variants, thumbnails
+from utils.cursor import encode_cursor, decode_cursor
 from utils.json_fun import to_json_data
 from utils.res_code import Code,error_map
+from elasticsearch.exceptions import ElasticsearchException
 from haystack.views import SearchView as _SearchView
 
 logger=logging.getLogger('django')
 
 
+def hot_news_srcsets(hot_news):
+    '''
+    热门新闻可能是发布到redis的字典,也可能是HotNews对象
+    '''
+    return image_variants.srcsets(n['news']['image_url'] if isinstance(n,dict) else n.news.image_url for n in hot_news)
+
+
 class IndexView(View):
     '''
     create news index view
     '''
     def get(self,request):
         tags=models.Tag.objects.only('id','name').filter(is_delete=False)
-        hot_news=models.HotNews.objects.select_related('news').only('news__title', 'news__image_url').filter(is_delete=False).order_by('priority', '-news__clicks')[0:constants.SHOW_HOTNEWS_COUNT]
+        # 优先使用定时发布的热门排行,未发布时按优先级和点击量查询
+        hot_news=trending.get_top()
+        if hot_news is None:
+            hot_news=models.HotNews.objects.select_related('news').only('news__title', 'news__image_url').filter(is_delete=False).order_by('priority', '-news__clicks')
+        hot_news=hot_news[0:constants.SHOW_HOTNEWS_COUNT]
+        image_srcsets=hot_news_srcsets(hot_news)
         cn_page='index'
         return render(request,'news/index.html',locals())
 
@@ -32,12 +48,16 @@ class NewsListView(View):
     create news list view
     /news/
     1.获取前端传来的tag_id和page,并且捕获异常,记录error日志
-    2.联合查询select_related(tag,author),只要('title', 'digest', 'image_url', 'update_time', 'tag__name', 'author__username')
-    3.链式调用,过滤逻辑删除,tag_id不存在
-    4.分页(对象列表,每一页的数据)
-    5.生成当前页,并捕获异常,纪录info日志
-    6.序列化输出
-    7.返回数据给前端:data={total_pages,news}
+    2.优先从redis的feed索引读取(按update_time排序的有序集合+卡片数据),索引未建立或redis异常时查询数据库
+    3.联合查询select_related(tag,author),只要('title', 'digest', 'image_url', 'update_time', 'tag__name', 'author__username')
+    4.链式调用,过滤逻辑删除,tag_id不存在
+    5.分页(对象列表,每一页的数据)
+    6.生成当前页,并捕获异常,纪录info日志
+    7.序列化输出
+    8.返回数据给前端:data={total_pages,news}
+    9.传了cursor参数时使用游标分页:按(update_time,id)定位,不做COUNT和OFFSET,返回data={next_cursor,news}
+    10.整个响应按内容版本号缓存到redis,命中时直接返回编码好的json
+    11.每条新闻带上image_srcset(已生成的缩略图),缩略图生成后更新版本号
     '''
     def get(self,request):
         #1.获取前端传参数
@@ -46,35 +66,47 @@ class NewsListView(View):
         except Exception as e:
             logger.error('标签错误:\n{}'.format(e))
             tag_id=0
+        cursor_mode='cursor' in request.GET
+        cursor=decode_cursor(request.GET.get('cursor'))
         try:
             page=int(request.GET.get('page',1))
         except Exception as e:
             logger.error('当前页数错误:\n{}'.format(e))
             page=1
-        #2.联合查询
+        # 游标重新编码后作为缓存键,非法游标与第一页共用缓存
+        position='c{}'.format(encode_cursor(*cursor) if cursor else '') if cursor_mode else page
+        return page_cache.cached_json(('list',tag_id,position),
+                                      lambda:self.build_response(tag_id,cursor_mode,cursor,page))
+
+    def build_response(self,tag_id,cursor_mode,cursor,page):
+        #2.读取feed索引
+        try:
+            if feed.is_ready():
+                if cursor_mode:
+                    news_info_list,next_cursor=feed.get_by_cursor(tag_id,cursor)
+                    image_variants.attach(news_info_list)
+                    return to_json_data(data={'next_cursor':next_cursor,'news':news_info_list})
+                total_pages,news_info_list=feed.get_page(tag_id,page)
+                image_variants.attach(news_info_list)
+                return to_json_data(data={'total_pages':total_pages,'news':news_info_list})
+        except Exception as e:
+            logger.error('读取feed索引异常,改为查询数据库:\n{}'.format(e))
+        #3.联合查询
         news_queryset=models.News.objects.select_related('tag','author').only('id','title', 'digest', 'image_url', 'update_time', 'tag__name', 'author__username')
-        #3.链式调用
+        if cursor_mode:
+            return self.get_by_cursor(news_queryset,tag_id,cursor)
+        #4.链式调用
         news=news_queryset.filter(is_delete=False,tag_id=tag_id) or news_queryset.filter(is_delete=False)
-        #4.分页
+        #5.分页
         paginator=Paginator(news,per_page=constants.PER_PAGE_NEWS_COUNT)
-        #5.生成当前页
+        #6.生成当前页
         try:
             news_info=paginator.page(page)
         except EmptyPage:
             logger.info('用户访问的页数大于总页数')
             news_info=paginator.page(paginator.num_pages)
-        #6.序列化输出
-        news_info_list=[]
-        for n in news_info:
-            news_info_list.append({
-                'id':n.id,
-                'title':n.title,
-                'digest':n.digest,
-                'image_url': n.image_url,
-                'tag_name': n.tag.name,
-                'author': n.author.username,
-                'update_time':n.update_time.strftime('%Y年%m月%d日 %H:%M')
-            })
+        #7.序列化输出
+        news_info_list=image_variants.attach([feed.to_card(n) for n in news_info])
         data={
             'total_pages': paginator.num_pages,
             'news': news_info_list
@@ -82,17 +114,41 @@ class NewsListView(View):
 
         return to_json_data(data=data)
 
+    def get_by_cursor(self,news_queryset,tag_id,cursor):
+        '''
+        游标分页:每页只需一次索引定位,翻得再深也不会变慢
+        '''
+        news=news_queryset.filter(is_delete=False)
+        if tag_id and news.filter(tag_id=tag_id).exists():
+            news=news.filter(tag_id=tag_id)
+        if cursor:
+            update_time,news_id=cursor
+            news=news.filter(Q(update_time__lt=update_time)|Q(update_time=update_time,id__lt=news_id))
+        # 多取一条用于判断是否还有下一页
+        news_list=list(news.order_by('-update_time','-id')[:constants.PER_PAGE_NEWS_COUNT+1])
+        has_more=len(news_list)>constants.PER_PAGE_NEWS_COUNT
+        news_list=news_list[:constants.PER_PAGE_NEWS_COUNT]
+        last=news_list[-1] if news_list else None
+        data={
+            'next_cursor': encode_cursor(last.update_time,last.id) if has_more else None,
+            'news': image_variants.attach([feed.to_card(n) for n in news_list])
+        }
+        return to_json_data(data=data)
+
 
 class NewsBanner(View):
     '''
     create news banner view
     /news/banners/
     1.关联查询
-    2.序列化输出
+    2.序列化输出,带上已生成的缩略图srcset
     3.返回数据给前端
     '''
 
     def get(self,request):
+        return page_cache.cached_json(('banners',),self.build_response)
+
+    def build_response(self):
         banners=models.Banner.objects.select_related('news').only('news__image_url','news_id','news__title').filter(is_delete=False)[0:constants.SHOW_BANNER_COUNT]
         banners_info_list=[]
         for b in banners:
@@ -102,7 +158,7 @@ class NewsBanner(View):
                 'news_title': b.news.title,
             })
         data={
-            'banners':banners_info_list
+            'banners':image_variants.attach(banners_info_list)
         }
         return to_json_data(data=data)
 
@@ -112,19 +168,20 @@ class NewsDetailView(View):
     create news detail view
     /news/<int:news_id>
     1.联合查询新闻
-    2.联合查询新闻评论
-    3.序列化输出:comments_list.append(comm.to_dict_data())
-    4.渲染页面
-    5.如果新闻不存在,返回HttpResponseNotFound
+    2.只查询第一页顶层评论,其余评论和回复由前端通过评论接口按需加载
+    3.序列化输出:Comments.cursor_page(news_id)
+    4.在redis中累加点击量,由flush_news_clicks命令定期写回数据库
+    5.读取compute_related_news命令预先计算的相关文章
+    6.渲染页面
+    7.如果新闻不存在,返回HttpResponseNotFound
     '''
     def get(self,request,news_id):
-        news=models.News.objects.select_related('tag','author').only('title', 'content', 'update_time', 'tag__name', 'author__username').filter(is_delete=False,id=news_id).first()
+        news=models.News.objects.select_related('tag','author').only('title', 'content', 'update_time', 'comment_count', 'tag__name', 'author__username').filter(is_delete=False,id=news_id).first()
         if news:
-            comments=models.Comments.objects.select_related('author','parent').only('content','author__username','update_time','parent__content','parent__author__username','parent__update_time').filter(is_delete=False,news_id=news_id)
-            comments_list=[]
-            for comm in comments:
-                comments_list.append(comm.to_dict_data())
-            comments_num=len(comments_list)
+            comments_list,next_cursor=models.Comments.cursor_page(news_id,constants.PER_PAGE_COMMENTS_COUNT)
+            comments_num=news.comment_count
+            clicks.track_view(request,news_id)
+            related_news=related.get_related(news_id)
             return render(request,'news/news_detail.html',locals())
         else:
             return HttpResponseNotFound('<h1>Page not found</h1>')
@@ -139,9 +196,17 @@ class NewsCommentView(View):
     3.从前端获取参数,数据不存在返回错误信息
     4.判断评论内容是否为空,错误返回错误信息
     5.判断异常:判断是否有父评论,再判断是否为对应的news_id,返回错误信息,异常处理,记录日志,返回错误
-    6.写入到数据库,判断父评论是否有,可以为空,但是不能为空字符串,返回数据给前端
+    6.写入到数据库,判断父评论是否有,可以为空,但是不能为空字符串,同一事务内累加文章评论数,返回数据给前端
+    get:按游标分页返回顶层评论,data={comments,next_cursor}
     '''
 
+    def get(self,request,news_id):
+        if not models.News.objects.only('id').filter(is_delete=False,id=news_id).exists():
+            return to_json_data(errno=Code.PARAMERR,errmsg='新闻不存在')
+        cursor=decode_cursor(request.GET.get('cursor'))
+        comments_list,next_cursor=models.Comments.cursor_page(news_id,constants.PER_PAGE_COMMENTS_COUNT,cursor=cursor)
+        return to_json_data(data={'comments':comments_list,'next_cursor':next_cursor})
+
     def post(self,request,news_id):
         if not request.user.is_authenticated:
             return to_json_data(errno=Code.SESSIONERR,errmsg=error_map[Code.SESSIONERR])
@@ -157,10 +222,12 @@ class NewsCommentView(View):
             return to_json_data(errno=Code.PARAMERR,errmsg='评论内容为空')
 
         parent_id=dict_data.get('parent_id')
+        parent=None
         try:
             if parent_id:
                 parent_id=int(parent_id)
-                if not models.Comments.objects.only('id').filter(is_delete=False,news_id=news_id,id=parent_id):
+                parent=models.Comments.objects.only('id','ancestor_ids').filter(is_delete=False,news_id=news_id,id=parent_id).first()
+                if not parent:
                     return to_json_data(errno=Code.PARAMERR,errmsg=error_map[Code.PARAMERR])
         except Exception as e:
             logger.info('前端传来的parent_id异常:\n{}'.format(e))
@@ -170,12 +237,96 @@ class NewsCommentView(View):
         new_content.content=content
         new_content.author=request.user
         new_content.news_id=news_id
-        new_content.parent_id=parent_id if parent_id else None
-        new_content.save()
+        new_content.set_parent(parent)
+        with transaction.atomic():
+            new_content.save()
+            models.News.objects.filter(id=news_id).update(comment_count=F('comment_count')+1)
 
         return to_json_data(data=new_content.to_dict_data())
 
 
+class CommentEditView(View):
+    '''
+    create comment edit view
+    /news/<int:news_id>/comments/<int:comment_id>/
+    1.判断用户是否登录,错误返回错误信息
+    2.只有评论作者或有删除评论权限的用户可以删除
+    3.逻辑删除评论,同时扣减文章评论数
+    '''
+
+    def delete(self,request,news_id,comment_id):
+        if not request.user.is_authenticated:
+            return to_json_data(errno=Code.SESSIONERR,errmsg=error_map[Code.SESSIONERR])
+        comment=models.Comments.objects.only('id','news_id','author_id').filter(is_delete=False,news_id=news_id,id=comment_id).first()
+        if not comment:
+            return to_json_data(errno=Code.PARAMERR,errmsg='评论不存在')
+        if comment.author_id!=request.user.id and not request.user.has_perm('news.delete_comments'):
+            return to_json_data(errno=Code.ROLEERR,errmsg='没有操作权限')
+        comment.soft_delete()
+        return to_json_data(errmsg='评论删除成功')
+
+
+class CommentRepliesView(View):
+    '''
+    create comment replies view
+    /news/<int:news_id>/comments/<int:comment_id>/replies/
+    1.判断评论是否存在,错误返回错误信息
+    2.按游标分页返回该评论的直接回复,data={comments,next_cursor}
+    '''
+
+    def get(self,request,news_id,comment_id):
+        if not models.Comments.objects.only('id').filter(is_delete=False,news_id=news_id,id=comment_id).exists():
+            return to_json_data(errno=Code.PARAMERR,errmsg='评论不存在')
+        cursor=decode_cursor(request.GET.get('cursor'))
+        comments_list,next_cursor=models.Comments.cursor_page(news_id,constants.PER_PAGE_COMMENTS_COUNT,
+                                                              parent_id=comment_id,cursor=cursor)
+        return to_json_data(data={'comments':comments_list,'next_cursor':next_cursor})
+
+
+class SearchSuggestView(View):
+    '''
+    搜索框输入提示
+    /search/suggest/?q=
+    1.从redis前缀索引中取出以输入开头的标题
+    2.redis异常时返回空列表,不影响正常搜索
+    '''
+    def get(self, request):
+        try:
+            suggestions = suggest.suggest(request.GET.get('q', ''))
+        except Exception as e:
+            logger.error('读取搜索提示异常:\n{}'.format(e))
+            suggestions = []
+        return to_json_data(data={'suggestions': suggestions})
+
+
+class ImageResizeView(View):
+    '''
+    create image resize view
+    /img/<width>x<height>/<path>
+    1.只允许constants.IMAGE_RESIZE_SIZES中的尺寸,其余返回404
+    2.path为FastDFS中的文件路径或media/下的本机文件,末尾再加.webp时输出WebP,否则输出渐进式JPEG
+    3.从本机磁盘缓存读取,未命中时下载源图片裁剪缩放后写入缓存,按容量淘汰最久未访问的
+    4.开启IMAGE_RESIZE_ACCEL时由nginx发送缓存文件,带一年的Cache-Control和Expires
+    5.源图片不存在时返回404;下载超时、图片解码失败等记录错误日志,同样返回404
+    '''
+    def get(self,request,width,height,path):
+        if not thumbnails.is_allowed(width,height):
+            raise Http404('不支持的图片尺寸')
+        parsed=thumbnails.parse_path(path)
+        if parsed is None:
+            raise Http404('图片路径异常')
+        path,fmt=parsed
+        try:
+            f=thumbnails.open_thumbnail(path,width,height,fmt)
+        except Exception as e:
+            if thumbnails.is_missing(e):
+                logger.info('缩略图的源图片不存在{}:\n{}'.format(path,e))
+            else:
+                logger.error('生成缩略图出现异常{}:\n{}'.format(path,e))
+            raise Http404('图片不存在')
+        return thumbnails.thumbnail_response(f,fmt)
+
+
 class SearchView(_SearchView):
     '''
     create news search view
@@ -190,12 +341,27 @@ class SearchView(_SearchView):
 
     template='news/search.html'
 
+    def get_results(self):
+        # 有关键字时先查redis中缓存的结果id列表,翻页不再请求搜索引擎
+        results=super(SearchView,self).get_results()
+        if not self.query:
+            return results
+        return search_cache.CachedResults(self.query,results)
+
+    def get_context(self):
+        context=super(SearchView,self).get_context()
+        context['image_srcsets']=image_variants.srcsets(
+            r.object.image_url for r in context['page'].object_list if r.object is not None)
+        return context
+
     def create_response(self):
 
         kw=self.request.GET.get('q','')
         if not kw:
             show_all=True
-            hot_news=models.HotNews.objects.select_related('news').only('news__title','news__image_url','news__id').filter(is_delete=False).order_by('priority','-news__clicks')
+            hot_news=trending.get_top()
+            if hot_news is None:
+                hot_news=models.HotNews.objects.select_related('news').only('news__title','news__image_url','news__id').filter(is_delete=False).order_by('priority','-news__clicks')
             paginator=Paginator(hot_news,settings.HAYSTACK_SEARCH_RESULTS_PER_PAGE)
             try:
                 page=paginator.page(int(self.request.GET.get('page',1)))
@@ -203,12 +369,43 @@ class SearchView(_SearchView):
                 page=paginator.page(1)
             except EmptyPage:
                 page=paginator.page(paginator.num_pages)
+            image_srcsets=hot_news_srcsets(page.object_list)
             cn_page = 'search'
             return render(self.request,self.template,locals())
 
         else:
             show_all=False
-            qs=super(SearchView,self).create_response()#隐藏了q与page
+            # elasticsearch异常时依次改用进程内的备用索引和mysql全文索引,连续失败后熔断,冷却期内不再请求elasticsearch
+            # 先单独取出结果,只有elasticsearch的异常才计入熔断,模板等其他异常照常抛出
+            # 异常用repr记录,elasticsearch缺少info参数的异常str()时会再抛出IndexError
+            if search_fallback.breaker.allow():
+                try:
+                    len(self.results)
+                except ElasticsearchException as e:
+                    search_fallback.breaker.record_failure()
+                    logger.error('搜索引擎异常,改用备用索引:\n{!r}'.format(e))
+                else:
+                    if self.results.cache_hit:
+                        search_fallback.record_path(search_fallback.PATH_CACHE)
+                    else:
+                        search_fallback.breaker.record_success()
+                        search_fallback.record_path(search_fallback.PATH_ELASTICSEARCH)
+                    return super(SearchView,self).create_response()#隐藏了q与page
+            failover=getattr(settings,'SEARCH_FAILOVER_CONNECTION',None)
+            if failover:
+                results=self.results.using(failover)
+                try:
+                    len(results)
+                except Exception as e:
+                    logger.error('备用索引{}异常,改用mysql全文索引:\n{!r}'.format(failover,e))
+                else:
+                    self.results=results
+                    search_fallback.record_path(search_fallback.PATH_CACHE if results.cache_hit
+                                                else search_fallback.PATH_EMBEDDED)
+                    return super(SearchView,self).create_response()
+            self.results=search_fallback.FulltextResults(self.query)
+            qs=super(SearchView,self).create_response()
+            search_fallback.record_path(search_fallback.PATH_MYSQL)
             return qs
 
 
@@ -0,0 +1,58 @@
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from news import constants
+
+logger = logging.getLogger('django')
+
+UV_KEY = 'news_uv_{}_{}'
+
+
+def get_con():
+    return get_redis_connection(alias='news')
+
+
+def visitor_id(request):
+    '''
+    登录用户按用户id,匿名用户按已有session,没有session时按ip+UA区分
+    不为匿名用户创建session,避免爬虫撑大session存储
+    '''
+    if request.user.is_authenticated:
+        return 'u{}'.format(request.user.id)
+    if request.session.session_key:
+        return 's{}'.format(request.session.session_key)
+    raw = '{}|{}'.format(request.META.get('REMOTE_ADDR', ''), request.META.get('HTTP_USER_AGENT', ''))
+    return 'a{}'.format(hashlib.md5(raw.encode('utf8')).hexdigest())
+
+
+def _day_keys(news_id, days, today=None):
+    today = today or timezone.localdate()
+    return [UV_KEY.format((today - timedelta(days=d)).strftime('%Y%m%d'), news_id) for d in range(days)]
+
+
+def record_visit(pl, news_id, visitor):
+    '''
+    把访客写入当天的HyperLogLog,每个key固定约12KB,与访问量无关
+    :param pl: redis pipeline,与点击量计数一起提交
+    '''
+    key = _day_keys(news_id, 1)[0]
+    pl.pfadd(key, visitor)
+    pl.expire(key, constants.UV_KEEP_DAYS * 24 * 3600)
+
+
+def unique_visitors(news_ids, days=1, con=None):
+    '''
+    :param days: 统计最近几天(含今天),多天时PFCOUNT合并计算,同一访客只算一次
+    :return: {news_id: 近似独立访客数}
+    '''
+    news_ids = list(news_ids)
+    if not news_ids:
+        return {}
+    pl = (con or get_con()).pipeline()
+    for news_id in news_ids:
+        pl.pfcount(*_day_keys(news_id, days))
+    return dict(zip(news_ids, pl.execute()))
@@ -117,6 +117,13 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     },
+    "news": {#新闻feed索引等预计算数据
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/3",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        }
+    },
 }
 
 # 将用户的session保存到redis中
@@ -228,19 +235,61 @@ HAYSTACK_CONNECTIONS = {
         'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
         'URL': 'http://172.17.0.11:8005/',  # 此处为elasticsearch运行的服务器ip地址，端口号默认为9200
         'INDEX_NAME': 'myblogs',  # 指定elasticsearch建立的索引库的名称
+        'SILENTLY_FAIL': False,  # elasticsearch异常时抛出，由SearchView切换到备用索引
+    },
+    # 进程内的备用索引，把default的ENGINE换成它即可在没有elasticsearch的环境单独使用
+    'embedded': {
+        'ENGINE': 'utils.embedded_search.backend.EmbeddedSearchEngine',
+        'PATH': os.path.join(BASE_DIR, 'search_index'),
     },
 }
+# 写入索引时同时更新备用索引
+HAYSTACK_ROUTERS = ['utils.embedded_search.routers.FailoverRouter', 'haystack.routers.DefaultRouter']
+SEARCH_FAILOVER_CONNECTION = 'embedded'
+
+# compute_related_news命令保存TF-IDF向量和近邻的目录，增量计算时读取
+RELATED_NEWS_DIR = os.path.join(BASE_DIR, 'related_news')
 
 # 设置每页显示的数据量
 HAYSTACK_SEARCH_RESULTS_PER_PAGE = 5
-# 当数据库改变时，会自动更新索引
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# 当数据库改变时，把变更写入redis队列，由update_search_index命令批量更新索引
+HAYSTACK_SIGNAL_PROCESSOR = 'news.search_queue.QueuedSignalProcessor'
 
 #站点域名信息
 SITE_DOMAIN_PORT = "http://111.231.137.70:8003/"
 
 FDFS_URL='http://111.231.137.70:8888/'
 FDFS_CLIENT_CONF=os.path.join(BASE_DIR,'utils/fastdfs/client.conf')
+# 上传视图保存文件的存储，没有FastDFS的环境改为utils.fastdfs.storage.LocalStandInStorage
+UPLOAD_STORAGE = 'utils.fastdfs.storage.FastDFSStorage'
+# FastDFS连接异常时的重试次数和首次重试间隔(秒)，之后间隔逐次加倍
+FDFS_RETRIES = 2
+FDFS_RETRY_INTERVAL = 0.2
+# 接收上传文件时同时计算sha256，上传到FastDFS时按内容去重
+FILE_UPLOAD_HANDLERS = [
+    'utils.fastdfs.upload_handlers.HashingMemoryFileUploadHandler',
+    'utils.fastdfs.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
+# 文档下载由nginx通过X-Accel-Redirect从FastDFS读取，需要nginx配置对应的internal location，见deploy/nginx_conf
+DOC_DOWNLOAD_ACCEL = True
+DOC_ACCEL_REDIRECT_PREFIX = '/protected/fdfs/'
+
+# 本机的文档磁盘缓存，设为None关闭；总容量和单个文件上限，单位字节
+DOC_CACHE_DIR = os.path.join(BASE_DIR, 'doc_cache')
+DOC_CACHE_MAX_BYTES = 20 * 1024 ** 3
+DOC_CACHE_MAX_FILE_BYTES = 200 * 1024 ** 2
+# 开启DOC_DOWNLOAD_ACCEL时，命中缓存的文件由nginx的internal location发送，见deploy/nginx_conf
+DOC_CACHE_ACCEL_REDIRECT_PREFIX = '/protected/doc_cache/'
+
+# /img/<宽>x<高>/接口生成的缩略图缓存在本机磁盘，总容量单位字节；
+# 源图片从IMAGE_RESIZE_SOURCE_URL下载，/img/<宽>x<高>/media/...读取MEDIA_ROOT下的本机文件
+IMAGE_CACHE_DIR = os.path.join(BASE_DIR, 'image_cache')
+IMAGE_CACHE_MAX_BYTES = 5 * 1024 ** 3
+IMAGE_RESIZE_SOURCE_URL = FDFS_URL
+# 缓存命中后由nginx通过X-Accel-Redirect直接发送缓存文件，需要nginx配置对应的internal location，见deploy/nginx_conf
+IMAGE_RESIZE_ACCEL = True
+IMAGE_ACCEL_REDIRECT_PREFIX = '/protected/img/'
 
 FASTDFS_SERVER_DOMAIN = 'http://111.231.137.70:8888/'
 
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.7 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['is_delete', 'id'], name='idx_course_del_id'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.7 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0002_auto_20190725_1223'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doc',
+            index=models.Index(fields=['is_delete', 'id'], name='idx_docs_del_id'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0003_auto_20190725_1223'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='comment_count',
+            field=models.IntegerField(default=0, help_text='评论数', verbose_name='评论数'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.1.7 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_news_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['is_delete', 'tag', 'update_time', 'id'], name='idx_news_del_tag_time'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['is_delete', 'update_time', 'id'], name='idx_news_del_time'),
+        ),
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['news', 'is_delete', 'update_time'], name='idx_comm_news_del_time'),
+        ),
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['news', 'parent', 'is_delete', 'update_time', 'id'], name='idx_comm_news_parent_time'),
+        ),
+        migrations.AddIndex(
+            model_name='hotnews',
+            index=models.Index(fields=['is_delete', 'priority'], name='idx_hotnews_del_pri'),
+        ),
+        migrations.AddIndex(
+            model_name='banner',
+            index=models.Index(fields=['is_delete', 'priority', 'update_time', 'id'], name='idx_banner_del_pri'),
+        ),
+    ]
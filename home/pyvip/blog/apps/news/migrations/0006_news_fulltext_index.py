@@ -0,0 +1,20 @@
+# Generated by Django 2.1.7 on 2026-10-18 16:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    '''
+    elasticsearch熔断时的备用查询路径,ngram分词器需要MySQL 5.7.6以上,分词长度由ngram_token_size决定(默认2)
+    '''
+
+    dependencies = [
+        ('news', '0005_soft_delete_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='ALTER TABLE tb_news ADD FULLTEXT INDEX ft_news_title_digest_content (title, digest, content) WITH PARSER ngram',
+            reverse_sql='ALTER TABLE tb_news DROP INDEX ft_news_title_digest_content',
+        ),
+    ]
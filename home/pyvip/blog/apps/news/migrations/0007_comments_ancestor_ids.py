@@ -0,0 +1,33 @@
+# Generated by Django 2.1.7 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+def fill_ancestor_ids(apps, schema_editor):
+    '''
+    按id顺序回填,父评论总是先于回复创建,处理回复时父评论的祖先链已经算好
+    '''
+    Comments = apps.get_model('news', 'Comments')
+    parents = dict(Comments.objects.order_by('id').values_list('id', 'parent_id'))
+    ancestors = {}
+    for comment_id, parent_id in parents.items():
+        if parent_id:
+            ancestors[comment_id] = ancestors.get(parent_id, []) + [parent_id]
+    for comment_id, chain in ancestors.items():
+        Comments.objects.filter(id=comment_id).update(ancestor_ids=','.join(str(i) for i in chain))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_news_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comments',
+            name='ancestor_ids',
+            field=models.TextField(blank=True, default='', help_text='祖先评论id', verbose_name='祖先评论id'),
+        ),
+        migrations.RunPython(fill_ancestor_ids, migrations.RunPython.noop),
+    ]
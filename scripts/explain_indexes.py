@@ -0,0 +1,93 @@
+"""
+对各视图的主要查询执行EXPLAIN,检查是否用上了复合索引
+用法(在项目根目录下): python scripts/explain_indexes.py [--news-id 1] [--tag-id 1]
+"""
+import argparse
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
+
+import django
+
+django.setup()
+
+from django.db.models import Q, Count
+from django.utils import timezone
+
+from news import constants
+from news.models import News, Comments, HotNews, Banner
+from doc.models import Doc
+from course.models import Course
+
+
+def get_queries(news_id, tag_id):
+    """
+    :return: [(查询说明, 查询集, 期望使用的索引名)]
+    """
+    now = timezone.now()
+    per_page = constants.PER_PAGE_NEWS_COUNT + 1
+    return [
+        ('news.NewsListView 按标签分页',
+         News.objects.filter(is_delete=False, tag_id=tag_id).order_by('-update_time', '-id')[:per_page],
+         'idx_news_del_tag_time'),
+        ('news.NewsListView 按标签游标分页',
+         News.objects.filter(Q(update_time__lt=now) | Q(update_time=now, id__lt=news_id),
+                             is_delete=False, tag_id=tag_id).order_by('-update_time', '-id')[:per_page],
+         'idx_news_del_tag_time'),
+        ('news.NewsListView 全部新闻游标分页',
+         News.objects.filter(Q(update_time__lt=now) | Q(update_time=now, id__lt=news_id),
+                             is_delete=False).order_by('-update_time', '-id')[:per_page],
+         'idx_news_del_time'),
+        ('admin.NewsManageView 文章列表',
+         News.objects.filter(is_delete=False).order_by('-update_time', '-id')[:constants.PER_PAGE_NEWS_COUNT],
+         'idx_news_del_time'),
+        ('news.NewsDetailView 顶层评论游标分页',
+         Comments.objects.filter(is_delete=False, news_id=news_id, parent_id=None).order_by(
+             '-update_time', '-id')[:constants.PER_PAGE_COMMENTS_COUNT + 1],
+         'idx_comm_news_parent_time'),
+        ('news.CommentRepliesView 回复数统计',
+         Comments.objects.filter(is_delete=False, news_id=news_id, parent_id__in=[1, 2, 3]).values(
+             'parent_id').annotate(num=Count('id')).order_by(),
+         'idx_comm_news_parent_time'),
+        ('reconcile_comment_counts 评论数统计',
+         Comments.objects.filter(is_delete=False, news_id__in=[news_id]).values('news_id').annotate(
+             num=Count('id')).order_by(),
+         'idx_comm_news_del_time'),
+        ('news.IndexView 热门新闻',
+         HotNews.objects.filter(is_delete=False).order_by('priority'),
+         'idx_hotnews_del_pri'),
+        ('news.NewsBanner 轮播图',
+         Banner.objects.filter(is_delete=False)[:constants.SHOW_BANNER_COUNT],
+         'idx_banner_del_pri'),
+        ('doc.doc_index 文档列表',
+         Doc.objects.filter(is_delete=False).order_by('id'),
+         'idx_docs_del_id'),
+        ('course.course_list 课程列表',
+         Course.objects.filter(is_delete=False).order_by('id'),
+         'idx_course_del_id'),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--news-id', type=int, default=1)
+    parser.add_argument('--tag-id', type=int, default=1)
+    args = parser.parse_args()
+
+    missed = 0
+    for title, queryset, index_name in get_queries(args.news_id, args.tag_id):
+        plan = queryset.explain()
+        used = index_name in plan
+        missed += not used
+        print('[{}] {} (期望索引: {})'.format('OK' if used else 'MISS', title, index_name))
+        print(plan)
+        print()
+    # 数据量很小时优化器可能选择全表扫描,MISS需结合rows列判断
+    sys.exit(1 if missed else 0)
+
+
+if __name__ == '__main__':
+    main()
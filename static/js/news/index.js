@@ -141,8 +141,8 @@
 $(function () {
   // 新闻列表功能
   let $newsLi = $(".news-nav ul li");
-  let iPage = 1;  //默认第1页
-  let iTotalPage = 1; //默认总页数为1
+  let sCursor = '';  //游标,空字符串表示第1页
+  let bHasMore = true; //是否还有下一页
   let sCurrentTagId = 0; //默认分类标签为0
   let bIsLoadData = true;   // 是否正在向后台加载数据
 
@@ -159,8 +159,8 @@ $(function () {
     if (sClickTagId !== sCurrentTagId) {
             sCurrentTagId = sClickTagId;  // 记录当前分类id
             // 重置分页参数
-            iPage = 1;
-            iTotalPage = 1;
+            sCursor = '';
+            bHasMore = true;
             fn_load_content()
         }
   });
@@ -183,9 +183,8 @@ $(function () {
       // 判断页数，去更新新闻数据
       if (!bIsLoadData) {
         bIsLoadData = true;
-        // 如果当前页数据如果小于总页数，那么才去加载数据
-        if (iPage < iTotalPage) {
-          iPage += 1;
+        // 后端返回了下一页游标，才去加载数据
+        if (bHasMore) {
           $(".btn-more").remove();  // 删除标签
           // 去加载数据
           fn_load_content()
@@ -258,7 +257,7 @@ $(function () {
     // 创建请求参数
     let sDataParams = {
       "tag_id": sCurrentTagId,
-      "page": iPage
+      "cursor": sCursor
     };
 
     // 创建ajax请求
@@ -273,17 +272,29 @@ $(function () {
     })
       .done(function (res) {
         if (res.errno === "0") {
-          iTotalPage = res.data.total_pages;  // 后端传过来的总页数
-          if (iPage === 1) {
+          if (!sCursor) {
             $(".news-list").html("")
           }
+          // 后端传过来的下一页游标，为null表示已经是最后一页
+          sCursor = res.data.next_cursor;
+          bHasMore = sCursor !== null;
 
           res.data.news.forEach(function (one_news) {
             // alert(typeof (one_news.id))
+            // 有缩略图时由浏览器按缩略图宽度225px选择合适的WebP或JPEG
+            let thumbnail = `<img src="${one_news.image_url}" alt="${one_news.title}" title="${one_news.title}">`;
+            if (one_news.image_srcset) {
+              thumbnail = `
+                    <picture>
+                      <source type="image/webp" srcset="${one_news.image_srcset.webp}" sizes="225px">
+                      <img src="${one_news.image_url}" srcset="${one_news.image_srcset.jpeg}" sizes="225px"
+                           alt="${one_news.title}" title="${one_news.title}">
+                    </picture>`;
+            }
             let content = `
               <li class="news-item">
                  <a href="/news/${one_news.id}/" class="news-thumbnail" target="_blank">
-                    <img src="${one_news.image_url}" alt="${one_news.title}" title="${one_news.title}">
+                    ${thumbnail}
                  </a>
                  <div class="news-content">
                     <h4 class="news-title"><a href="/news/${one_news.id}/">${one_news.title}</a></h4>
@@ -325,15 +336,23 @@ $(function () {
           let content = ``;
           let tab_content = ``;
           res.data.banners.forEach(function (one_banner, index) {
+            // 有缩略图时由浏览器按轮播图宽度800px选择合适的WebP或JPEG
+            let banner_img = `<img src="${one_banner.image_url}" alt="${one_banner.news_title}">`;
+            if (one_banner.image_srcset) {
+              banner_img = `<picture>
+                  <source type="image/webp" srcset="${one_banner.image_srcset.webp}" sizes="800px">
+                  <img src="${one_banner.image_url}" srcset="${one_banner.image_srcset.jpeg}" sizes="800px"
+                       alt="${one_banner.news_title}"></picture>`;
+            }
             if (index === 0){
               content = `
                 <li style="display:block;"><a href="/news/${one_banner.news_id}/">
-                 <img src="${one_banner.image_url}" alt="${one_banner.news_title}"></a></li>
+                 ${banner_img}</a></li>
               `;
               tab_content = `<li class="active"></li>`;
             } else {
               content = `
-              <li><a href="/news/${one_banner.news_id}/"><img src="${one_banner.image_url}" alt="${one_banner.news_title}"></a></li>
+              <li><a href="/news/${one_banner.news_id}/">${banner_img}</a></li>
               `;
               tab_content = `<li></li>`;
             }
@@ -15,6 +15,12 @@ $(function () {
       $(this).parent().toggle();
     }
 
+    // 按需加载某条评论的回复
+    if (sClassValue.indexOf('reply_more_a_tag') >= 0) {
+      let $this = $(this);
+      fn_load_comments($this, $this.siblings('.reply-list'));
+    }
+
     if (sClassValue.indexOf('reply_btn') >= 0) {
       // 获取新闻id、评论id、评论内容
       let $this = $(this);
@@ -93,6 +99,92 @@ $(function () {
   });
 
 
+  // 加载更多顶层评论
+  $('.comment-more-btn').click(function () {
+    fn_load_comments($(this), $('.comment-list'));
+  });
+
+  // 从后端按游标获取下一页评论，追加到$list中
+  // $trigger上保存接口地址data-url和游标data-cursor，没有下一页时移除$trigger
+  function fn_load_comments($trigger, $list) {
+    if ($trigger.data('loading')) {
+      return
+    }
+    $trigger.data('loading', true);
+    $.ajax({
+      url: $trigger.attr('data-url'),
+      type: "GET",
+      data: {"cursor": $trigger.attr('data-cursor') || ''},
+      dataType: "json",
+    })
+      .done(function (res) {
+        if (res.errno === "0") {
+          res.data.comments.forEach(function (one_comment) {
+            $list.append(fn_comment_html(one_comment));
+          });
+          if (res.data.next_cursor) {
+            $trigger.attr('data-cursor', res.data.next_cursor);
+            if ($trigger.hasClass('reply_more_a_tag')) {
+              $trigger.text('更多回复');
+              // 把按钮移动到已加载回复的后面
+              $list.after($trigger);
+            }
+          } else {
+            $trigger.remove();
+          }
+        } else {
+          message.showError(res.errmsg);
+        }
+      })
+      .fail(function () {
+        message.showError('服务器超时，请重试！');
+      })
+      .always(function () {
+        $trigger.data('loading', false);
+      });
+  }
+
+  function fn_escape(sText) {
+    return $('<div>').text(sText === null || sText === undefined ? '' : String(sText)).html();
+  }
+
+  function fn_comment_html(one_comment) {
+    let html_comment = `
+          <li class="comment-item">
+            <div class="comment-info clearfix">
+              <img src="/static/images/avatar.jpeg" alt="avatar" class="comment-avatar">
+              <span class="comment-user">${fn_escape(one_comment.author)}</span>
+            </div>
+            <div class="comment-content">${fn_escape(one_comment.content)}</div>`;
+    if (one_comment.parent) {
+      html_comment += `
+            <div class="parent_comment_text">
+              <div class="parent_username">${fn_escape(one_comment.parent.author)}</div>
+              <br/>
+              <div class="parent_content_text">
+                ${fn_escape(one_comment.parent.content)}
+              </div>
+            </div>`;
+    }
+    html_comment += `
+            <div class="comment_time left_float">${one_comment.update_time}</div>
+            <a href="javascript:;" class="reply_a_tag right_float">回复</a>
+            <form class="reply_form left_float" comment-id="${one_comment.content_id}" news-id="${one_comment.news_id}">
+              <textarea class="reply_input"></textarea>
+              <input type="button" value="回复" class="reply_btn right_float">
+              <input type="reset" name="" value="取消" class="reply_cancel right_float">
+            </form>`;
+    if (one_comment.reply_count) {
+      html_comment += `
+            <a href="javascript:;" class="reply_more_a_tag"
+               data-url="/news/${one_comment.news_id}/comments/${one_comment.content_id}/replies/">查看回复(${one_comment.reply_count})</a>
+            <ul class="reply-list"></ul>`;
+    }
+    html_comment += `
+          </li>`;
+    return html_comment
+  }
+
   // 点击评论框，重定向到用户登录页面
   $loginComment.click(function () {
 
@@ -0,0 +1,35 @@
+$(function () {
+  // 搜索框输入提示
+  let $input = $('.search-control');
+  let $datalist = $('#search-suggest');
+  let sLastQuery = '';
+  let iTimer = null;
+
+  $input.on('input', function () {
+    clearTimeout(iTimer);
+    // 连续输入时只在停顿后请求一次
+    iTimer = setTimeout(fn_load_suggest, 150);
+  });
+
+  function fn_load_suggest() {
+    let sQuery = $.trim($input.val());
+    if (!sQuery || sQuery === sLastQuery) {
+      return
+    }
+    sLastQuery = sQuery;
+    $.ajax({
+      url: $input.data('url'),
+      type: 'GET',
+      data: {'q': sQuery},
+      dataType: 'json'
+    })
+      .done(function (res) {
+        if (res.errno === '0' && sQuery === sLastQuery) {
+          $datalist.empty();
+          res.data.suggestions.forEach(function (one_suggest) {
+            $('<option>').attr('value', one_suggest.title).appendTo($datalist);
+          });
+        }
+      });
+  }
+});
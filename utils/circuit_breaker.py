@@ -0,0 +1,82 @@
+"""
+熔断器,状态保存在redis中,所有uwsgi进程共享
+1.关闭: 正常调用,窗口期内失败次数达到阈值后打开
+2.打开: 冷却期内不再调用,直接走降级逻辑
+3.半开: 冷却期结束后只放行一个探测请求,成功则关闭,失败则重新打开
+redis不可用时按关闭处理,不影响正常调用
+"""
+import logging
+
+logger = logging.getLogger('django')
+
+
+class CircuitBreaker(object):
+    def __init__(self, get_con, name, failure_threshold=5, window=60, cooldown=30, probe_timeout=10):
+        """
+        :param get_con: 返回redis连接的函数
+        :param name: 区分不同的熔断器
+        :param window: 统计失败次数的窗口,单位秒
+        :param cooldown: 打开后的冷却时间,单位秒
+        :param probe_timeout: 半开时探测请求的最长占用时间,超时后允许下一个请求探测
+        """
+        self.get_con = get_con
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self.failures_key = 'circuit_{}_failures'.format(name)
+        self.open_key = 'circuit_{}_open'.format(name)
+        self.tripped_key = 'circuit_{}_tripped'.format(name)
+        self.probe_key = 'circuit_{}_probe'.format(name)
+
+    def allow(self):
+        """
+        :return: 是否可以调用被保护的服务
+        """
+        try:
+            con = self.get_con()
+            pl = con.pipeline()
+            pl.exists(self.open_key)
+            pl.exists(self.tripped_key)
+            is_open, tripped = pl.execute()
+            if is_open:
+                return False
+            if tripped:
+                return bool(con.set(self.probe_key, 1, ex=self.probe_timeout, nx=True))
+            return True
+        except Exception as e:
+            logger.error('读取熔断器{}状态异常:\n{}'.format(self.name, e))
+            return True
+
+    def record_success(self):
+        try:
+            con = self.get_con()
+            if con.exists(self.tripped_key):
+                logger.info('熔断器{}探测成功,恢复调用'.format(self.name))
+            con.delete(self.failures_key, self.tripped_key, self.probe_key)
+        except Exception as e:
+            logger.error('更新熔断器{}状态异常:\n{}'.format(self.name, e))
+
+    def record_failure(self):
+        try:
+            con = self.get_con()
+            if con.exists(self.tripped_key):
+                self._open(con)
+                return
+            pl = con.pipeline()
+            pl.incr(self.failures_key)
+            pl.expire(self.failures_key, self.window)
+            failures, _ = pl.execute()
+            if failures >= self.failure_threshold:
+                self._open(con)
+        except Exception as e:
+            logger.error('更新熔断器{}状态异常:\n{}'.format(self.name, e))
+
+    def _open(self, con):
+        logger.error('熔断器{}打开,{}秒内不再调用'.format(self.name, self.cooldown))
+        pl = con.pipeline()
+        pl.set(self.open_key, 1, ex=self.cooldown)
+        pl.set(self.tripped_key, 1)
+        pl.delete(self.failures_key, self.probe_key)
+        pl.execute()
@@ -0,0 +1,43 @@
+import base64
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def datetime_to_micros(dt):
+    """
+    将带时区的时间转换为整数微秒时间戳,避免浮点误差
+    """
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def micros_to_datetime(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def encode_cursor(dt, pk):
+    """
+    :param dt: 排序时间字段(update_time)
+    :param pk: 主键id,时间相同时保证顺序唯一
+    :return: url安全的游标字符串
+    """
+    raw = '{}_{}'.format(datetime_to_micros(dt), pk).encode('utf8')
+    return base64.urlsafe_b64encode(raw).decode('utf8').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    :param token: encode_cursor生成的游标
+    :return: (datetime, pk),游标不合法返回None
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        micros, pk = base64.urlsafe_b64decode(padded.encode('utf8')).decode('utf8').split('_')
+        return micros_to_datetime(int(micros)), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
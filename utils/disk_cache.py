@@ -0,0 +1,188 @@
+"""
+本机磁盘上按内容寻址的LRU文件缓存,同一台机器的多个uwsgi进程共享
+目录结构:
+    blobs/ab/<内容sha256>   文件内容,相同内容只保存一份
+    keys/cd/<key的sha256>   指向blob的硬链接
+    locks/cde.lock          按key分成4096组的文件锁,同一组的未命中只有一个进程下载
+    tmp/                    下载中的临时文件
+    usage                   所有blob的总字节数和文件数,写入新blob时累加
+命中时更新blob的mtime,总字节数超过容量时才扫描目录,按mtime从旧到新淘汰到容量的EVICT_RATIO
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import time
+
+# 淘汰到容量的这个比例,留出余量,避免每次写入都要扫描
+EVICT_RATIO = 0.9
+# 等待文件锁时的轮询间隔,单位秒
+LOCK_POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    """
+    同一组的其他key下载太久,调用方不经过缓存直接读取源文件
+    """
+
+
+class DiskCache(object):
+    def __init__(self, path, max_bytes, lock_timeout=10):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        # 最近一次写入或淘汰后的(总字节数, 文件数)
+        self.usage = None
+        for name in ('blobs', 'keys', 'locks', 'tmp'):
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+        self._usage_path = os.path.join(path, 'usage')
+        if not os.path.exists(self._usage_path):
+            # 第一次使用或从旧版本升级,扫描一次得到准确的占用
+            self.usage = self.evict() or self.usage
+
+    def _key_path(self, digest):
+        return os.path.join(self.path, 'keys', digest[:2], digest)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, 'blobs', digest[:2], digest)
+
+    def _open_key(self, key_path):
+        try:
+            f = open(key_path, 'rb')
+        except FileNotFoundError:
+            return None
+        os.utime(f.fileno())
+        return f
+
+    def lookup(self, key):
+        """
+        只查找不下载
+        :return: 命中时返回已打开的文件,否则返回None
+        """
+        return self._open_key(self._key_path(hashlib.sha256(key.encode('utf8')).hexdigest()))
+
+    def _lock(self, lock):
+        deadline = time.time() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    raise LockTimeout(lock.name)
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def open(self, key, fetch):
+        """
+        1.命中时直接打开缓存文件
+        2.未命中时持有该组的文件锁再检查一次,其他进程已经写入则直接使用(合并并发的未命中)
+        3.否则调用fetch()边下载边计算sha256,写入blob后为key建立硬链接,总字节数超过容量时淘汰
+        返回的是已打开的文件,之后即使被其他进程淘汰也能读完
+        :param fetch: 返回bytes迭代器的函数,抛出的异常原样向上抛出
+        :return: (文件对象, 是否命中)
+        :raise LockTimeout: 等待同组的下载超过lock_timeout秒
+        """
+        digest = hashlib.sha256(key.encode('utf8')).hexdigest()
+        key_path = self._key_path(digest)
+        f = self._open_key(key_path)
+        if f:
+            return f, True
+
+        lock_path = os.path.join(self.path, 'locks', '{}.lock'.format(digest[:3]))
+        with open(lock_path, 'a') as lock:
+            self._lock(lock)
+            f = self._open_key(key_path)
+            if f:
+                return f, True
+            added = self._fill(key_path, fetch)
+            f = open(key_path, 'rb')
+        if added:
+            self.usage = self._add_usage(added, 1)
+            if self.usage[0] > self.max_bytes:
+                self.usage = self.evict() or self.usage
+        return f, False
+
+    def _fill(self, key_path, fetch):
+        """
+        :return: 新增blob的字节数,内容与已有blob相同时为0
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.path, 'tmp'))
+        try:
+            content_hash = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in fetch():
+                    content_hash.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            blob_path = self._blob_path(content_hash.hexdigest())
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.makedirs(os.path.dirname(key_path), exist_ok=True)
+            try:
+                # 内容相同的blob已存在时共用它,不能覆盖,否则已有的硬链接会指向旧文件
+                os.utime(blob_path)
+                os.link(blob_path, key_path)
+                return 0
+            except FileNotFoundError:
+                os.rename(tmp_path, blob_path)
+                os.link(blob_path, key_path)
+                return size
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _add_usage(self, size, count):
+        """
+        在usage文件上加锁累加
+        :return: 累加后的(总字节数, 文件数)
+        """
+        with open(self._usage_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            total, files = (int(value) for value in (f.read().split() or (0, 0)))
+            total, files = total + size, files + count
+            f.seek(0)
+            f.truncate()
+            f.write('{} {}'.format(total, files))
+        return total, files
+
+    def _scan(self, name):
+        root = os.path.join(self.path, name)
+        for sub in os.listdir(root):
+            sub_path = os.path.join(root, sub)
+            for entry in os.scandir(sub_path):
+                yield entry
+
+    def evict(self):
+        """
+        扫描全部blob,超过容量时淘汰到容量的EVICT_RATIO,并用扫描结果校正usage文件
+        同一时间只有一个进程扫描,其他进程跳过
+        :return: (淘汰后的总字节数, 文件数),正在被其他进程扫描时返回None
+        """
+        with open(os.path.join(self.path, 'evict.lock'), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            # 扫描期间其他进程写入的blob不一定被扫到,结束时把这段时间的增量加回去
+            start_total, start_files = self._add_usage(0, 0)
+            blobs = []
+            for entry in self._scan('blobs'):
+                stat = entry.stat()
+                blobs.append((stat.st_mtime, stat.st_size, stat.st_ino, entry.path))
+            total = sum(blob[1] for blob in blobs)
+            count = len(blobs)
+            if total > self.max_bytes:
+                keys_by_inode = {}
+                for entry in self._scan('keys'):
+                    keys_by_inode.setdefault(entry.inode(), []).append(entry.path)
+                blobs.sort()
+                for _, size, inode, blob_path in blobs:
+                    if total <= self.max_bytes * EVICT_RATIO:
+                        break
+                    for key_path in keys_by_inode.get(inode, []):
+                        os.unlink(key_path)
+                    os.unlink(blob_path)
+                    total -= size
+                    count -= 1
+            return self._add_usage(total - start_total, count - start_files)
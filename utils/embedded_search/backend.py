@@ -0,0 +1,125 @@
+"""
+haystack后端: 进程内的倒排索引,不依赖elasticsearch
+配置示例:
+    HAYSTACK_CONNECTIONS = {
+        'embedded': {
+            'ENGINE': 'utils.embedded_search.backend.EmbeddedSearchEngine',
+            'PATH': os.path.join(BASE_DIR, 'search_index'),
+        },
+    }
+"""
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_text
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, SearchNode, log_query
+from haystack.constants import ID, DJANGO_CT, DJANGO_ID
+from haystack.inputs import InputType
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+
+from .index import InvertedIndex
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path, **options):
+    """
+    同一进程内每个索引目录只打开一次,mmap在线程间共享
+    """
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = InvertedIndex(path, **options)
+        return _indexes[path]
+
+
+class EmbeddedSearchBackend(BaseSearchBackend):
+    def __init__(self, connection_alias, **connection_options):
+        super(EmbeddedSearchBackend, self).__init__(connection_alias, **connection_options)
+        if not connection_options.get('PATH'):
+            raise ImproperlyConfigured("You must specify a 'PATH' in your settings for connection '%s'." % connection_alias)
+        self.inverted_index = get_index(connection_options['PATH'],
+                                        max_segments=connection_options.get('MAX_SEGMENTS', 8))
+
+    def update(self, index, iterable, commit=True):
+        """
+        文档字段(use_template的text)用于分词,其余字段原样存储,查询结果直接返回,不必再查数据库
+        """
+        content_field = index.get_content_field()
+        docs = []
+        for obj in iterable:
+            prepared = index.full_prepare(obj)
+            stored = {key: value for key, value in prepared.items() if key not in (content_field, ID)}
+            docs.append((get_identifier(obj), prepared.get(content_field) or '', stored))
+        self.inverted_index.update(docs)
+
+    def remove(self, obj_or_string, commit=True):
+        self.inverted_index.remove([get_identifier(obj_or_string)])
+
+    def clear(self, models=None, commit=True):
+        if not models:
+            self.inverted_index.clear()
+            return
+        prefixes = tuple('{}.'.format(get_model_ct(model)) for model in models)
+        self.inverted_index.clear(accept=lambda identifier: identifier.startswith(prefixes))
+
+    @log_query
+    def search(self, query_string, **kwargs):
+        if not query_string or query_string == '*':
+            return {'results': [], 'hits': 0}
+
+        accept = None
+        models = kwargs.get('models')
+        if models:
+            prefixes = tuple('{}.'.format(get_model_ct(model)) for model in models)
+            accept = lambda identifier: identifier.startswith(prefixes)
+
+        start = kwargs.get('start_offset', 0)
+        end = kwargs.get('end_offset')
+        hits, rows = self.inverted_index.search(query_string, start, end, accept)
+
+        result_class = kwargs.get('result_class') or SearchResult
+        results = []
+        for _, score, stored in rows:
+            app_label, model_name = stored.pop(DJANGO_CT).split('.')
+            results.append(result_class(app_label, model_name, stored.pop(DJANGO_ID), score, **stored))
+        return {'results': results, 'hits': hits}
+
+    def prep_value(self, value):
+        return force_text(value)
+
+    def more_like_this(self, model_instance, additional_query_string=None, **kwargs):
+        return {'results': [], 'hits': 0}
+
+
+class EmbeddedSearchQuery(BaseSearchQuery):
+    """
+    不支持字段过滤和布尔语法,所有条件的值拼接后统一分词,按全部词命中处理
+    """
+    def build_query(self):
+        if not self.query_filter:
+            return '*'
+        return self._build_sub_query(self.query_filter)
+
+    def _build_sub_query(self, search_node):
+        terms = []
+        for child in search_node.children:
+            if isinstance(child, SearchNode):
+                terms.append(self._build_sub_query(child))
+            else:
+                value = child[1]
+                if isinstance(value, InputType):
+                    value = value.query_string
+                terms.append(force_text(value))
+        return ' '.join(terms)
+
+    def build_query_fragment(self, field, filter_type, value):
+        if isinstance(value, InputType):
+            value = value.query_string
+        return force_text(value)
+
+
+class EmbeddedSearchEngine(BaseEngine):
+    backend = EmbeddedSearchBackend
+    query = EmbeddedSearchQuery
@@ -0,0 +1,480 @@
+"""
+基于磁盘文件的倒排索引,查询时通过mmap读取,不把倒排表加载进内存
+
+目录结构:
+    manifest.json       当前生效的段列表、各段已删除的文档号,写入时整体替换
+    <段名>.terms         词典: 有序词表、每个词的文档频率和倒排表偏移
+    <段名>.post          倒排表: 每个词依次存文档号(升序,uint32)、词频(uint32)、BM25词频权重(float32)
+    <段名>.docs          文档标识、文档长度、存储字段偏移
+    <段名>.store         存储字段,每个文档一段json
+
+BM25中与文档长度相关的部分在写入段时算好,查询时只需乘以idf再相加
+增量更新时新文档写入新的小段,旧版本在原段中标记删除;
+段数超过上限时合并较小的段,删除比例过高的段也一并合并,合并时按新的平均长度重新计算权重
+"""
+import bisect
+import fcntl
+import heapq
+import json
+import marshal
+import math
+import mmap
+import operator
+import os
+from array import array
+from collections import Counter, defaultdict
+from itertools import repeat
+
+from .tokenizer import tokenize, is_single_cjk
+
+MANIFEST = 'manifest.json'
+LOCK = 'write.lock'
+
+# BM25参数
+K1 = 1.2
+B = 0.75
+
+# 候选文档数乘以该值仍小于倒排表长度时,用二分查找代替遍历倒排表
+LOOKUP_RATIO = 16
+
+# 文档频率超过该比例的词视为高频词(类似停用词),查询中还有其他词时忽略高频词
+COMMON_TERM_RATIO = 0.3
+
+# 单个汉字最多扩展的二元组数,按文档频率从高到低保留(与elasticsearch前缀查询的max_expansions相同)
+MAX_EXPANSIONS = 50
+
+
+def _load_array(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    return values
+
+
+def _replace(path, data):
+    tmp = '{}.tmp'.format(path)
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def tf_weight(tf, length, avgdl):
+    return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avgdl))
+
+
+class Segment(object):
+    """
+    只读段,倒排表和存储字段通过mmap按需读取
+    """
+    def __init__(self, path, name):
+        self.name = name
+        base = os.path.join(path, name)
+        with open(base + '.terms', 'rb') as f:
+            self.terms, dfs, offsets = marshal.load(f)
+        self.dfs = _load_array('I', dfs)
+        self.offsets = _load_array('Q', offsets)
+        with open(base + '.docs', 'rb') as f:
+            self.ids, lengths, store_offsets = marshal.load(f)
+        self.lengths = _load_array('I', lengths)
+        self.store_offsets = _load_array('Q', store_offsets)
+        self.total_length = sum(self.lengths)
+        self._post_map = self._map(base + '.post')
+        self._store_map = self._map(base + '.store')
+        self.postings = memoryview(self._post_map).cast('I')
+        self.weights = memoryview(self._post_map).cast('f')
+        self.store = memoryview(self._store_map)
+
+    @staticmethod
+    def _map(filename):
+        with open(filename, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _find(self, term):
+        i = bisect.bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            return i
+        return None
+
+    def doc_freq(self, term):
+        i = self._find(term)
+        return 0 if i is None else self.dfs[i]
+
+    def get_postings(self, term):
+        """
+        :return: (文档号序列, 词频序列, 权重序列),词不存在时返回None
+        """
+        i = self._find(term)
+        if i is None:
+            return None
+        start, df = self.offsets[i], self.dfs[i]
+        return (self.postings[start:start + df], self.postings[start + df:start + 2 * df],
+                self.weights[start + 2 * df:start + 3 * df])
+
+    def prefix_terms(self, prefix):
+        i = bisect.bisect_left(self.terms, prefix)
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            yield self.terms[i]
+            i += 1
+
+    def get_stored(self, docnum):
+        start, end = self.store_offsets[docnum], self.store_offsets[docnum + 1]
+        return json.loads(bytes(self.store[start:end]).decode('utf8'))
+
+    def close(self):
+        # 仍有查询持有倒排表切片时无法关闭,交给垃圾回收
+        try:
+            for view in (self.postings, self.weights, self.store):
+                view.release()
+            for mapped in (self._post_map, self._store_map):
+                if mapped:
+                    mapped.close()
+        except BufferError:
+            pass
+
+
+def write_segment(path, name, docs, avgdl=None):
+    """
+    :param docs: [(文档标识, 词频Counter, 存储字段dict)],文档号即列表下标
+    :param avgdl: 整个索引的平均文档长度,为None时按本段计算
+    """
+    inverted = defaultdict(list)
+    ids = []
+    lengths = array('I')
+    store = bytearray()
+    store_offsets = array('Q', [0])
+    for docnum, (identifier, counts, stored) in enumerate(docs):
+        ids.append(identifier)
+        lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            inverted[term].append((docnum, tf))
+        store += json.dumps(stored, ensure_ascii=False, default=str).encode('utf8')
+        store_offsets.append(len(store))
+    if not avgdl:
+        avgdl = sum(lengths) / len(lengths) if lengths else 1
+    _write_files(path, name, sorted(inverted.items()), ids, lengths, store, store_offsets, avgdl)
+
+
+def _write_files(path, name, postings, ids, lengths, store, store_offsets, avgdl):
+    """
+    :param postings: 按词排序的[(词, [(文档号, 词频)])]
+    """
+    terms = []
+    dfs = array('I')
+    offsets = array('Q')
+    post = array('I')
+    for term, plist in postings:
+        terms.append(term)
+        dfs.append(len(plist))
+        offsets.append(len(post))
+        post.extend(docnum for docnum, _ in plist)
+        post.extend(tf for _, tf in plist)
+        weights = array('f', (tf_weight(tf, lengths[docnum], avgdl) for docnum, tf in plist))
+        post.frombytes(weights.tobytes())
+    base = os.path.join(path, name)
+    _replace(base + '.post', post.tobytes())
+    _replace(base + '.store', bytes(store))
+    _replace(base + '.terms', marshal.dumps((terms, dfs.tobytes(), offsets.tobytes())))
+    _replace(base + '.docs', marshal.dumps((ids, lengths.tobytes(), store_offsets.tobytes())))
+
+
+def merge_segments(path, name, segments, deleted):
+    """
+    逐个词合并多个段的倒排表,跳过已删除文档并重新编号
+    """
+    ids = []
+    lengths = array('I')
+    store = bytearray()
+    store_offsets = array('Q', [0])
+    remaps = []
+    for segment in segments:
+        dead = deleted.get(segment.name, set())
+        remap = array('l')
+        for docnum in range(len(segment)):
+            if docnum in dead:
+                remap.append(-1)
+                continue
+            remap.append(len(ids))
+            ids.append(segment.ids[docnum])
+            lengths.append(segment.lengths[docnum])
+            start, end = segment.store_offsets[docnum], segment.store_offsets[docnum + 1]
+            store += segment.store[start:end]
+            store_offsets.append(len(store))
+        remaps.append(remap)
+    avgdl = sum(lengths) / len(lengths) if lengths else 1
+
+    def merged_postings():
+        last = None
+        for term in heapq.merge(*[segment.terms for segment in segments]):
+            if term == last:
+                continue
+            last = term
+            plist = []
+            for segment, remap in zip(segments, remaps):
+                found = segment.get_postings(term)
+                if found is None:
+                    continue
+                for docnum, tf in zip(found[0], found[1]):
+                    if remap[docnum] >= 0:
+                        plist.append((remap[docnum], tf))
+            if plist:
+                yield term, plist
+    _write_files(path, name, merged_postings(), ids, lengths, store, store_offsets, avgdl)
+
+
+class InvertedIndex(object):
+    """
+    一个索引目录,同一进程内共享;写操作用文件锁互斥,读操作在manifest被替换后自动重新加载
+    """
+    def __init__(self, path, max_segments=8, merge_deleted_ratio=0.3):
+        self.path = path
+        self.max_segments = max_segments
+        self.merge_deleted_ratio = merge_deleted_ratio
+        self.segments = []
+        self.deleted = {}
+        self.total_docs = 0
+        self.total_length = 0
+        self._segment_cache = {}
+        self._version = None
+        os.makedirs(path, exist_ok=True)
+
+    # ---------- 读 ----------
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST), 'rb') as f:
+                return json.loads(f.read().decode('utf8'))
+        except FileNotFoundError:
+            return {'segments': [], 'deleted': {}, 'next_segment': 1}
+
+    def refresh(self):
+        """
+        manifest变化时重新加载,未变化的段复用已打开的mmap
+        """
+        try:
+            stat = os.stat(os.path.join(self.path, MANIFEST))
+            # manifest每次都是整体替换,inode变化即有新版本
+            version = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            version = None
+        if version == self._version:
+            return
+        manifest = self._read_manifest()
+        segments = []
+        for name in manifest['segments']:
+            if name not in self._segment_cache:
+                self._segment_cache[name] = Segment(self.path, name)
+            segments.append(self._segment_cache[name])
+        for name in set(self._segment_cache) - set(manifest['segments']):
+            self._segment_cache.pop(name).close()
+        self.segments = segments
+        self.deleted = {name: set(docnums) for name, docnums in manifest['deleted'].items()}
+        self.total_docs = sum(len(s) - len(self.deleted.get(s.name, ())) for s in segments)
+        self.total_length = sum(s.total_length for s in segments)
+        self._version = version
+
+    def __len__(self):
+        self.refresh()
+        return self.total_docs
+
+    def _expand(self, tokens):
+        """
+        索引中中文是二元组,查询单个汉字时扩展为以该字开头的二元组
+        """
+        groups = []
+        for token in dict.fromkeys(tokens):
+            if is_single_cjk(token):
+                terms = {t for s in self.segments for t in s.prefix_terms(token)}
+                terms.add(token)
+                df = {t: sum(s.doc_freq(t) for s in self.segments) for t in terms}
+                groups.append(sorted(terms, key=df.get, reverse=True)[:MAX_EXPANSIONS])
+            else:
+                groups.append([token])
+        return groups
+
+    def search(self, query, start=0, end=None, accept=None):
+        """
+        BM25打分,要求文档包含查询的每个非高频词(单字扩展出的多个词命中其一即可)
+        :param accept: 按文档标识过滤的函数
+        :return: (命中数, [(文档标识, 分数, 存储字段)])
+        """
+        self.refresh()
+        groups = self._expand(tokenize(query))
+        if not groups or not self.total_docs:
+            return 0, []
+
+        weighted = []
+        for terms in groups:
+            df = sum(s.doc_freq(term) for s in self.segments for term in terms)
+            if not df:
+                return 0, []
+            # 已删除文档仍计入文档频率,不能超过文档总数
+            df = min(df, self.total_docs)
+            weighted.append((df, math.log(1 + (self.total_docs - df + 0.5) / (df + 0.5)), terms))
+        # 先处理文档频率最低的词,候选集最小
+        weighted.sort(key=lambda w: w[0])
+        # 高频词的idf接近0,对排序几乎没有影响,却要遍历最长的倒排表
+        rare = [w for w in weighted if w[0] <= self.total_docs * COMMON_TERM_RATIO]
+        weighted = rare or weighted[:1]
+
+        hits = 0
+        top = []
+        for segment in self.segments:
+            count, scored = self._search_segment(segment, weighted, end, accept)
+            hits += count
+            top.extend((score, docnum, segment) for score, docnum in scored)
+        top = heapq.nlargest(len(top) if end is None else end, top, key=lambda t: t[0])[start:]
+        return hits, [(segment.ids[docnum], score, segment.get_stored(docnum)) for score, docnum, segment in top]
+
+    def _search_segment(self, segment, weighted, end, accept):
+        """
+        每个词先取出{文档号: 权重},用dict/set在C层求交集,只对最终命中的文档计算总分
+        :return: (命中数, [(分数, 文档号)]前end个)
+        """
+        candidates = None
+        partials = []
+        for _, idf, terms in weighted:
+            postings = [p for p in (segment.get_postings(term) for term in terms) if p is not None]
+            if not postings:
+                return 0, []
+            weights = {}
+            size = sum(len(p[0]) for p in postings)
+            for docnums, _, term_weights in postings:
+                if candidates is not None and len(candidates) * LOOKUP_RATIO < size:
+                    weights.update(self._lookup(docnums, term_weights, candidates))
+                else:
+                    weights.update(zip(docnums, term_weights))
+            if candidates is None:
+                candidates = weights.keys() - self.deleted.get(segment.name, ())
+            else:
+                candidates &= weights.keys()
+            if not candidates:
+                return 0, []
+            partials.append((idf, weights))
+
+        if accept is not None:
+            candidates = {d for d in candidates if accept(segment.ids[d])}
+        if len(partials) == 1:
+            # 只有一个词时idf相同,按权重排序即可
+            idf, weights = partials[0]
+            top = heapq.nlargest(len(candidates) if end is None else end, candidates, key=weights.__getitem__)
+            return len(candidates), [(idf * weights[d], d) for d in top]
+        # 用map/operator逐词累加,避免逐个文档调用python函数
+        docnums = list(candidates)
+        totals = repeat(0.0)
+        for idf, weights in partials:
+            totals = map(operator.add, totals, map(operator.mul, repeat(idf), map(weights.__getitem__, docnums)))
+        scores = dict(zip(docnums, totals))
+        top = heapq.nlargest(len(docnums) if end is None else end, docnums, key=scores.__getitem__)
+        return len(docnums), [(scores[d], d) for d in top]
+
+    @staticmethod
+    def _lookup(docnums, term_weights, wanted):
+        for docnum in wanted:
+            i = bisect.bisect_left(docnums, docnum)
+            if i < len(docnums) and docnums[i] == docnum:
+                yield docnum, term_weights[i]
+
+    # ---------- 写 ----------
+
+    def _locked(self):
+        lock = open(os.path.join(self.path, LOCK), 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _commit(self, manifest):
+        _replace(os.path.join(self.path, MANIFEST), json.dumps(manifest).encode('utf8'))
+        self.refresh()
+
+    def _mark_deleted(self, manifest, identifiers):
+        identifiers = set(identifiers)
+        for segment in self.segments:
+            dead = manifest['deleted'].setdefault(segment.name, [])
+            dead_set = set(dead)
+            dead.extend(i for i, ident in enumerate(segment.ids) if ident in identifiers and i not in dead_set)
+
+    def update(self, docs):
+        """
+        :param docs: [(文档标识, 文本, 存储字段dict)],已存在的文档先标记删除再写入新段
+        """
+        docs = list({identifier: (identifier, text, stored) for identifier, text, stored in docs}.values())
+        if not docs:
+            return
+        with self._locked():
+            self.refresh()
+            manifest = self._read_manifest()
+            self._mark_deleted(manifest, [identifier for identifier, _, _ in docs])
+            name = 'seg_{:06d}'.format(manifest['next_segment'])
+            manifest['next_segment'] += 1
+            doc_count = sum(len(s) for s in self.segments)
+            avgdl = self.total_length / doc_count if doc_count else None
+            write_segment(self.path, name, [(i, Counter(tokenize(text)), stored) for i, text, stored in docs], avgdl)
+            manifest['segments'].append(name)
+            self._commit(manifest)
+            self._maybe_merge()
+
+    def remove(self, identifiers):
+        with self._locked():
+            self.refresh()
+            manifest = self._read_manifest()
+            self._mark_deleted(manifest, identifiers)
+            self._commit(manifest)
+
+    def clear(self, accept=None):
+        """
+        :param accept: 只删除标识满足条件的文档,为None时清空整个索引
+        """
+        if accept is not None:
+            self.refresh()
+            self.remove([ident for segment in self.segments for ident in segment.ids if accept(ident)])
+            return
+        with self._locked():
+            manifest = self._read_manifest()
+            self._commit({'segments': [], 'deleted': {}, 'next_segment': manifest['next_segment']})
+            self._remove_files(manifest['segments'])
+
+    def _maybe_merge(self):
+        segments = sorted(self.segments, key=len)
+        dirty = [s for s in segments if len(s) and len(self.deleted.get(s.name, ())) / len(s) > self.merge_deleted_ratio]
+        small = segments[:max(len(segments) - self.max_segments + 1, 0)]
+        to_merge = list({s.name: s for s in small + dirty}.values())
+        if len(to_merge) > 1 or dirty:
+            self._merge(to_merge)
+
+    def optimize(self):
+        """
+        把全部段合并为一个,清除已删除文档
+        """
+        with self._locked():
+            self.refresh()
+            if len(self.segments) > 1 or any(self.deleted.values()):
+                self._merge(list(self.segments))
+
+    def _merge(self, segments):
+        """
+        调用方已持有写锁
+        """
+        manifest = self._read_manifest()
+        name = 'seg_{:06d}'.format(manifest['next_segment'])
+        manifest['next_segment'] += 1
+        merge_segments(self.path, name, segments, self.deleted)
+        names = {s.name for s in segments}
+        manifest['segments'] = [n for n in manifest['segments'] if n not in names] + [name]
+        for n in names:
+            manifest['deleted'].pop(n, None)
+        self._commit(manifest)
+        self._remove_files(names)
+
+    def _remove_files(self, names):
+        # 其他进程已映射的文件删除后仍可读,直到它们重新加载manifest
+        for name in names:
+            for ext in ('.terms', '.post', '.docs', '.store'):
+                try:
+                    os.remove(os.path.join(self.path, name + ext))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,10 @@
+from django.conf import settings
+from haystack.routers import BaseRouter
+
+
+class FailoverRouter(BaseRouter):
+    """
+    写入时同时更新备用连接,读取仍走默认连接,由SearchView在默认连接异常时切换
+    """
+    def for_write(self, **hints):
+        return getattr(settings, 'SEARCH_FAILOVER_CONNECTION', None)
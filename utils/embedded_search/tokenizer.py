@@ -0,0 +1,31 @@
+import re
+import unicodedata
+
+CJK_CHARS = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+TOKEN_RE = re.compile('[{}]+|[0-9a-z]+'.format(CJK_CHARS))
+CJK_RE = re.compile('[{}]'.format(CJK_CHARS))
+
+
+def normalize(text):
+    """
+    全角转半角、统一大小写
+    """
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def tokenize(text):
+    """
+    中文按相邻两字切分(二元组),只有一个字时保留单字;英文和数字按整个单词
+    例: 'Python爬虫入门' -> ['python', '爬虫', '虫入', '入门']
+    """
+    tokens = []
+    for run in TOKEN_RE.findall(normalize(text)):
+        if CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def is_single_cjk(token):
+    return len(token) == 1 and CJK_RE.match(token) is not None
@@ -1,4 +1,75 @@
-from fdfs_client.client import Fdfs_client
+import hashlib
+import logging
 
-FDFS_Client = Fdfs_client('utils/fastdfs/client.conf')
+from django_redis import get_redis_connection
 
+from utils.fastdfs.storage import upload_storage
+
+logger = logging.getLogger('django')
+
+# '<内容sha256>.<扩展名>' -> upload_storage中的文件名
+DEDUPE_KEY = 'upload_file_ids'
+# 去重累计节省的字节数
+SAVED_BYTES_KEY = 'upload_saved_bytes'
+
+
+def get_con():
+    return get_redis_connection(alias='default')
+
+
+def _sha256(uploaded_file):
+    """
+    HashingUploadHandler已在接收时计算过的直接使用，否则按块读取计算
+    """
+    digest = getattr(uploaded_file, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _duplicate(name, size):
+    try:
+        get_con().incrby(SAVED_BYTES_KEY, size)
+    except Exception as e:
+        logger.error('记录去重节省空间异常:\n{}'.format(e))
+    return upload_storage.url(name), size
+
+
+def upload_file(uploaded_file, ext_name):
+    """
+    1.按内容的sha256和扩展名去重，已上传过时直接返回已有文件的url，不再上传
+    2.否则通过upload_storage保存并记录sha256 -> 文件名，redis异常时只上传不去重
+    3.并发上传相同内容时只保留先记录的一份，删除多保存的文件
+    :param uploaded_file: request.FILES中的文件
+    :return: (文件url, 去重节省的字节数)
+    """
+    field = '{}.{}'.format(_sha256(uploaded_file), ext_name.lower())
+    try:
+        con = get_con()
+        name = con.hget(DEDUPE_KEY, field)
+    except Exception as e:
+        logger.error('读取上传去重索引异常:\n{}'.format(e))
+        con, name = None, None
+    if name:
+        return _duplicate(name.decode('utf8'), uploaded_file.size)
+
+    name = upload_storage.save('upload.' + ext_name, uploaded_file)
+    if con is None:
+        return upload_storage.url(name), 0
+    try:
+        if not con.hsetnx(DEDUPE_KEY, field, name):
+            upload_storage.delete(name)
+            return _duplicate(con.hget(DEDUPE_KEY, field).decode('utf8'), uploaded_file.size)
+    except Exception as e:
+        logger.error('写入上传去重索引异常:\n{}'.format(e))
+    return upload_storage.url(name), 0
+
+
+def saved_bytes():
+    """
+    :return: 去重累计节省的字节数
+    """
+    return int(get_con().get(SAVED_BYTES_KEY) or 0)
@@ -0,0 +1,125 @@
+"""
+上传文件的存储后端，上传视图统一通过upload_storage保存文件
+UPLOAD_STORAGE指定使用的类:
+    utils.fastdfs.storage.FastDFSStorage        上传到FastDFS
+    utils.fastdfs.storage.LocalStandInStorage   没有FastDFS的环境，保存到本机MEDIA_ROOT/uploads
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage, get_storage_class
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject
+from fdfs_client.client import Fdfs_client
+from fdfs_client.exceptions import ConnectionError, ResponseError
+
+logger = logging.getLogger('django')
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(conf_path):
+    """
+    每个进程第一次使用时才创建客户端，客户端内部维护到tracker的连接池
+    uwsgi在fork之后子进程按pid各自创建，不共用父进程的连接
+    """
+    key = (os.getpid(), conf_path)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = Fdfs_client(conf_path)
+        return _clients[key]
+
+
+class UploadError(Exception):
+    pass
+
+
+@deconstructible
+class FastDFSStorage(Storage):
+    """
+    文件名由FastDFS生成，_save返回的是file_id，传入的name只用来取扩展名
+    连接异常和tracker/storage返回错误时按FDFS_RETRIES重试，间隔逐次加倍
+    上传不是幂等的，storage可能已经保存成功只是响应出错，重试会留下无人引用的文件，所以上传只在连接异常时重试
+    """
+
+    def __init__(self, conf_path=None, base_url=None, retries=None, retry_interval=None):
+        self.conf_path = conf_path or settings.FDFS_CLIENT_CONF
+        self.base_url = base_url or settings.FASTDFS_SERVER_DOMAIN
+        self.retries = retries if retries is not None else getattr(settings, 'FDFS_RETRIES', 2)
+        self.retry_interval = retry_interval if retry_interval is not None else getattr(
+            settings, 'FDFS_RETRY_INTERVAL', 0.2)
+
+    def _call(self, method, *args, retry_on=(ConnectionError, ResponseError)):
+        for attempt in range(self.retries + 1):
+            try:
+                return getattr(get_client(self.conf_path), method)(*args)
+            except retry_on as e:
+                if attempt == self.retries:
+                    raise
+                logger.error('FastDFS调用{}异常，第{}次重试:\n{}'.format(method, attempt + 1, e))
+                time.sleep(self.retry_interval * 2 ** attempt)
+
+    def _save(self, name, content):
+        """
+        1.超过FILE_UPLOAD_MAX_MEMORY_SIZE的文件django已经按块写入临时文件，扩展名一致时直接上传
+        2.否则用chunks()写入带扩展名的临时文件后上传，FastDFS按文件名取扩展名
+        FastDFS客户端按块读取文件发送，不把整个文件读入内存
+        """
+        suffix = os.path.splitext(name)[1]
+        if hasattr(content, 'temporary_file_path') and content.temporary_file_path().endswith(suffix):
+            upload_res = self._call('upload_by_filename', content.temporary_file_path(), retry_on=ConnectionError)
+        else:
+            fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+            try:
+                with os.fdopen(fd, 'wb') as tmp:
+                    for chunk in content.chunks():
+                        tmp.write(chunk)
+                upload_res = self._call('upload_by_filename', tmp_path, retry_on=ConnectionError)
+            finally:
+                os.unlink(tmp_path)
+        if upload_res.get('Status') != 'Upload successed.':
+            raise UploadError('上传到FastDFS服务器失败:{}'.format(upload_res))
+        return upload_res.get('Remote file_id')
+
+    def exists(self, name):
+        # file_id由FastDFS生成，不会重名
+        return False
+
+    def delete(self, name):
+        self._call('delete_file', name)
+
+    def url(self, name):
+        return self.base_url + name
+
+
+@deconstructible
+class LocalStandInStorage(FileSystemStorage):
+    """
+    代替FastDFS在本机保存上传文件，按随机文件名分目录存放
+    url为完整地址，与FastDFS一样可以通过URLField校验
+    """
+
+    def __init__(self, location=None, base_url=None):
+        super(LocalStandInStorage, self).__init__(
+            location=location or os.path.join(settings.MEDIA_ROOT, 'uploads'),
+            base_url=base_url or urljoin(settings.SITE_DOMAIN_PORT, settings.MEDIA_URL + 'uploads/'))
+
+    def get_available_name(self, name, max_length=None):
+        file_name = uuid.uuid4().hex + os.path.splitext(name)[1]
+        return super(LocalStandInStorage, self).get_available_name(
+            os.path.join(file_name[:2], file_name), max_length=max_length)
+
+
+class UploadStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = get_storage_class(settings.UPLOAD_STORAGE)()
+
+
+upload_storage = UploadStorage()
@@ -0,0 +1,36 @@
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingMixin(object):
+    """
+    在接收上传数据的同时计算sha256，结果保存在文件对象的sha256属性上，上传时不必再读一遍文件
+    内存和临时文件两个handler中只有接收了数据的一个会计算
+    """
+
+    def new_file(self, *args, **kwargs):
+        # MemoryFileUploadHandler激活时会抛出StopFutureHandlers，需要先初始化
+        self.sha256 = hashlib.sha256()
+        super(HashingMixin, self).new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super(HashingMixin, self).receive_data_chunk(raw_data, start)
+        # 返回None说明数据由当前handler保存
+        if data is None:
+            self.sha256.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super(HashingMixin, self).file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    pass
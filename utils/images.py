@@ -0,0 +1,80 @@
+"""
+用Pillow生成图片的缩略版本
+每个宽度输出渐进式JPEG和WebP两种格式,保存时不带EXIF(只保留颜色配置),方向按EXIF旋转后再去掉
+"""
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _flatten(image):
+    """
+    JPEG不支持透明,透明部分填充为白色
+    """
+    if _has_alpha(image):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def make_variants(fp, widths, jpeg_quality=82, webp_quality=80):
+    """
+    1.不放大图片,比原图宽的尺寸用原图宽度代替,原图比所有尺寸都小时也会生成一份去掉EXIF的版本
+    2.动图只生成第一帧会丢失动画,直接跳过
+    :param fp: 文件路径或二进制文件对象
+    :return: (原图宽度, [(宽度, 'jpeg'或'webp', 图片数据)])
+    """
+    with Image.open(fp) as source:
+        if getattr(source, 'is_animated', False):
+            return source.width, []
+        # 只保留颜色配置,不传exif即去掉EXIF
+        extra = {'icc_profile': source.info['icc_profile']} if source.info.get('icc_profile') else {}
+        image = ImageOps.exif_transpose(source)
+        original_width, original_height = image.size
+        rgb = _flatten(image)
+        webp_source = image.convert('RGBA') if _has_alpha(image) else rgb
+
+        variants = []
+        for width in sorted({min(width, original_width) for width in widths}):
+            size = (width, max(1, round(original_height * width / original_width)))
+            jpeg = BytesIO()
+            resized = rgb if size == rgb.size else rgb.resize(size, Image.LANCZOS)
+            resized.save(jpeg, 'JPEG', quality=jpeg_quality, optimize=True, progressive=True, **extra)
+            variants.append((width, 'jpeg', jpeg.getvalue()))
+
+            webp = BytesIO()
+            resized = webp_source if size == webp_source.size else webp_source.resize(size, Image.LANCZOS)
+            resized.save(webp, 'WEBP', quality=webp_quality, method=4, **extra)
+            variants.append((width, 'webp', webp.getvalue()))
+        return original_width, variants
+
+
+def make_thumbnail(fp, size, fmt, quality=82):
+    """
+    按目标宽高比居中裁剪后缩放,用于固定尺寸的缩略图位置
+    1.原图小于目标尺寸时不放大,输出同样宽高比的较小图片
+    2.动图只取第一帧
+    :param size: (宽度, 高度)
+    :param fmt: 'jpeg'或'webp'
+    :return: 图片数据
+    """
+    with Image.open(fp) as source:
+        extra = {'icc_profile': source.info['icc_profile']} if source.info.get('icc_profile') else {}
+        image = ImageOps.exif_transpose(source)
+        width, height = size
+        factor = min(1, image.width / width, image.height / height)
+        size = (max(1, round(width * factor)), max(1, round(height * factor)))
+        output = BytesIO()
+        if fmt == 'webp':
+            image = image.convert('RGBA') if _has_alpha(image) else image.convert('RGB')
+            ImageOps.fit(image, size, Image.LANCZOS).save(output, 'WEBP', quality=quality, method=4, **extra)
+        else:
+            ImageOps.fit(_flatten(image), size, Image.LANCZOS).save(
+                output, 'JPEG', quality=quality, optimize=True, progressive=True, **extra)
+        return output.getvalue()
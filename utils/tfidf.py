@@ -0,0 +1,201 @@
+"""
+TF-IDF向量与近邻计算,供离线任务使用
+向量按行L2归一化,两行的点积即余弦相似度;近邻按批做稀疏矩阵乘法,每批只展开batch_size行
+"""
+import json
+import os
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from utils.embedded_search.tokenizer import tokenize
+
+
+class RelatedIndex(object):
+    """
+    :ivar ids: 每行对应的文档id
+    :ivar matrix: 文档向量,csr稀疏矩阵,行与ids对应
+    :ivar neighbors: 每行的前k个近邻文档id,不足k个用-1补齐
+    :ivar scores: 与neighbors对应的相似度
+    """
+    def __init__(self, k=10):
+        self.k = k
+        self.vocabulary = {}
+        self.df = np.zeros(0, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.neighbors = np.full((0, k), -1, dtype=np.int64)
+        self.scores = np.zeros((0, k), dtype=np.float32)
+
+    # ---------- 持久化 ----------
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'vocabulary.json'), 'r', encoding='utf8') as f:
+            vocabulary = json.load(f)
+        arrays = np.load(os.path.join(path, 'arrays.npz'))
+        index = cls(k=arrays['neighbors'].shape[1])
+        index.vocabulary = vocabulary
+        index.df = arrays['df']
+        index.ids = arrays['ids']
+        index.neighbors = arrays['neighbors']
+        index.scores = arrays['scores']
+        index.matrix = sparse.load_npz(os.path.join(path, 'matrix.npz')).tocsr()
+        return index
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'vocabulary.json'), 'w', encoding='utf8') as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+        np.savez(os.path.join(path, 'arrays.npz'), df=self.df, ids=self.ids,
+                 neighbors=self.neighbors, scores=self.scores)
+        sparse.save_npz(os.path.join(path, 'matrix.npz'), self.matrix)
+
+    # ---------- 向量 ----------
+
+    def _columns(self, terms):
+        """
+        新词追加到词表末尾,文档频率数组在update中统一扩容
+        """
+        vocabulary = self.vocabulary
+        for term in terms:
+            if term not in vocabulary:
+                vocabulary[term] = len(vocabulary)
+        return np.fromiter((vocabulary[term] for term in terms), dtype=np.int64, count=len(terms))
+
+    def _vectorize(self, columns, counters, n_docs):
+        """
+        tf取1+log(tf),idf取log((1+N)/(1+df))+1,与sklearn的smooth_idf/sublinear_tf一致
+        增量更新时旧行的idf不随之重算,语料变化较大后应全量重建
+        """
+        indptr = [0]
+        indices = []
+        data = []
+        for cols, counts in zip(columns, counters):
+            tf = 1 + np.log(np.array(list(counts.values()), dtype=np.float32))
+            idf = np.log((1 + n_docs) / (1 + self.df[cols])) + 1
+            values = tf * idf
+            norm = np.linalg.norm(values)
+            indices.append(cols)
+            data.append(values / norm if norm else values)
+            indptr.append(indptr[-1] + len(cols))
+        shape = (len(counters), len(self.vocabulary))
+        if not counters:
+            return sparse.csr_matrix(shape, dtype=np.float32)
+        return sparse.csr_matrix((np.concatenate(data).astype(np.float32), np.concatenate(indices), indptr),
+                                 shape=shape)
+
+    def _resize_columns(self):
+        if self.matrix.shape[1] < len(self.vocabulary):
+            self.matrix = sparse.csr_matrix((self.matrix.data, self.matrix.indices, self.matrix.indptr),
+                                            shape=(self.matrix.shape[0], len(self.vocabulary)))
+
+    # ---------- 增量更新 ----------
+
+    def _drop_rows(self, doc_ids):
+        """
+        删除文档对应的行,并从文档频率中减去这些行出现过的词
+        """
+        drop = np.isin(self.ids, list(doc_ids))
+        if not drop.any():
+            return
+        np.subtract.at(self.df, self.matrix[drop].indices, 1)
+        keep = ~drop
+        self.ids = self.ids[keep]
+        self.matrix = self.matrix[keep]
+        self.neighbors = self.neighbors[keep]
+        self.scores = self.scores[keep]
+
+    def update(self, documents, removed_ids=(), batch_size=256):
+        """
+        新增或修改documents,删除removed_ids,然后只重算受影响的近邻
+        1.修改和删除的文档先去掉旧行;新文本分词后更新文档频率,追加新行
+        2.近邻中含有被修改/删除文档的行需要重算
+        3.新行与全部文档做矩阵乘法得到自己的近邻;相似度是对称的,同一批结果也用来把新文档插入其他行的近邻
+        :param documents: [(文档id, 文本)]
+        :return: 近邻列表发生变化的文档id集合
+        """
+        changed_ids = {doc_id for doc_id, _ in documents}
+        stale_ids = changed_ids | set(removed_ids)
+        self._drop_rows(stale_ids)
+
+        counters = [Counter(tokenize(text)) for _, text in documents]
+        columns = [self._columns(list(counts)) for counts in counters]
+        self.df = np.concatenate([self.df, np.zeros(len(self.vocabulary) - len(self.df), dtype=np.int64)])
+        if columns:
+            np.add.at(self.df, np.concatenate(columns), 1)
+        self._resize_columns()
+        new_rows = self._vectorize(columns, counters, len(self.ids) + len(documents))
+        self.ids = np.concatenate([self.ids, np.array([doc_id for doc_id, _ in documents], dtype=np.int64)])
+        self.matrix = sparse.vstack([self.matrix, new_rows], format='csr')
+        self.neighbors = np.concatenate([self.neighbors, np.full((len(documents), self.k), -1, dtype=np.int64)])
+        self.scores = np.concatenate([self.scores, np.zeros((len(documents), self.k), dtype=np.float32)])
+
+        dirty = np.isin(self.neighbors, list(stale_ids)).any(axis=1)
+        dirty[len(self.ids) - len(documents):] = True
+        rows = np.nonzero(dirty)[0]
+        affected = set(self.ids[rows].tolist())
+        affected |= self._compute(rows, batch_size, insert_from=len(self.ids) - len(documents))
+        return affected
+
+    def rebuild(self, documents, batch_size=256):
+        self.__init__(k=self.k)
+        return self.update(documents, batch_size=batch_size)
+
+    # ---------- 近邻 ----------
+
+    def _compute(self, rows, batch_size, insert_from):
+        """
+        :param rows: 需要重算近邻的行号
+        :param insert_from: 行号不小于它的是新行,其相似度也用于更新其他行的近邻
+        :return: 因插入新文档而变化的其他文档id
+        """
+        recomputed = np.zeros(len(self.ids), dtype=bool)
+        recomputed[rows] = True
+        transposed = self.matrix.T.tocsr()
+        inserted = set()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            similarity = (self.matrix[batch] @ transposed).toarray()
+            similarity[np.arange(len(batch)), batch] = 0
+            self._set_top(batch, similarity)
+            for row, values in zip(batch, similarity):
+                if row < insert_from:
+                    continue
+                # 未重算的旧行,新文档相似度超过其第k名时插入
+                better = np.nonzero((values > self.scores[:, -1]) & ~recomputed)[0]
+                for other in better:
+                    self._insert(other, self.ids[row], values[other])
+                    inserted.add(int(self.ids[other]))
+        return inserted
+
+    def _set_top(self, batch, similarity):
+        k = min(self.k, similarity.shape[1])
+        if not k:
+            return
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        neighbors = np.where(top_scores > 0, self.ids[top], -1)
+        self.neighbors[batch] = -1
+        self.scores[batch] = 0
+        self.neighbors[batch, :k] = neighbors
+        self.scores[batch, :k] = np.where(top_scores > 0, top_scores, 0)
+
+    def _insert(self, row, doc_id, score):
+        position = np.searchsorted(-self.scores[row], -score)
+        self.neighbors[row] = np.insert(self.neighbors[row], position, doc_id)[:self.k]
+        self.scores[row] = np.insert(self.scores[row], position, score)[:self.k]
+
+    def get_neighbors(self, doc_id):
+        """
+        :return: [(近邻文档id, 相似度)]
+        """
+        rows = np.nonzero(self.ids == doc_id)[0]
+        if not len(rows):
+            return []
+        row = rows[0]
+        return [(int(n), float(s)) for n, s in zip(self.neighbors[row], self.scores[row]) if n >= 0]